@@ -0,0 +1,212 @@
+"""Buffered activity logging.
+
+``log_activity()`` used to write every login, like, view, comment and
+download to the activity log with its own ``put_item``, adding a DynamoDB
+round trip to almost every request. ``ActivityLogger`` instead appends the
+event to a bounded in-memory buffer and returns; a background thread
+flushes the buffer when it reaches ``batch_size`` events or every
+``flush_interval`` seconds, whichever comes first, and ``close()`` drains
+whatever is left when the worker shuts down.
+
+Sinks take a list of items: ``DynamoActivitySink`` writes them with
+``batch_writer`` (25 puts per BatchWriteItem, unprocessed items retried by
+boto3), ``SQLiteActivitySink`` inserts them in one transaction and
+``FileActivitySink`` appends JSON lines for the memory backend.
+
+When the buffer is full the ``overflow`` policy decides what happens:
+``drop_oldest`` (default) evicts the oldest buffered event, ``drop_newest``
+discards the incoming one, and ``block`` waits up to ``block_timeout``
+seconds for the flusher to make room before dropping it. Events lost this
+way, or in a failed write, are counted in ``dropped`` / ``failed``.
+"""
+import json
+import os
+import threading
+from collections import deque
+
+DYNAMO_BATCH_SIZE = 25
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+ACTIVITY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS activity_log (
+    id TEXT PRIMARY KEY,
+    ts TEXT NOT NULL,
+    action TEXT NOT NULL,
+    user TEXT,
+    meta TEXT
+);
+"""
+
+
+class DynamoActivitySink:
+    """Writes activity items to a DynamoDB table with ``batch_writer``."""
+
+    def __init__(self, table):
+        self.table = table
+
+    def write(self, items: list):
+        with self.table.batch_writer() as batch:
+            for item in items:
+                batch.put_item(Item=item)
+
+
+class SQLiteActivitySink:
+    """Inserts activity items into the ``activity_log`` table."""
+
+    def __init__(self, db):
+        self.db = db
+        db.ensure_schema(ACTIVITY_SCHEMA)
+
+    def write(self, items: list):
+        with self.db.transaction() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO activity_log (id, ts, action, user, meta) VALUES (?, ?, ?, ?, ?)",
+                [(item["id"], item["ts"], item["action"], item.get("user"), item.get("meta")) for item in items]
+            )
+
+
+class FileActivitySink:
+    """Appends activity items to a JSON-lines file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, items: list):
+        lines = "".join(json.dumps(item, separators=(",", ":")) + "\n" for item in items)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+
+class ActivityLogger:
+    """Bounded buffer of activity items flushed to ``sink`` in batches.
+
+    The flusher thread is started lazily and restarted after a fork, like
+    ``jobs.JobWorkerPool``.
+    """
+
+    def __init__(self, sink, max_buffer: int = 10000, batch_size: int = DYNAMO_BATCH_SIZE,
+                 flush_interval: float = 2.0, overflow: str = "drop_oldest", block_timeout: float = 0.05):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {', '.join(OVERFLOW_POLICIES)}")
+        self.sink = sink
+        self.max_buffer = max(1, int(max_buffer))
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self._buffer = deque()
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self.logged = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    def _ensure_started(self):
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._cond:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            if self._pid is not None:
+                # Forked: the buffer belongs to the parent, which flushes it
+                self._buffer.clear()
+            self._thread = threading.Thread(target=self._run, name="activity-log-flusher", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def log(self, item: dict) -> bool:
+        """Buffer one item. Returns False if it was dropped."""
+        if self._closed:
+            self._write([item])
+            return True
+        self._ensure_started()
+        with self._cond:
+            if len(self._buffer) >= self.max_buffer:
+                if self.overflow == "drop_newest":
+                    self.dropped += 1
+                    return False
+                if self.overflow == "block":
+                    self._cond.notify_all()
+                    self._cond.wait_for(lambda: len(self._buffer) < self.max_buffer, timeout=self.block_timeout)
+                    if len(self._buffer) >= self.max_buffer:
+                        self.dropped += 1
+                        return False
+                else:
+                    self._buffer.popleft()
+                    self.dropped += 1
+            self._buffer.append(item)
+            self.logged += 1
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify_all()
+        return True
+
+    def _take(self) -> list:
+        """Pop up to one batch from the buffer (caller holds the condition)."""
+        count = min(len(self._buffer), self.batch_size)
+        items = [self._buffer.popleft() for _ in range(count)]
+        if items:
+            self._cond.notify_all()  # wake writers blocked on a full buffer
+        return items
+
+    def _write(self, items: list):
+        with self._write_lock:
+            try:
+                self.sink.write(items)
+            except Exception as e:
+                self.failed += len(items)
+                print(f"Error logging activity ({len(items)} events): {e}")
+                return
+            self.flushed += len(items)
+            self.batches += 1
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: len(self._buffer) >= self.batch_size or self._closed,
+                    timeout=self.flush_interval
+                )
+                if self._closed:
+                    return
+                items = self._take()
+            while items:
+                self._write(items)
+                with self._cond:
+                    items = self._take() if len(self._buffer) >= self.batch_size else []
+
+    def flush(self):
+        """Write everything currently buffered from the calling thread."""
+        while True:
+            with self._cond:
+                items = self._take()
+            if not items:
+                return
+            self._write(items)
+
+    def close(self, timeout: float = 5.0):
+        """Stop the flusher and drain the buffer. Later ``log()`` calls write directly."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        thread = self._thread
+        if thread is not None and self._pid == os.getpid():
+            thread.join(timeout=timeout)
+        self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self._buffer),
+            "logged": self.logged,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+        }
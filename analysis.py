@@ -0,0 +1,129 @@
+"""Concurrent image analysis.
+
+Moderation, label detection and text detection are independent Rekognition
+calls, so ``AnalysisExecutor`` fans them out on a bounded, reusable thread
+pool and waits for all of them with a shared deadline. Upload latency is
+then the slowest call rather than the sum of the three.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+# Moderation labels that cause a meme to be rejected
+BLOCKED_MODERATION_LABELS = ["explicit nudity", "violence", "hate symbols", "sexual content"]
+
+
+class AnalysisTimeout(Exception):
+    """Raised in place of a result when a call misses the deadline."""
+
+
+class AnalysisExecutor:
+    """Bounded thread pool for running independent analysis calls in parallel.
+
+    The pool is created on first use and recreated after a fork, so the
+    executor can be built at import time in a gunicorn app.
+    """
+
+    def __init__(self, max_workers: int = 6, timeout: float = 10.0):
+        self.max_workers = max(1, int(max_workers))
+        self.timeout = timeout
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pid != os.getpid():
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="analysis")
+                    self._pid = os.getpid()
+        return self._pool
+
+    def run(self, calls: dict, timeout: float = None) -> dict:
+        """
+        Run ``{name: callable}`` concurrently and return ``{name: result}``.
+        A call that raises or misses the deadline maps to the exception
+        instance instead of a result; one failure never cancels the others.
+
+        A call that misses the deadline keeps its pool thread until it
+        returns, since ``future.cancel()`` only stops calls that have not
+        started; the client's own read timeout (AWS_REKOGNITION_READ_TIMEOUT
+        in aws_clients.py) is what bounds a hung Rekognition call.
+        """
+        pool = self._get_pool()
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        futures = {name: pool.submit(fn) for name, fn in calls.items()}
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeout:
+                future.cancel()
+                results[name] = AnalysisTimeout(f"{name} timed out")
+            except Exception as e:
+                results[name] = e
+        return results
+
+    def shutdown(self, wait: bool = True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+        self._pool = None
+        self._pid = None
+
+
+def parse_moderation(resp: dict, min_confidence: float = 60.0):
+    """Turn a DetectModerationLabels response into (approved, reasons)."""
+    reasons = []
+    for label in resp.get("ModerationLabels", []):
+        name = label.get("Name", "")
+        confidence = label.get("Confidence", 0)
+        if name.lower() in BLOCKED_MODERATION_LABELS and confidence >= min_confidence:
+            reasons.append({
+                "label": name,
+                "confidence": float(confidence)
+            })
+    return len(reasons) == 0, reasons
+
+
+def parse_labels(resp: dict) -> list:
+    return [label["Name"] for label in resp.get("Labels", [])]
+
+
+def parse_text(resp: dict) -> str:
+    return " ".join([
+        detection["DetectedText"]
+        for detection in resp.get("TextDetections", [])
+        if detection.get("Type") == "LINE"
+    ])
+
+
+def analyze_with_rekognition(client, image: dict, executor: AnalysisExecutor,
+                             min_confidence: float = 60.0, timeout: float = None):
+    """
+    Run detect_moderation_labels, detect_labels and detect_text in parallel.
+    ``image`` is a Rekognition Image argument ({"Bytes": ...} or {"S3Object": ...}).
+    Returns (approved, reasons, labels, detected_text). A failed or timed-out
+    label or text call falls back to no labels / no text; a failed moderation
+    call is raised, so the image is never approved without being moderated.
+    """
+    results = executor.run({
+        "moderation": lambda: client.detect_moderation_labels(Image=image, MinConfidence=min_confidence),
+        "labels": lambda: client.detect_labels(Image=image, MaxLabels=20, MinConfidence=50),
+        "text": lambda: client.detect_text(Image=image),
+    }, timeout=timeout)
+
+    labels, detected_text = [], ""
+    if isinstance(results["moderation"], Exception):
+        print(f"Rekognition moderation error: {results['moderation']}")
+        raise results["moderation"]
+    approved, reasons = parse_moderation(results["moderation"], min_confidence)
+    if isinstance(results["labels"], Exception):
+        print(f"Rekognition labels error: {results['labels']}")
+    else:
+        labels = parse_labels(results["labels"])
+    if isinstance(results["text"], Exception):
+        print(f"Rekognition text error: {results['text']}")
+    else:
+        detected_text = parse_text(results["text"])
+    return approved, reasons, labels, detected_text
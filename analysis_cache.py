@@ -0,0 +1,174 @@
+"""Content-hash cache for image analysis results.
+
+Reposted memes are byte-identical, so the SHA-256 of the upload is a safe
+key for the ``(approved, reasons, labels, detected_text)`` analysis result.
+Lookups go through a per-process LRU first and then an optional persistent
+store (DynamoDB in production, a dict or SQLite file locally). Each entry
+also records the storage key of the first copy of the image so duplicate
+uploads can share the stored bytes, plus its perceptual hash and resized
+variants so duplicates reuse those without decoding the image again.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from decimal import Decimal
+
+
+def content_hash(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def _json_default(value):
+    # Entries built from DynamoDB items (e.g. variant sizes) carry Decimal numbers
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class LRUCache:
+    """Small thread-safe LRU mapping."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DictAnalysisStore:
+    """Persistent-tier stand-in that lives for the process lifetime."""
+
+    def __init__(self):
+        self._data = {}
+
+    def get(self, key: str):
+        return self._data.get(key)
+
+    def put(self, key: str, entry: dict):
+        self._data[key] = entry
+
+
+class SQLiteAnalysisStore:
+    """Persistent tier backed by a local SQLite file."""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS analysis_cache (content_hash TEXT PRIMARY KEY, entry TEXT NOT NULL)"
+            )
+            self._conn.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT entry FROM analysis_cache WHERE content_hash = ?", (key,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, entry: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analysis_cache (content_hash, entry) VALUES (?, ?)",
+                (key, json.dumps(entry, default=_json_default))
+            )
+            self._conn.commit()
+
+
+class DynamoAnalysisStore:
+    """Persistent tier backed by a DynamoDB table keyed on ``content_hash``.
+
+    The entry is stored as a JSON string so float confidences do not need
+    converting to Decimal.
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    def get(self, key: str):
+        resp = self.table.get_item(Key={"content_hash": key})
+        item = resp.get("Item")
+        return json.loads(item["entry"]) if item else None
+
+    def put(self, key: str, entry: dict):
+        self.table.put_item(Item={"content_hash": key, "entry": json.dumps(entry, default=_json_default)})
+
+
+class AnalysisCache:
+    """Two-tier (LRU + persistent) cache of analysis results by content hash."""
+
+    def __init__(self, store=None, maxsize: int = 1024):
+        self.store = store
+        self.lru = LRUCache(maxsize)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        """Return the cached entry dict for ``key`` or None."""
+        entry = self.lru.get(key)
+        if entry is None and self.store is not None:
+            try:
+                entry = self.store.get(key)
+            except Exception as e:
+                print(f"Analysis cache read error: {e}")
+                entry = None
+            if entry is not None:
+                self.lru.put(key, entry)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(self, key: str, approved: bool, reasons: list, labels: list, detected_text: str,
+            image_key: str = None, phash: str = None, variants: list = None):
+        entry = {
+            "approved": approved,
+            "reasons": reasons,
+            "labels": labels,
+            "detected_text": detected_text,
+            "image_key": image_key,
+            "phash": phash,
+            "variants": variants or [],
+        }
+        self.lru.put(key, entry)
+        if self.store is not None:
+            try:
+                self.store.put(key, entry)
+            except Exception as e:
+                print(f"Analysis cache write error: {e}")
+        return entry
+
+
+def entry_result(entry: dict):
+    """Unpack a cache entry into (approved, reasons, labels, detected_text)."""
+    return entry["approved"], entry["reasons"], entry["labels"], entry["detected_text"]
@@ -1,40 +1,397 @@
-﻿import os
+import os
 import re
 import uuid
 import json
-from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
-from passlib.hash import pbkdf2_sha256
+import atexit
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file, abort, g
 from dotenv import load_dotenv
 
-# Load .env for local/dev
+from activity_log import ActivityLogger
+from aws_clients import ClientFactory, service_overrides
+from analysis import AnalysisExecutor, analyze_with_rekognition
+from analysis_cache import AnalysisCache, DictAnalysisStore, DynamoAnalysisStore, SQLiteAnalysisStore, entry_result
+from counters import CounterBuffer
+from image_store import LocalImageStore, PresignedUrlCache, S3ImageStore, UploadTooLarge, image_key_for
+from jobs import HostLock, JobWorkerPool
+from likes import LikedCache
+from meme_cache import DictMemeTier, MemeCache, RedisMemeTier
+from notifications import LocalSNS, NotificationDispatcher
+from pagination import decode_cursor, page_size
+from passwords import DEFAULT_ROUNDS, DEFAULT_SCHEME, PasswordHasher
+from perceptual_hash import HammingIndex, dhash, hash_to_hex, hex_to_hash
+import serving
+from repository import BACKENDS, STORAGE_ERRORS, dynamo_repository, memory_repository, sqlite_repository
+from search import SearchIndex
+from sessions import DynamoSessionStore, MemorySessionStore, SQLiteSessionStore, ServerSessionInterface
+from sqlite_db import SQLiteDatabase
+from thumbnails import VARIANT_WIDTHS, VariantGenerator, build_srcset
+from trending import TrendingTracker
+
 load_dotenv()
 
-# Local development - uses Python dictionaries for data storage
+# ==========================================
+# CONFIGURATION
+# ==========================================
+# Where users, memes, likes, comments and activity live: memory (this
+# process only, for development), sqlite (one file) or dynamodb (AWS)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "memory").lower()
+SQLITE_PATH = os.environ.get("SQLITE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "meme_museum.sqlite3"))
+# Connections kept open per worker (one per concurrent request thread is
+# plenty), and how long a write waits for another worker's to finish
+SQLITE_POOL_SIZE = int(os.environ.get("SQLITE_POOL_SIZE", "8"))
+SQLITE_BUSY_TIMEOUT = float(os.environ.get("SQLITE_BUSY_TIMEOUT", "5"))
+AWS_REGION = os.environ.get("AWS_DEFAULT_REGION", "us-east-1")
+USERS_TABLE = os.environ.get("USERS_TABLE", "UsersTable")
+MEMES_TABLE = os.environ.get("MEMES_TABLE", "MemeTable")
+# GSIs on the memes table: full items by user, and card-only items for feeds
+MEMES_USER_INDEX = os.environ.get("MEMES_USER_INDEX", "by_user")
+MEMES_FEED_INDEX = os.environ.get("MEMES_FEED_INDEX", "feed_by_user")
+# Sparse GSI of approved memes by category, and the table holding tag
+# adjacency items and category/tag counts
+MEMES_CATEGORY_INDEX = os.environ.get("MEMES_CATEGORY_INDEX", "by_category")
+# Sparse GSI of memes awaiting analysis, for re-queueing lost jobs
+MEMES_PENDING_INDEX = os.environ.get("MEMES_PENDING_INDEX", "pending_analysis")
+# GSI of memes by image_key, for checking who may see a shared image and
+# deleting it (and its variants) with the last meme using it
+MEMES_IMAGE_INDEX = os.environ.get("MEMES_IMAGE_INDEX", "by_image")
+# GSI of memes by status and created_at: search catch-ups read the approved
+# memes since their last look from it instead of scanning the table
+MEMES_STATUS_INDEX = os.environ.get("MEMES_STATUS_INDEX", "by_status")
+BROWSE_TABLE = os.environ.get("BROWSE_TABLE", "MemeBrowse")
+ACTIVITY_LOG_TABLE = os.environ.get("ACTIVITY_LOG_TABLE", "ActivityLogTable")
+# Key attribute of ACTIVITY_LOG_TABLE (the CloudFormation stack's MemeLogs uses "id")
+ACTIVITY_LOG_KEY = os.environ.get("ACTIVITY_LOG_KEY", "log_id") if STORAGE_BACKEND == "dynamodb" else "id"
+LIKES_TABLE = os.environ.get("LIKES_TABLE", "MemeLikes")
+COMMENTS_TABLE = os.environ.get("COMMENTS_TABLE", "MemeComments")
+# Threads per worker sending the 100-key BatchGetItem chunks of one page in parallel
+BATCH_GET_WORKERS = int(os.environ.get("BATCH_GET_WORKERS", "4"))
+# HTTP connections each boto3 client keeps per worker; by default one per
+# request the worker class can have in flight (serving.py) plus the
+# BatchGetItem threads
+AWS_MAX_POOL_CONNECTIONS = int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", str(serving.aws_pool_size(BATCH_GET_WORKERS))))
+# Retry mode (adaptive also slows a client down while AWS throttles it) and
+# TCP keepalive for every boto3 client. Timeouts, attempts and pool size are
+# per service (aws_clients.SERVICE_DEFAULTS), each settable as
+# AWS_<SERVICE>_<SETTING>, e.g. AWS_REKOGNITION_READ_TIMEOUT=15
+AWS_RETRY_MODE = os.environ.get("AWS_RETRY_MODE", "adaptive")
+AWS_TCP_KEEPALIVE = os.environ.get("AWS_TCP_KEEPALIVE", "true").lower() in ("1", "true", "yes")
+PRESIGNED_EXPIRATION = int(os.environ.get("PRESIGNED_EXPIRATION", "3600"))
+# Uploaded images go to S3; without a bucket they are written to local disk
+# and served from /media/<key> (partial uploads go to a hidden sibling
+# directory, .<name>-incoming, outside what /media serves)
+S3_BUCKET = os.environ.get("S3_BUCKET")
+LOCAL_IMAGE_DIR = os.environ.get("LOCAL_IMAGE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads"))
+# Largest accepted image (15 MB is also Rekognition's limit for S3 objects);
+# bigger requests are refused before the body is read
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(15 * 1024 * 1024)))
+# Responsive variants rendered for approved memes (widths in px)
+VARIANT_WIDTHS_CONFIG = [int(w) for w in os.environ.get("VARIANT_WIDTHS", ",".join(map(str, VARIANT_WIDTHS))).split(",") if w.strip()]
+VARIANT_PROCESSES = int(os.environ.get("VARIANT_PROCESSES", "0")) or None
+# Dashboard page size (?limit= is clamped to DASHBOARD_MAX_PAGE_SIZE)
+DASHBOARD_PAGE_SIZE = int(os.environ.get("DASHBOARD_PAGE_SIZE", "12"))
+DASHBOARD_MAX_PAGE_SIZE = int(os.environ.get("DASHBOARD_MAX_PAGE_SIZE", "50"))
+COMMENTS_PAGE_SIZE = int(os.environ.get("COMMENTS_PAGE_SIZE", "20"))
+BROWSE_PAGE_SIZE = int(os.environ.get("BROWSE_PAGE_SIZE", "20"))
+# Search results per page; SEARCH_INDEX_DIR holds the on-disk index segment
+# (written by scripts/build_search_index.py, never by workers) so workers
+# start from it instead of re-indexing every meme. Every
+# SEARCH_REFRESH_INTERVAL seconds a worker adds memes other workers
+# approved since its last look (0 = never) and switches to a newer segment
+# if one was written. The catch-up reads approved memes by time (the status
+# index: MEMES_STATUS_INDEX on DynamoDB), not the whole table
+SEARCH_PAGE_SIZE = int(os.environ.get("SEARCH_PAGE_SIZE", "20"))
+SEARCH_INDEX_DIR = os.environ.get("SEARCH_INDEX_DIR")
+SEARCH_REFRESH_INTERVAL = float(os.environ.get("SEARCH_REFRESH_INTERVAL", "300"))
+# Activity events are buffered and written in batches by a background thread
+# (to ACTIVITY_LOG_FILE with the memory backend)
+ACTIVITY_LOG_FILE = os.environ.get("ACTIVITY_LOG_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "activity_log.jsonl"))
+ACTIVITY_BUFFER_SIZE = int(os.environ.get("ACTIVITY_BUFFER_SIZE", "10000"))
+ACTIVITY_FLUSH_INTERVAL = float(os.environ.get("ACTIVITY_FLUSH_INTERVAL", "2"))
+ACTIVITY_OVERFLOW = os.environ.get("ACTIVITY_OVERFLOW", "drop_oldest")
+# View/like/download counts are buffered per worker and flushed every
+# COUNTER_FLUSH_INTERVAL seconds; with COUNTERS_TABLE set (dynamodb) they
+# are spread over COUNTER_SHARDS counter items instead of the meme item
+COUNTER_FLUSH_INTERVAL = float(os.environ.get("COUNTER_FLUSH_INTERVAL", "5"))
+COUNTERS_TABLE = os.environ.get("COUNTERS_TABLE")
+COUNTER_SHARDS = int(os.environ.get("COUNTER_SHARDS", "8"))
+
+# Read-through cache of meme items: per-worker LRU entries (0 turns the
+# cache off) live MEME_CACHE_TTL seconds, which bounds how stale another
+# worker's copy can be; MEME_CACHE_REDIS_URL adds a tier shared by all
+# workers (needs the redis package), "local" an in-process stand-in
+MEME_CACHE_SIZE = int(os.environ.get("MEME_CACHE_SIZE", "2048"))
+MEME_CACHE_TTL = float(os.environ.get("MEME_CACHE_TTL", "30"))
+MEME_CACHE_REDIS_URL = os.environ.get("MEME_CACHE_REDIS_URL")
+MEME_CACHE_SHARED_TTL = float(os.environ.get("MEME_CACHE_SHARED_TTL", "300"))
+# Trending scores halve every TRENDING_HALF_LIFE_HOURS. Each worker scores
+# the events it serves, so TRENDING_THRESHOLD is per worker (roughly the
+# global threshold divided by the number of workers); the alert for a meme
+# goes out at most once per TRENDING_ALERT_COOLDOWN_HOURS across all workers.
+# Scores are not persisted: a restarted worker starts with no trending memes
+TRENDING_HALF_LIFE_HOURS = float(os.environ.get("TRENDING_HALF_LIFE_HOURS", "6"))
+TRENDING_THRESHOLD = float(os.environ.get("TRENDING_THRESHOLD", "50"))
+TRENDING_ALERT_COOLDOWN_HOURS = int(os.environ.get("TRENDING_ALERT_COOLDOWN_HOURS", "24"))
+TRENDING_PAGE_SIZE = int(os.environ.get("TRENDING_PAGE_SIZE", "20"))
+SECRET_KEY = os.environ.get("SECRET_KEY", "replace-me-in-prod")
+# Sessions live server-side (the cookie holds a random id) in SESSION_STORE:
+# memory, sqlite or dynamodb (SESSIONS_TABLE, with TTL on expires_at), by
+# default the storage backend's; "cookie" keeps Flask's signed cookies and
+# caches nothing per user. A session expires SESSION_TTL seconds after it
+# was last renewed, and is renewed at most every SESSION_RENEW_INTERVAL
+# seconds. SESSION_LIKED_LIMIT bounds the like state cached per session;
+# it and the saved ids are re-read SESSION_DERIVED_TTL seconds after they
+# were loaded, so saves and likes from the user's other devices show up
+SESSION_STORE = os.environ.get("SESSION_STORE", STORAGE_BACKEND).lower()
+SESSIONS_TABLE = os.environ.get("SESSIONS_TABLE", "MemeSessions")
+SESSION_TTL = float(os.environ.get("SESSION_TTL", str(7 * 24 * 3600)))
+SESSION_RENEW_INTERVAL = float(os.environ.get("SESSION_RENEW_INTERVAL", "3600"))
+SESSION_LIKED_LIMIT = int(os.environ.get("SESSION_LIKED_LIMIT", "500"))
+SESSION_DERIVED_TTL = float(os.environ.get("SESSION_DERIVED_TTL", "60"))
+
+# Password hashing: stored hashes made with other parameters are re-hashed
+# at the user's next login. PASSWORD_PROCESSES > 0 hashes in a process pool
+# of that size (worth it with threaded/gevent workers, and the default in a
+# gevent worker, where hashing inline stalls every greenlet). Failed attempts are
+# remembered PASSWORD_FAILURE_TTL seconds: a repeat fails without hashing,
+# as does any attempt after PASSWORD_MAX_FAILURES failures in that window
+PASSWORD_SCHEME = os.environ.get("PASSWORD_SCHEME", DEFAULT_SCHEME)
+PASSWORD_ROUNDS = int(os.environ.get("PASSWORD_ROUNDS", str(DEFAULT_ROUNDS)))
+PASSWORD_PROCESSES = int(os.environ.get("PASSWORD_PROCESSES", "1" if serving.gevent_patched() else "0"))
+PASSWORD_FAILURE_TTL = float(os.environ.get("PASSWORD_FAILURE_TTL", "60"))
+PASSWORD_MAX_FAILURES = int(os.environ.get("PASSWORD_MAX_FAILURES", "10"))
+
+# Uploads are moderated and labelled with Rekognition (on by default with
+# the dynamodb backend); without it every upload is approved unlabelled
+REKOGNITION_ENABLED = os.environ.get(
+    "REKOGNITION_ENABLED", "true" if STORAGE_BACKEND == "dynamodb" else "false"
+).lower() in ("1", "true", "yes")
+# Upload analysis runs on a background worker pool unless disabled
+ASYNC_ANALYSIS = os.environ.get("ASYNC_ANALYSIS", "true").lower() in ("1", "true", "yes")
+ANALYSIS_WORKERS = int(os.environ.get("ANALYSIS_WORKERS", "2"))
+# A failing analysis job is retried ANALYSIS_MAX_ATTEMPTS times in all, then
+# the meme is marked failed. Jobs queued in a worker that exits are lost
+# (the worker gets ANALYSIS_DRAIN_TIMEOUT seconds to finish them), so every
+# ANALYSIS_RECOVER_AFTER seconds one worker per machine (the holder of
+# ANALYSIS_RECOVERY_LOCK) re-submits memes uploaded in the last
+# ANALYSIS_RECOVER_HOURS that are still pending that long after upload (or
+# after the last re-submit). It reads them from the pending index, not a
+# scan. ANALYSIS_RECOVER_HOURS=0 turns this off
+ANALYSIS_MAX_ATTEMPTS = int(os.environ.get("ANALYSIS_MAX_ATTEMPTS", "3"))
+ANALYSIS_DRAIN_TIMEOUT = float(os.environ.get("ANALYSIS_DRAIN_TIMEOUT", "10"))
+ANALYSIS_RECOVER_AFTER = float(os.environ.get("ANALYSIS_RECOVER_AFTER", "600"))
+ANALYSIS_RECOVER_HOURS = float(os.environ.get("ANALYSIS_RECOVER_HOURS", "24"))
+ANALYSIS_RECOVERY_LOCK = os.environ.get(
+    "ANALYSIS_RECOVERY_LOCK", os.path.join(tempfile.gettempdir(), "meme-museum-analysis-recovery.lock")
+)
+# Shared pool for the parallel Rekognition calls (3 per upload)
+REKOGNITION_POOL_SIZE = int(os.environ.get("REKOGNITION_POOL_SIZE", "6"))
+REKOGNITION_TIMEOUT = float(os.environ.get("REKOGNITION_TIMEOUT", "10"))
+# Content-hash cache of analysis results: a DynamoDB table (dynamodb
+# backend) or a SQLite file can back the in-process LRU
+ANALYSIS_CACHE_TABLE = os.environ.get("ANALYSIS_CACHE_TABLE")
+ANALYSIS_CACHE_DB = os.environ.get("ANALYSIS_CACHE_DB")
+ANALYSIS_CACHE_SIZE = int(os.environ.get("ANALYSIS_CACHE_SIZE", "1024"))
+# Max Hamming distance (of 64 bits) for listing memes on /similar/<meme_id>
+SIMILAR_DISTANCE = int(os.environ.get("SIMILAR_DISTANCE", "7"))
+
+# SNS Topic ARNs for notifications
+SNS_TOPIC_NEW_UPLOAD = os.environ.get("NEW_MEME_UPLOAD_SNS_TOPIC")
+SNS_TOPIC_TRENDING = os.environ.get("TRENDING_ALERT_SNS_TOPIC")
+SNS_TOPIC_MODERATION = os.environ.get("MODERATION_ALERT_SNS_TOPIC")
+# Notifications are sent by a background thread per worker. Messages of one
+# kind (approvals, rejections, registrations, trending alerts) arriving
+# within NOTIFY_COALESCE_WINDOW seconds of the last one sent go out as one
+# digest of up to NOTIFY_MAX_DIGEST; each topic gets NOTIFY_RATE messages
+# per second (bursts of NOTIFY_BURST) and failed publishes are retried up to
+# NOTIFY_MAX_ATTEMPTS times. SNS_LOCAL_FILE sends them to a JSON-lines file
+# instead of SNS (development)
+NOTIFY_COALESCE_WINDOW = float(os.environ.get("NOTIFY_COALESCE_WINDOW", "60"))
+NOTIFY_MAX_DIGEST = int(os.environ.get("NOTIFY_MAX_DIGEST", "50"))
+NOTIFY_RATE = float(os.environ.get("NOTIFY_RATE", "1"))
+NOTIFY_BURST = int(os.environ.get("NOTIFY_BURST", "5"))
+NOTIFY_MAX_ATTEMPTS = int(os.environ.get("NOTIFY_MAX_ATTEMPTS", "5"))
+NOTIFY_MAX_QUEUE = int(os.environ.get("NOTIFY_MAX_QUEUE", "1000"))
+SNS_LOCAL_FILE = os.environ.get("SNS_LOCAL_FILE")
+
+# Validate required config
+VALIDATE_INDEXES = os.environ.get("VALIDATE_INDEXES", "true").lower() in ("1", "true", "yes")
+if STORAGE_BACKEND not in BACKENDS:
+    raise RuntimeError(f"STORAGE_BACKEND must be one of {', '.join(BACKENDS)} (got {STORAGE_BACKEND!r})")
+if SESSION_STORE not in ("cookie",) + BACKENDS:
+    raise RuntimeError(f"SESSION_STORE must be cookie or one of {', '.join(BACKENDS)} (got {SESSION_STORE!r})")
+SERVER_SESSIONS = SESSION_STORE != "cookie"
+
 app = Flask(__name__)
-app.secret_key = os.environ.get("SECRET_KEY", "local-dev-secret-key")
+app.secret_key = SECRET_KEY
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES + 64 * 1024  # room for the other form fields
 
-EMAIL_RE = re.compile(r"[^@]+@[^@]+\.[^@]+")
+# ==========================================
+# AWS CLIENTS
+# ==========================================
+# Stand-ins for each worker's own clients, built on first use in the worker
+# (after a fork, and under gevent after the stdlib is patched)
+aws_clients = ClientFactory(
+    AWS_REGION,
+    max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+    retry_mode=AWS_RETRY_MODE,
+    tcp_keepalive=AWS_TCP_KEEPALIVE,
+    overrides=service_overrides()
+)
+rekognition_client = aws_clients.client("rekognition") if REKOGNITION_ENABLED else None
+sns_client = LocalSNS(SNS_LOCAL_FILE) if SNS_LOCAL_FILE else aws_clients.client("sns")
+s3_client = aws_clients.client("s3") if S3_BUCKET else None
+dynamodb_resource = aws_clients.resource("dynamodb") if STORAGE_BACKEND == "dynamodb" else None
 
 # ==========================================
-# IN-MEMORY DATA STORAGE (Local Development)
+# STORAGE
 # ==========================================
-users_db = {}  # {email: {password, created_at, bio}}
-memes_db = {}  # {meme_id: {meme_id, user, title, description, category, tags, labels, detected_text, likes, views, downloads, status, created_at}}
-likes_db = {}  # {meme_id_user: {meme_id, user, created_at}}
-activity_log_db = []  # [{id, ts, action, user, meta}]
-meme_images = {}  # {meme_id: image_bytes}
+image_store = S3ImageStore(s3_client, S3_BUCKET) if S3_BUCKET else LocalImageStore(LOCAL_IMAGE_DIR)
+
+if STORAGE_BACKEND == "dynamodb":
+    repo = dynamo_repository(
+        dynamodb_resource,
+        image_store,
+        users_table=USERS_TABLE,
+        memes_table=MEMES_TABLE,
+        likes_table=LIKES_TABLE,
+        comments_table=COMMENTS_TABLE,
+        browse_table=BROWSE_TABLE,
+        activity_table=ACTIVITY_LOG_TABLE,
+        counters_table=COUNTERS_TABLE,
+        counter_shards=COUNTER_SHARDS,
+        user_index=MEMES_USER_INDEX,
+        feed_index=MEMES_FEED_INDEX,
+        category_index=MEMES_CATEGORY_INDEX,
+        pending_index=MEMES_PENDING_INDEX,
+        image_index=MEMES_IMAGE_INDEX,
+        status_index=MEMES_STATUS_INDEX,
+        validate_indexes=VALIDATE_INDEXES,
+        batch_get_workers=BATCH_GET_WORKERS,
+        client=aws_clients.client("dynamodb")
+    )
+elif STORAGE_BACKEND == "sqlite":
+    repo = sqlite_repository(SQLITE_PATH, image_store, pool_size=SQLITE_POOL_SIZE, busy_timeout=SQLITE_BUSY_TIMEOUT)
+else:
+    repo = memory_repository(image_store, ACTIVITY_LOG_FILE)
+atexit.register(repo.close)  # registered first so it runs after the buffers below drain
+
+# Buffered activity log; drained on worker shutdown
+activity_logger = ActivityLogger(
+    repo.activity_sink,
+    max_buffer=ACTIVITY_BUFFER_SIZE,
+    flush_interval=ACTIVITY_FLUSH_INTERVAL,
+    overflow=ACTIVITY_OVERFLOW
+)
+atexit.register(activity_logger.close)
+
+# Per-user cache of liked state for rendering feeds
+liked_cache = LikedCache(repo.likes)
+
+# Server-side sessions, which also cache the user's profile, saved ids and
+# like state (see with_liked() and saved_ids())
+if SESSION_STORE == "dynamodb":
+    session_store = DynamoSessionStore(aws_clients.resource("dynamodb").Table(SESSIONS_TABLE))
+elif SESSION_STORE == "sqlite":
+    session_store = SQLiteSessionStore(repo.db if repo.db is not None else SQLiteDatabase(
+        SQLITE_PATH, pool_size=SQLITE_POOL_SIZE, busy_timeout=SQLITE_BUSY_TIMEOUT
+    ))
+elif SESSION_STORE == "memory":
+    session_store = MemorySessionStore()
+else:
+    session_store = None  # Flask's signed cookies
+if SERVER_SESSIONS:
+    app.session_interface = ServerSessionInterface(session_store, ttl=SESSION_TTL, renew_interval=SESSION_RENEW_INTERVAL)
+
+# Meme items for /view, /download, /delete and the id-list pages
+if MEME_CACHE_REDIS_URL == "local":
+    meme_cache_tier = DictMemeTier()
+elif MEME_CACHE_REDIS_URL:
+    import redis
+    meme_cache_tier = RedisMemeTier(redis.Redis.from_url(MEME_CACHE_REDIS_URL, socket_timeout=0.25))
+else:
+    meme_cache_tier = None
+meme_cache = MemeCache(repo.memes, shared=meme_cache_tier, maxsize=MEME_CACHE_SIZE,
+                       ttl=MEME_CACHE_TTL, shared_ttl=MEME_CACHE_SHARED_TTL)
+
+# Write-behind view/download counters. Flushed deltas are merged into cached
+# memes, except with COUNTERS_TABLE, whose shards are added by live_counts()
+counter_buffer = CounterBuffer(
+    repo.counter_sink,
+    flush_interval=COUNTER_FLUSH_INTERVAL,
+    on_flush=None if COUNTERS_TABLE and STORAGE_BACKEND == "dynamodb" else meme_cache.add_counts
+)
+atexit.register(counter_buffer.close)
+
+# SNS notifications, sent (or coalesced into digests) off the request path;
+# what is still held is sent on worker shutdown
+notifier = NotificationDispatcher(
+    sns_client,
+    coalesce_window=NOTIFY_COALESCE_WINDOW,
+    max_digest=NOTIFY_MAX_DIGEST,
+    rate=NOTIFY_RATE,
+    burst=NOTIFY_BURST,
+    max_attempts=NOTIFY_MAX_ATTEMPTS,
+    max_queue=NOTIFY_MAX_QUEUE
+)
+atexit.register(notifier.close)
+
+# Cached presigned URLs and responsive variants
+image_urls = PresignedUrlCache(image_store, expiration=PRESIGNED_EXPIRATION)
+variant_generator = VariantGenerator(image_store, widths=VARIANT_WIDTHS_CONFIG, processes=VARIANT_PROCESSES)
+
+analysis_executor = AnalysisExecutor(max_workers=REKOGNITION_POOL_SIZE, timeout=REKOGNITION_TIMEOUT)
+
+if STORAGE_BACKEND == "dynamodb" and ANALYSIS_CACHE_TABLE:
+    analysis_store = DynamoAnalysisStore(dynamodb_resource.Table(ANALYSIS_CACHE_TABLE))
+elif ANALYSIS_CACHE_DB:
+    analysis_store = SQLiteAnalysisStore(ANALYSIS_CACHE_DB)
+else:
+    analysis_store = DictAnalysisStore() if STORAGE_BACKEND != "dynamodb" else None
+analysis_cache = AnalysisCache(store=analysis_store, maxsize=ANALYSIS_CACHE_SIZE)
+
+# Per-worker perceptual-hash index of approved memes, loaded from the memes
+# store on first use
+phash_index = HammingIndex()
+_phash_index_state = {"pid": None}
+
+# Full-text index of approved memes. Each worker memory-maps the segment
+# (if any) when it imports the app, so workers share its pages through the
+# page cache, and keeps its own delta on top
+search_index = SearchIndex(SEARCH_INDEX_DIR)
+_search_index_state = {"pid": None, "checked": 0.0, "since": None, "loading": False}
+
+password_hasher = PasswordHasher(
+    scheme=PASSWORD_SCHEME,
+    rounds=PASSWORD_ROUNDS,
+    processes=PASSWORD_PROCESSES,
+    failure_ttl=PASSWORD_FAILURE_TTL,
+    max_failures=PASSWORD_MAX_FAILURES
+)
+atexit.register(password_hasher.shutdown)
+
+EMAIL_RE = re.compile(r"[^@]+@[^@]+\.[^@]+")
 
 
 # ==========================================
 # HELPER FUNCTIONS
 # ==========================================
 def hash_password(password: str) -> str:
-    return pbkdf2_sha256.hash(password)
+    return password_hasher.hash(password)
 
 
-def verify_password(password: str, hashed: str) -> bool:
-    return pbkdf2_sha256.verify(password, hashed)
+def verify_password(email: str, password: str, hashed: str) -> bool:
+    """Check a login; a hash made with old parameters is replaced on success"""
+    ok, new_hash = password_hasher.verify(email, password, hashed)
+    if ok and new_hash:
+        try:
+            repo.users.set_password(email, new_hash)
+        except STORAGE_ERRORS as e:
+            print(f"Error re-hashing password for {email}: {e}")
+    return ok
 
 
 def now_iso() -> str:
@@ -45,80 +402,465 @@ def generate_meme_id() -> str:
     return str(uuid.uuid4())
 
 
+def publish_sns(topic_arn: str, subject: str, message: str, group: str = None, digest_subject: str = None):
+    """Queue a notification for the SNS topic (sent in the background; same-group bursts become one digest)"""
+    if not topic_arn:
+        return
+    notifier.notify(topic_arn, subject, message, group=group, digest_subject=digest_subject)
+
+
 def log_activity(action: str, user_email: str, meta: dict = None):
+    """Queue an activity item for the next batched write to the activity log"""
     item = {
-        "id": str(uuid.uuid4()),
+        ACTIVITY_LOG_KEY: str(uuid.uuid4()),
         "ts": now_iso(),
         "action": action,
         "user": user_email,
         "meta": json.dumps(meta or {})
     }
-    activity_log_db.append(item)
+    activity_logger.log(item)
+    if meta and meta.get("meme_id"):
+        trending_tracker.record(meta["meme_id"], action, meta.get("category"))
+
+
+def rekognition_image(image_key: str) -> dict:
+    """
+    Rekognition Image argument for a stored meme. With S3 storage Rekognition
+    reads the object itself, so the image never passes through this worker.
+    """
+    if isinstance(image_store, S3ImageStore):
+        return image_store.rekognition_image(image_key)
+    return {"Bytes": image_store.get(image_key) or b""}
 
 
-def moderate_image_bytes(image_bytes: bytes, min_confidence: float = 60.0):
+def analyze_image(image: dict, min_confidence: float = 60.0):
     """
-    Local development: Simple moderation - accept all images
-    In production (AWS), this uses Rekognition
+    Run moderation, label and text detection concurrently on a Rekognition
+    Image argument. Returns (approved, reasons, labels, detected_text).
+    Without REKOGNITION_ENABLED every image is approved with no labels.
+    A failed moderation call raises, so the job is retried rather than the
+    image approved (and cached) unmoderated.
     """
-    # For local dev, always approve
-    return True, []
+    if not REKOGNITION_ENABLED:
+        return True, [], [], ""
+    return analyze_with_rekognition(
+        rekognition_client,
+        image,
+        analysis_executor,
+        min_confidence=min_confidence,
+        timeout=REKOGNITION_TIMEOUT
+    )
+
+
+def notify_analysis_result(meme_id: str, user: str, title: str, approved: bool, reasons: list, labels: list):
+    """Log the moderation outcome and send the matching SNS notification"""
+    status = "approved" if approved else "rejected"
+    log_activity(
+        "upload",
+        user,
+        {
+            "meme_id": meme_id,
+            "status": status,
+            "reasons": reasons,
+            "labels": labels
+        }
+    )
+
+    # Send SNS notification based on status
+    if approved:
+        subject = f"[Meme Museum] Meme approved: {meme_id}"
+        message = f"Meme '{title}' by {user} was approved.\nMeme ID: {meme_id}"
+        publish_sns(SNS_TOPIC_NEW_UPLOAD, subject, message, "approved", "[Meme Museum] {count} memes approved")
+    else:
+        subject = f"[Meme Museum] Meme rejected: {meme_id}"
+        reasons_str = "; ".join([f"{r['label']} ({float(r['confidence']):.1f}%)" for r in reasons])
+        message = f"Meme '{title}' by {user} was rejected.\nReasons: {reasons_str}"
+        publish_sns(SNS_TOPIC_MODERATION, subject, message, "rejected", "[Meme Museum] {count} memes rejected")
+
 
+def visible_to_viewer(item: dict) -> bool:
+    """Approved memes are public; pending, rejected and failed ones only to their uploader"""
+    return item.get("status") == "approved" or item.get("user") == session.get("user")
 
-def detect_labels_and_text(image_bytes: bytes):
+
+def image_visible_to_viewer(item: dict) -> bool:
+    """Approved images are public; a pending one only to its uploader, and rejected ones to nobody"""
+    if item.get("status") == "approved":
+        return True
+    return item.get("status") == "pending" and item.get("user") == session.get("user")
+
+
+def with_image_urls(items: list) -> list:
     """
-    Local development: Return empty labels and text
-    In production (AWS), this uses Rekognition
+    Copies of the memes with ``url`` and ``srcset`` set for the templates
+    (URLs cached per key). Memes whose image the viewer may not see get none.
     """
-    return [], ""
+    return [
+        dict(
+            item,
+            url=image_urls.url(item.get("image_key")),
+            srcset_webp=build_srcset(item.get("variants"), image_urls.url, "webp"),
+            srcset_jpeg=build_srcset(item.get("variants"), image_urls.url, "jpeg")
+        ) if image_visible_to_viewer(item) else dict(item, url=None, srcset_webp="", srcset_jpeg="")
+        for item in items
+    ]
+
+
+@app.template_global()
+def current_profile() -> dict:
+    """The signed-in user's {email, bio, created_at}, cached in the session at login."""
+    profile = session.get("profile")
+    if profile is None and "user" in session:
+        # Sessions from before the profile was cached
+        try:
+            user = repo.users.get(session["user"]) or {}
+        except STORAGE_ERRORS as e:
+            print(f"Storage error: {e}")
+            return {"email": session["user"]}
+        profile = session["profile"] = profile_of(session["user"], user)
+    return profile
+
+
+def profile_of(email: str, user: dict) -> dict:
+    return {"email": email, "bio": user.get("bio", ""), "created_at": user.get("created_at", "")}
+
+
+app.jinja_env.globals["current_profile"] = current_profile
+
 
+def _fresh_derived(key: str):
+    """The session's cached ``key``, or None if it was loaded over SESSION_DERIVED_TTL seconds ago."""
+    if time.time() - (session.get("derived_at") or {}).get(key, 0) >= SESSION_DERIVED_TTL:
+        return None
+    return session.get(key)
 
-def get_image_for_meme(meme_id: str):
-    """Retrieve stored image bytes from memory"""
-    return meme_images.get(meme_id)
 
+def _mark_derived(key: str):
+    """Record that the session's ``key`` was just loaded from the stores."""
+    session.set_derived("derived_at", dict(session.get("derived_at") or {}, **{key: time.time()}))
 
-def store_image_for_meme(meme_id: str, image_bytes: bytes):
-    """Store image bytes in memory"""
-    meme_images[meme_id] = image_bytes
 
+def saved_ids() -> list:
+    """The signed-in user's saved meme ids (cached for SESSION_DERIVED_TTL with server-side sessions)."""
+    if SERVER_SESSIONS:
+        ids = _fresh_derived("saved")
+        if ids is not None:
+            return ids
+    ids = repo.users.saved(session["user"])
+    if SERVER_SESSIONS:
+        session["saved"] = ids
+        _mark_derived("saved")
+    return ids
 
-    # Send important notifications
+
+def with_liked(items: list) -> list:
+    """
+    Copies of ``items`` with ``liked`` set for the signed-in user. With
+    server-side sessions the like state is cached in the session, so every
+    worker sees the user's own likes and unlikes; state looked up here is
+    saved with the session's next write. After SESSION_DERIVED_TTL the
+    cached state is dropped and looked up again.
+    """
+    user = session["user"]
+    if not SERVER_SESSIONS:
+        return liked_cache.with_liked(user, items)
+    known = _fresh_derived("liked")
+    expired = known is None
+    if expired:
+        known = {}
+        liked_cache.forget(user)  # its copy may be as old as the session's
+    missing = [item["meme_id"] for item in items if item["meme_id"] not in known]
+    if missing:
+        liked_cache.liked(user, missing)
+        learned = liked_cache.known(user, missing)  # without what failed to load
+        if learned:
+            known = dict(known, **learned)
+            session.set_derived("liked", _bounded(known))
+            if expired:
+                _mark_derived("liked")
+    return [dict(item, liked=bool(known.get(item["meme_id"]))) for item in items]
+
+
+def remember_liked(meme_id: str, liked: bool):
+    liked_cache.set(session["user"], meme_id, liked)
+    if SERVER_SESSIONS:
+        known = dict(session.get("liked") or {})
+        known.pop(meme_id, None)
+        known[meme_id] = liked
+        session["liked"] = _bounded(known)
+
+
+def _bounded(known: dict) -> dict:
+    """The last SESSION_LIKED_LIMIT entries of a like-state dict (oldest first)."""
+    if len(known) <= SESSION_LIKED_LIMIT:
+        return known
+    return dict(list(known.items())[-SESSION_LIKED_LIMIT:])
+
+
+def load_memes(meme_ids: list) -> list:
+    """
+    The memes of ``meme_ids`` that exist, in order, through the meme cache
+    (one parallel batch read for the rest). Memes already loaded during this
+    request, by a route or a template, are not fetched again.
+    """
+    loaded = g.setdefault("loaded_memes", {})  # {meme_id: item or None}
+    missing = [meme_id for meme_id in dict.fromkeys(meme_ids) if meme_id not in loaded]
+    if missing:
+        found = {item["meme_id"]: item for item in meme_cache.get_many(missing)}
+        for meme_id in missing:
+            loaded[meme_id] = found.get(meme_id)
+    return [dict(loaded[meme_id]) for meme_id in meme_ids if loaded.get(meme_id)]
+
+
+def delete_meme_images(item: dict):
+    """Remove a deleted meme's image and variants unless another meme shares them"""
+    key = item.get("image_key")
+    if not key or repo.memes.image_in_use(key):
+        return
+    image_store.delete(key)
+    image_urls.invalidate(key)
+    variant_generator.delete(item.get("variants"))
+
+
+def _load_phash_index():
+    """Scan approved memes' perceptual hashes into this worker's index"""
+    try:
+        for item in repo.memes.scan(approved_only=True, fields=["meme_id", "phash", "status"]):
+            if item.get("phash"):
+                phash_index.add(item["meme_id"], hex_to_hash(item["phash"]))
+    except STORAGE_ERRORS as e:
+        print(f"Error loading perceptual hash index: {e}")
+
+
+def warm_phash_index():
+    """Start loading the perceptual-hash index once per worker process"""
+    if _phash_index_state["pid"] == os.getpid():
+        return
+    _phash_index_state["pid"] = os.getpid()
+    threading.Thread(target=_load_phash_index, name="phash-index", daemon=True).start()
+
+
+def _load_search_index():
+    """Index approved memes newer than the last catch-up, or than the loaded segment"""
+    global search_index
+    index = search_index
+    since = _search_index_state["since"]
+    if index.outdated():
+        index = SearchIndex(SEARCH_INDEX_DIR)  # mapped readers of the old one keep working
+        since = None
+    if since is None and index.built_at:
+        # An hour of overlap covers uploads still being analysed when the
+        # segment was written
+        since = _iso_minus_hours(index.built_at, 1)
+    started = datetime.utcnow().isoformat()
+    fields = ["meme_id", "title", "description", "tags", "labels", "detected_text", "status"]
     try:
-        if action == "register":
-            subject = f"[Meme Museum] New user registered: {user_email}"
-            message = f"User {user_email} registered at {item['ts']}\nMeta: {meta or {}}"
-        elif action == "upload":
-            status = (meta or {}).get("status")
-            meme_id = (meta or {}).get("meme_id")
-            if status and status.lower() == "rejected":
-                subject = f"[Meme Museum] Meme rejected: {meme_id}"
-                message = f"Meme {meme_id} uploaded by {user_email} was rejected. Reasons: {meta.get('reasons') if meta else 'N/A'}"
-            elif status and status.lower() == "approved":
-                subject = f"[Meme Museum] Meme approved: {meme_id}"
-                message = f"Meme {meme_id} uploaded by {user_email} was approved."
-    except Exception:
-        pass
-
-
-def moderate_image_bytes(image_bytes: bytes, min_confidence: float = 60.0):
-    # Local dev: always approve
-    reasons = []
-    approved = True
-    return approved, reasons
-
-
-def detect_labels_and_text(image_bytes: bytes):
-    # Local dev: return empty
-    labels = []
-    detected_text = ""
-    return labels, detected_text
+        for item in repo.memes.scan(approved_only=True, since=since, fields=fields):
+            index.add(item["meme_id"], item)
+        search_index = index
+        _search_index_state["since"] = _iso_minus_hours(started, 1)
+    except STORAGE_ERRORS as e:
+        print(f"Error loading search index: {e}")
+    finally:
+        _search_index_state["loading"] = False
+        _search_index_state["checked"] = time.monotonic()
+
+
+def _iso_minus_hours(ts: str, hours: int) -> str:
+    return (datetime.fromisoformat(ts) - timedelta(hours=hours)).isoformat()
+
+
+def warm_search_index():
+    """Start loading the search index once per worker process, then refreshing it"""
+    if _search_index_state["pid"] == os.getpid():
+        if _search_index_state["loading"] or not SEARCH_REFRESH_INTERVAL:
+            return
+        if time.monotonic() - _search_index_state["checked"] < SEARCH_REFRESH_INTERVAL:
+            return
+    _search_index_state["pid"] = os.getpid()
+    _search_index_state["loading"] = True
+    threading.Thread(target=_load_search_index, name="search-index", daemon=True).start()
+
+
+def index_for_browse(item: dict):
+    """Add an approved meme to the category/tag browse indexes (a repeat is a no-op)"""
+    try:
+        repo.browse.index(item)
+    except STORAGE_ERRORS as e:
+        print(f"Error indexing {item['meme_id']} for browse: {e}")
+
+
+def process_analysis_job(job: dict) -> str:
+    """
+    Run moderation and label/text detection for an uploaded meme and
+    store the outcome on the meme record. Returns the final status.
+    """
+    meme_id = job["meme_id"]
+    user = job["user"]
+    title = job.get("title", "")
+    image_key = job["image_key"]
+    image = rekognition_image(image_key)
+    # Fetched once for the perceptual hash and the resized variants
+    image_bytes = image.get("Bytes") or image_store.get(image_key) or b""
+    phash = dhash(image_bytes)
+
+    # Every new image is moderated: only identical bytes (the content-hash
+    # cache, checked at upload) reuse an earlier result. Raises if
+    # moderation fails, so nothing is cached and the job is retried.
+    approved, reasons, labels, detected_text = analyze_image(image, min_confidence=60.0)
+    phash_hex = hash_to_hex(phash) if phash is not None else None
+    variants = variant_generator.generate(image_key, image_bytes) if approved else []
+    analysis_cache.put(job["content_hash"], approved, reasons, labels, detected_text,
+                       image_key=image_key, phash=phash_hex, variants=variants)
+    status = "approved" if approved else "rejected"
+
+    # A storage error here propagates, so the job is retried
+    updated = repo.memes.update(meme_id, {
+        "status": status,
+        "reject_reasons": reasons,
+        "labels": labels,
+        "detected_text": detected_text,
+        "phash": phash_hex,
+        "variants": variants
+    })
+    meme_cache.invalidate(meme_id)
+    if not updated:
+        # Deleted while the job was queued
+        return "deleted"
+
+    if approved:
+        if phash is not None:
+            phash_index.add(meme_id, phash)
+        search_index.add(meme_id, dict(job, labels=labels, detected_text=detected_text))
+        index_for_browse(job)
+    notify_analysis_result(meme_id, user, title, approved, reasons, labels)
+    return status
+
+
+def mark_analysis_failed(job: dict, error: Exception):
+    """Record a meme whose analysis kept failing, so it does not stay pending forever"""
+    try:
+        repo.memes.update(job["meme_id"], {"status": "failed", "analysis_error": str(error)[:200]})
+    except STORAGE_ERRORS as e:
+        print(f"Error marking analysis failed for {job['meme_id']}: {e}")
+        return
+    meme_cache.invalidate(job["meme_id"])
+
+
+def analysis_job(item: dict) -> dict:
+    """The analysis job for a meme record"""
+    fields = ("meme_id", "user", "title", "description", "category", "tags", "created_at", "content_hash", "image_key")
+    return {field: item.get(field) for field in fields}
+
+
+analysis_pool = JobWorkerPool(
+    process_analysis_job,
+    workers=ANALYSIS_WORKERS,
+    name="analysis",
+    max_attempts=ANALYSIS_MAX_ATTEMPTS,
+    on_failure=mark_analysis_failed
+)
+atexit.register(lambda: analysis_pool.close(ANALYSIS_DRAIN_TIMEOUT))
+_analysis_recovery_state = {"pid": None, "recovered": 0}
+# Memory stores are per process, so there each worker recovers its own jobs
+analysis_recovery_lock = HostLock(ANALYSIS_RECOVERY_LOCK) if STORAGE_BACKEND != "memory" else None
+
+
+def _recover_pending_analysis():
+    """Re-submit memes whose analysis job was lost with the worker that held it"""
+    while True:
+        # Workers without the lock keep trying, to take over if its holder exits
+        if analysis_recovery_lock is None or analysis_recovery_lock.acquire():
+            now = datetime.utcnow()
+            stale_before = (now - timedelta(seconds=ANALYSIS_RECOVER_AFTER)).isoformat()
+            since = (now - timedelta(hours=ANALYSIS_RECOVER_HOURS)).isoformat()
+            try:
+                for meme_id in repo.memes.pending_analysis(since, stale_before):
+                    # The conditional claim lets one worker (of any machine) through per meme
+                    item = repo.memes.claim_analysis(meme_id, now.isoformat(), stale_before)
+                    if item is not None:
+                        analysis_pool.submit(analysis_job(item))
+                        _analysis_recovery_state["recovered"] += 1
+            except STORAGE_ERRORS as e:
+                print(f"Error recovering pending analysis: {e}")
+        time.sleep(max(1.0, ANALYSIS_RECOVER_AFTER))
+
+
+@app.before_request
+def start_analysis_recovery():
+    """Start the pending-analysis recovery loop once per worker process"""
+    if _analysis_recovery_state["pid"] == os.getpid() or not ASYNC_ANALYSIS or ANALYSIS_RECOVER_HOURS <= 0:
+        return
+    _analysis_recovery_state["pid"] = os.getpid()
+    threading.Thread(target=_recover_pending_analysis, name="analysis-recovery", daemon=True).start()
+
+
+def announce_trending(meme_id: str, category: str, score: float):
+    """
+    Publish a trending alert, once per meme per TRENDING_ALERT_COOLDOWN_HOURS:
+    the store's claim on trending_alerted_at lets only one worker (of any
+    instance) through.
+    """
+    now = now_iso()
+    try:
+        item = repo.memes.claim_trending_alert(meme_id, now, _iso_minus_hours(now, TRENDING_ALERT_COOLDOWN_HOURS))
+    except STORAGE_ERRORS as e:
+        print(f"Error recording trending alert for {meme_id}: {e}")
+        return
+    if item is None:
+        return
+    log_activity("trending", item.get("user", ""), {"meme_id": meme_id, "score": round(score, 1)})
+    subject = f"Trending: {item.get('title') or meme_id}"
+    message = (
+        f"Meme '{item.get('title', '')}' by {item.get('user', '')} is trending"
+        f"{' in ' + category if category else ''} (score {score:.0f}).\n"
+        f"Meme ID: {meme_id}"
+    )
+    publish_sns(SNS_TOPIC_TRENDING, subject, message, "trending", "{count} memes trending")
+
+
+# Decayed engagement scores fed by log_activity() and views
+trending_tracker = TrendingTracker(
+    half_life=TRENDING_HALF_LIFE_HOURS * 3600,
+    threshold=TRENDING_THRESHOLD,
+    on_trending=announce_trending,
+    alert_cooldown=TRENDING_ALERT_COOLDOWN_HOURS * 3600
+)
+
+
 # ==========================================
 # ROUTES
 # ==========================================
+@app.errorhandler(413)
+def upload_too_large(e):
+    flash(f"Image is too large (max {MAX_UPLOAD_BYTES // (1024 * 1024)} MB).")
+    return redirect(url_for("upload"))
+
+
 @app.route('/health')
 def health():
-    return jsonify({"status": "ok", "time": now_iso(), "environment": "local-development"})
+    return jsonify({
+        "status": "ok",
+        "time": now_iso(),
+        "storage": STORAGE_BACKEND,
+        "region": AWS_REGION,
+        "worker": {
+            "class": serving.worker_class(),
+            "concurrency": serving.worker_concurrency(),
+            "gevent": serving.gevent_patched(),
+            "aws_pool_connections": AWS_MAX_POOL_CONNECTIONS
+        },
+        "aws_clients": aws_clients.stats(),
+        "sqlite": repo.db.stats() if repo.db is not None else None,
+        "activity_log": activity_logger.stats(),
+        "counters": counter_buffer.stats(),
+        "notifications": notifier.stats(),
+        "analysis_jobs": dict(analysis_pool.stats(), recovered=_analysis_recovery_state["recovered"]),
+        "passwords": password_hasher.stats(),
+        "sessions": app.session_interface.stats() if SERVER_SESSIONS else None,
+        "meme_cache": meme_cache.stats(),
+        "trending": trending_tracker.stats()
+    })
 
 
 @app.route("/")
@@ -146,19 +888,24 @@ def register():
             flash("Password must be at least 6 characters.")
             return redirect(url_for("register"))
 
-        # Check duplicate
-        if email in users_db:
+        # Create the user unless the email is taken (one conditional write)
+        try:
+            created = repo.users.create(email, hash_password(password), now_iso())
+        except STORAGE_ERRORS as e:
+            flash("Error creating account.")
+            print(f"Storage error: {e}")
+            return redirect(url_for("register"))
+        if not created:
             flash("User already exists. Please login.")
             return redirect(url_for("login"))
 
-        hashed = hash_password(password)
-        users_db[email] = {
-            "email": email,
-            "password": hashed,
-            "created_at": now_iso(),
-            "bio": "",
-        }
         log_activity("register", email)
+
+        # Send SNS notification
+        subject = f"[Meme Museum] New user registered: {email}"
+        message = f"User {email} registered at {now_iso()}"
+        publish_sns(SNS_TOPIC_NEW_UPLOAD, subject, message, "registered", "[Meme Museum] {count} new users registered")
+
         flash("Account created successfully. Please login.")
         return redirect(url_for("login"))
 
@@ -171,11 +918,19 @@ def login():
         email = request.form.get("email", "").lower()
         password = request.form.get("password", "")
 
-        user = users_db.get(email)
-        if user and verify_password(password, user.get("password", "")):
-            session["user"] = email
-            log_activity("login", email)
-            return redirect(url_for("dashboard"))
+        try:
+            user = repo.users.get(email)
+            if user and verify_password(email, password, user.get("password", "")):
+                # A new session id at login, so one planted before it is useless
+                session.clear()
+                if SERVER_SESSIONS:
+                    session.regenerate()
+                session["user"] = email
+                session["profile"] = profile_of(email, user)
+                log_activity("login", email)
+                return redirect(url_for("dashboard"))
+        except STORAGE_ERRORS as e:
+            print(f"Storage error: {e}")
 
         flash("Invalid email or password.")
         return redirect(url_for("login"))
@@ -187,6 +942,7 @@ def login():
 def logout():
     email = session.pop("user", None)
     if email:
+        liked_cache.forget(email)
         log_activity("logout", email)
     session.clear()
     return redirect(url_for("login"))
@@ -198,9 +954,22 @@ def dashboard():
         return redirect(url_for("login"))
 
     user = session["user"]
-    # Get user's memes from local storage
-    user_memes = [meme for meme in memes_db.values() if meme["user"] == user]
-    return render_template("dashboard.html", memes=user_memes)
+    limit = page_size(request.args.get("limit"), DASHBOARD_PAGE_SIZE, DASHBOARD_MAX_PAGE_SIZE)
+    next_cursor = None
+    try:
+        # The user's memes newest first, as feed cards
+        items, next_cursor = repo.memes.user_page(user, limit, decode_cursor(request.args.get("cursor")))
+    except STORAGE_ERRORS as e:
+        print(f"Storage query error: {e}")
+        items = []
+        flash("Error loading memes.")
+
+    return render_template(
+        "dashboard.html",
+        memes=with_image_urls(with_liked(counter_buffer.live_counts(items))),
+        next_cursor=next_cursor,
+        limit=limit
+    )
 
 
 @app.route("/upload", methods=["GET", "POST"])
@@ -219,18 +988,26 @@ def upload():
             flash("Please provide an image file.")
             return redirect(url_for("upload"))
 
-        image_bytes = file.read()
-        # Moderation
-        approved, reasons = moderate_image_bytes(image_bytes, min_confidence=60.0)
-
         meme_id = generate_meme_id()
         user = session["user"]
 
-        # Store image in memory
-        store_image_for_meme(meme_id, image_bytes)
-
-        labels, detected_text = detect_labels_and_text(image_bytes)
+        # Stream the upload to storage in chunks, hashing as it goes
+        try:
+            image_key, digest, _ = image_store.put_stream(
+                file.stream,
+                lambda d: image_key_for(d, file.filename),
+                max_bytes=MAX_UPLOAD_BYTES,
+                content_type=file.mimetype
+            )
+        except UploadTooLarge:
+            flash(f"Image is too large (max {MAX_UPLOAD_BYTES // (1024 * 1024)} MB).")
+            return redirect(url_for("upload"))
+        except Exception as e:
+            flash("Error saving image.")
+            print(f"Image store error: {e}")
+            return redirect(url_for("upload"))
 
+        # Create meme record; analysis fills in status, labels and text
         item = {
             "meme_id": meme_id,
             "user": user,
@@ -238,23 +1015,71 @@ def upload():
             "description": description,
             "category": category,
             "tags": tags,
-            "labels": labels,
-            "detected_text": detected_text,
+            "labels": [],
+            "detected_text": "",
             "likes": 0,
             "views": 0,
             "downloads": 0,
-            "status": "approved" if approved else "rejected",
-            "reject_reasons": reasons,
+            "status": "pending",
+            "reject_reasons": [],
             "created_at": now_iso(),
-            "comments": []
+            "content_hash": digest,
+            "image_key": image_key,
+            "variants": [],
+            "comment_count": 0
         }
-        memes_db[meme_id] = item
-        log_activity("upload", user, {"meme_id": meme_id, "status": item["status"], "reasons": reasons, "labels": labels})
 
-        if not approved:
-            flash("Meme was rejected by moderation.")
+        # Identical bytes were analysed before: skip analysis entirely
+        cached = analysis_cache.get(digest)
+        if cached is not None:
+            approved, reasons, labels, detected_text = entry_result(cached)
+            item.update({
+                "status": "approved" if approved else "rejected",
+                "reject_reasons": reasons,
+                "labels": labels,
+                "detected_text": detected_text
+            })
+            if cached.get("phash"):
+                item["phash"] = cached["phash"]
+            item["variants"] = cached.get("variants", [])
+
+        try:
+            repo.memes.put(item)
+        except STORAGE_ERRORS as e:
+            flash("Error saving meme.")
+            print(f"Storage error: {e}")
+            return redirect(url_for("upload"))
+
+        if cached is not None:
+            if approved:
+                if cached.get("phash"):
+                    phash_index.add(meme_id, hex_to_hash(cached["phash"]))
+                search_index.add(meme_id, item)
+                index_for_browse(item)
+            notify_analysis_result(meme_id, user, title, approved, reasons, labels)
+            if approved:
+                flash("Meme uploaded and approved!")
+            else:
+                flash("Meme was rejected by moderation.")
+            return redirect(url_for("dashboard"))
+
+        job = analysis_job(item)
+        if ASYNC_ANALYSIS:
+            analysis_pool.submit(job)
+            flash("Meme uploaded! It will appear once analysis finishes.")
         else:
-            flash("Meme uploaded and approved!")
+            try:
+                status = process_analysis_job(job)
+            except Exception as e:
+                print(f"Analysis error for {meme_id}: {e}")
+                mark_analysis_failed(job, e)
+                status = "failed"
+            if status == "approved":
+                flash("Meme uploaded and approved!")
+            elif status == "failed":
+                flash("Analysis failed. Please try uploading again.")
+            else:
+                flash("Meme was rejected by moderation.")
 
         return redirect(url_for("dashboard"))
 
@@ -266,15 +1091,40 @@ def view_meme(meme_id):
     if "user" not in session:
         return redirect(url_for("login"))
 
-    item = memes_db.get(meme_id)
-    if not item:
-        flash("Meme not found.")
-        return redirect(url_for("dashboard"))
-
-    # Increment view count
-    item["views"] = item.get("views", 0) + 1
+    try:
+        item = meme_cache.get(meme_id)
+        if not item:
+            flash("Meme not found.")
+            return redirect(url_for("dashboard"))
 
-    return render_template("meme.html", meme=item)
+        # Count the view (written behind) and show live counts; views are
+        # scored for trending here rather than written to the activity log
+        counter_buffer.incr(meme_id, "views")
+        if item.get("status") == "approved":
+            trending_tracker.record(meme_id, "view", item.get("category"))
+        item = with_liked(counter_buffer.live_counts([item]))[0]
+
+        comments, comments_cursor = [], None
+        try:
+            comments, comments_cursor = repo.comments.page(
+                meme_id,
+                COMMENTS_PAGE_SIZE,
+                decode_cursor(request.args.get("comments_cursor"))
+            )
+        except STORAGE_ERRORS as e:
+            print(f"Error loading comments: {e}")
+
+        return render_template(
+            "meme.html",
+            meme=with_image_urls([item])[0],
+            saved=SERVER_SESSIONS and meme_id in saved_ids(),
+            comments=comments,
+            comments_cursor=comments_cursor
+        )
+    except STORAGE_ERRORS as e:
+        flash("Error loading meme.")
+        print(f"Storage error: {e}")
+        return redirect(url_for("dashboard"))
 
 
 @app.route("/comment/<meme_id>", methods=["POST"])
@@ -286,17 +1136,17 @@ def comment_meme(meme_id):
     if not text:
         return redirect(url_for("view_meme", meme_id=meme_id))
 
-    item = memes_db.get(meme_id)
-    if not item:
-        flash("Meme not found.")
-        return redirect(url_for("dashboard"))
-
-    comment = {"user": session["user"], "text": text, "ts": now_iso()}
-    if "comments" not in item:
-        item["comments"] = []
-    item["comments"].append(comment)
+    try:
+        # Comment row + comment_count in one transaction (fails if the meme is gone)
+        if repo.comments.add(meme_id, session["user"], text, now_iso()) is None:
+            flash("Meme not found.")
+            return redirect(url_for("dashboard"))
+        meme_cache.invalidate(meme_id)
+        log_activity("comment", session["user"], {"meme_id": meme_id})
+    except STORAGE_ERRORS as e:
+        print(f"Error adding comment: {e}")
+        flash("Error adding comment.")
 
-    log_activity("comment", session["user"], {"meme_id": meme_id})
     return redirect(url_for("view_meme", meme_id=meme_id))
 
 
@@ -306,23 +1156,248 @@ def delete_meme(meme_id):
         return redirect(url_for("login"))
 
     user = session["user"]
-    item = memes_db.get(meme_id)
-    if not item:
-        flash("Meme not found.")
-        return redirect(url_for("dashboard"))
+    try:
+        item = meme_cache.get(meme_id)
+        if not item:
+            flash("Meme not found.")
+            return redirect(url_for("dashboard"))
 
-    if item.get("user") != user:
-        flash("Not authorized to delete this meme.")
+        if item.get("user") != user:
+            flash("Not authorized to delete this meme.")
+            return redirect(url_for("dashboard"))
+
+        # Browse items and counts first, then the meme and what hangs off it.
+        # The store's copy decides what to unindex: ours may predate moderation
+        item = repo.memes.get(meme_id) or item
+        repo.browse.unindex(item)
+        repo.memes.delete(meme_id)
+        meme_cache.invalidate(meme_id)
+        repo.likes.remove_meme(meme_id)
+        repo.comments.delete_all(meme_id)
+        delete_meme_images(item)
+        phash_index.remove(meme_id)
+        counter_buffer.discard(meme_id)
+        repo.counter_sink.delete(meme_id)
+        search_index.remove(meme_id)
+        trending_tracker.remove(meme_id)
+        log_activity("delete", user, {"meme_id": meme_id})
+        flash("Meme deleted.")
+        return redirect(url_for("dashboard"))
+    except STORAGE_ERRORS as e:
+        flash("Error deleting meme.")
+        print(f"Storage error: {e}")
         return redirect(url_for("dashboard"))
 
-    # Delete from memory
-    del memes_db[meme_id]
-    if meme_id in meme_images:
-        del meme_images[meme_id]
 
-    log_activity("delete", user, {"meme_id": meme_id})
-    flash("Meme deleted.")
-    return redirect(url_for("dashboard"))
+@app.route("/save/<meme_id>", methods=["POST"])
+def save_meme(meme_id):
+    if "user" not in session:
+        return redirect(url_for("login"))
+
+    try:
+        if not meme_cache.get(meme_id):
+            flash("Meme not found.")
+            return redirect(url_for("dashboard"))
+        repo.users.save(session["user"], meme_id)
+        if SERVER_SESSIONS and "saved" in session and meme_id not in session["saved"]:
+            session["saved"] = session["saved"] + [meme_id]
+        flash("Saved.")
+    except STORAGE_ERRORS as e:
+        print(f"Error saving meme: {e}")
+        flash("Error saving meme.")
+    return redirect(url_for("view_meme", meme_id=meme_id))
+
+
+@app.route("/unsave/<meme_id>", methods=["POST"])
+def unsave_meme(meme_id):
+    if "user" not in session:
+        return redirect(url_for("login"))
+
+    try:
+        repo.users.unsave(session["user"], meme_id)
+        if SERVER_SESSIONS and "saved" in session:
+            session["saved"] = [m for m in session["saved"] if m != meme_id]
+    except STORAGE_ERRORS as e:
+        print(f"Error unsaving meme: {e}")
+        flash("Error removing saved meme.")
+    return redirect(url_for("saved"))
+
+
+@app.route("/saved")
+def saved():
+    if "user" not in session:
+        return redirect(url_for("login"))
+
+    user = session["user"]
+    try:
+        ids = saved_ids()
+        items = load_memes(ids)
+        # Saved memes deleted since drop out of the list for good
+        gone = set(ids) - {item["meme_id"] for item in items}
+        if gone:
+            repo.users.unsave(user, *gone)
+            if SERVER_SESSIONS:
+                session["saved"] = [m for m in ids if m not in gone]
+    except STORAGE_ERRORS as e:
+        print(f"Storage error: {e}")
+        items = []
+        flash("Error loading saved memes.")
+    # Other people's memes only once approved; newest first
+    items = [m for m in items if m.get("status") == "approved" or m.get("user") == user]
+    items.sort(key=lambda m: (m.get("created_at", ""), m["meme_id"]), reverse=True)
+    return render_template(
+        "saved.html",
+        memes=with_image_urls(with_liked(counter_buffer.live_counts(items)))
+    )
+
+
+@app.route("/search")
+def search():
+    if "user" not in session:
+        return redirect(url_for("login"))
+
+    warm_search_index()
+    query = request.args.get("q", "").strip()
+    page = max(1, request.args.get("page", 1, type=int))
+    total, hits = search_index.search(query, limit=SEARCH_PAGE_SIZE, offset=(page - 1) * SEARCH_PAGE_SIZE)
+    try:
+        # Index entries can outlive deletes made on other workers; those drop out here
+        results = [m for m in load_memes([meme_id for _, meme_id in hits]) if m.get("status") == "approved"]
+    except STORAGE_ERRORS as e:
+        print(f"Storage error: {e}")
+        results = []
+        flash("Error loading search results.")
+    return render_template(
+        "search.html",
+        query=query,
+        memes=with_image_urls(with_liked(counter_buffer.live_counts(results))),
+        total=total,
+        page=page,
+        has_next=page * SEARCH_PAGE_SIZE < total
+    )
+
+
+@app.route("/search/tags")
+def search_tags():
+    """Tag autocomplete: most used tags starting with ?prefix="""
+    if "user" not in session:
+        return jsonify({"tags": []}), 401
+    warm_search_index()
+    suggestions = search_index.suggest_tags(request.args.get("prefix", ""), limit=10)
+    return jsonify({"tags": [{"tag": tag, "count": count} for tag, count in suggestions]})
+
+
+@app.route("/browse")
+def browse():
+    """Category facets and tag cloud from the precomputed counts"""
+    if "user" not in session:
+        return redirect(url_for("login"))
+
+    try:
+        categories = repo.browse.category_counts()
+        tags = repo.browse.tag_counts(limit=100)
+    except STORAGE_ERRORS as e:
+        print(f"Storage error: {e}")
+        categories, tags = [], []
+        flash("Error loading categories.")
+    return render_template("browse.html", categories=categories, tags=tags)
+
+
+@app.route("/browse/category/<path:category>")
+def browse_category(category):
+    if "user" not in session:
+        return redirect(url_for("login"))
+
+    next_cursor = None
+    try:
+        items, next_cursor = repo.browse.category_page(
+            category, BROWSE_PAGE_SIZE, decode_cursor(request.args.get("cursor"))
+        )
+    except STORAGE_ERRORS as e:
+        print(f"Storage query error: {e}")
+        items = []
+        flash("Error loading memes.")
+    return render_template(
+        "browse.html",
+        category=category,
+        memes=with_image_urls(with_liked(counter_buffer.live_counts(items))),
+        next_cursor=next_cursor
+    )
+
+
+@app.route("/browse/tag/<path:tag>")
+def browse_tag(tag):
+    if "user" not in session:
+        return redirect(url_for("login"))
+
+    next_cursor = None
+    try:
+        meme_ids, next_cursor = repo.browse.tag_page(tag, BROWSE_PAGE_SIZE, decode_cursor(request.args.get("cursor")))
+        items = load_memes(meme_ids)
+    except STORAGE_ERRORS as e:
+        print(f"Storage query error: {e}")
+        items = []
+        flash("Error loading memes.")
+    return render_template(
+        "browse.html",
+        tag=tag,
+        memes=with_image_urls(with_liked(counter_buffer.live_counts(items))),
+        next_cursor=next_cursor
+    )
+
+
+@app.route("/trending")
+def trending():
+    if "user" not in session:
+        return redirect(url_for("login"))
+
+    category = request.args.get("category") or None
+    hits = trending_tracker.top(TRENDING_PAGE_SIZE, category)
+    scores = {meme_id: score for score, meme_id in hits}
+    try:
+        results = [m for m in load_memes([meme_id for _, meme_id in hits]) if m.get("status") == "approved"]
+    except STORAGE_ERRORS as e:
+        print(f"Storage error: {e}")
+        results = []
+        flash("Error loading trending memes.")
+    memes = with_liked(counter_buffer.live_counts(results))
+    return render_template(
+        "trending.html",
+        memes=with_image_urls([dict(m, trending_score=scores[m["meme_id"]]) for m in memes]),
+        category=category,
+        categories=trending_tracker.categories()[:12]
+    )
+
+
+@app.route("/similar/<meme_id>")
+def similar_memes(meme_id):
+    if "user" not in session:
+        return redirect(url_for("login"))
+
+    try:
+        item = meme_cache.get(meme_id) or {}
+    except STORAGE_ERRORS as e:
+        print(f"Storage error: {e}")
+        item = {}
+    # Nothing is listed for a meme the viewer could not see
+    if not item or not visible_to_viewer(item):
+        return jsonify({"meme_id": meme_id, "similar": []})
+
+    # The index only holds approved memes, so rejected and pending ones
+    # are never listed
+    warm_phash_index()
+    phash = phash_index.get(meme_id)
+    if phash is None:
+        if not item.get("phash"):
+            return jsonify({"meme_id": meme_id, "similar": []})
+        phash = hex_to_hash(item["phash"])
+
+    similar = [
+        {"meme_id": other_id, "distance": distance}
+        for distance, other_id in phash_index.query(phash, radius=SIMILAR_DISTANCE, limit=21)
+        if other_id != meme_id
+    ]
+    return jsonify({"meme_id": meme_id, "similar": similar[:20]})
 
 
 @app.route("/like/<meme_id>")
@@ -331,19 +1406,31 @@ def like_meme(meme_id):
         return redirect(url_for("login"))
 
     user = session["user"]
-    like_key = f"{meme_id}_{user}"
+    try:
+        # Like row + count in one transaction: repeat likes are no-ops
+        if repo.likes.like(meme_id, user):
+            meme_cache.add_counts(meme_id, {"likes": 1})
+            log_activity("like", user, {"meme_id": meme_id})
+        remember_liked(meme_id, True)
+    except STORAGE_ERRORS as e:
+        print(f"Error liking meme: {e}")
 
-    # Check if already liked
-    if like_key not in likes_db:
-        likes_db[like_key] = {
-            "meme_id": meme_id,
-            "user": user,
-            "created_at": now_iso()
-        }
-        # Increment likes count
-        if meme_id in memes_db:
-            memes_db[meme_id]["likes"] = memes_db[meme_id].get("likes", 0) + 1
-        log_activity("like", user, {"meme_id": meme_id})
+    return redirect(url_for("view_meme", meme_id=meme_id))
+
+
+@app.route("/unlike/<meme_id>", methods=["POST"])
+def unlike_meme(meme_id):
+    if "user" not in session:
+        return redirect(url_for("login"))
+
+    user = session["user"]
+    try:
+        if repo.likes.unlike(meme_id, user):
+            meme_cache.add_counts(meme_id, {"likes": -1})
+            log_activity("unlike", user, {"meme_id": meme_id})
+        remember_liked(meme_id, False)
+    except STORAGE_ERRORS as e:
+        print(f"Error unliking meme: {e}")
 
     return redirect(url_for("view_meme", meme_id=meme_id))
 
@@ -353,18 +1440,53 @@ def download_meme(meme_id):
     if "user" not in session:
         return redirect(url_for("login"))
 
-    item = memes_db.get(meme_id)
-    if not item or item.get("status") != "approved":
-        flash("Meme not available for download.")
+    try:
+        item = meme_cache.get(meme_id)
+        if not item or item.get("status") != "approved":
+            flash("Meme not available for download.")
+            return redirect(url_for("dashboard"))
+
+        counter_buffer.incr(meme_id, "downloads")
+        log_activity("download", session["user"], {"meme_id": meme_id, "category": item.get("category")})
+
+        url = image_urls.url(item.get("image_key"), download=True)
+        if not url:
+            flash("Download not available.")
+            return redirect(url_for("view_meme", meme_id=meme_id))
+        return redirect(url)
+    except STORAGE_ERRORS as e:
+        flash("Error downloading meme.")
+        print(f"Storage error: {e}")
         return redirect(url_for("dashboard"))
 
-    # Increment download count
-    item["downloads"] = item.get("downloads", 0) + 1
-    log_activity("download", session["user"], {"meme_id": meme_id})
 
-    # In local dev, redirect back to view (real implementation would generate file)
-    flash("Download tracked! (Local dev - file download not implemented)")
-    return redirect(url_for("view_meme", meme_id=meme_id))
+@app.route("/media/<path:key>")
+def media(key):
+    """Serve images when running with the local image store (no S3_BUCKET)"""
+    if "user" not in session:
+        return redirect(url_for("login"))
+    if not isinstance(image_store, LocalImageStore):
+        abort(404)
+
+    try:
+        path = image_store.path(key)
+    except ValueError:
+        abort(404)
+    if not os.path.exists(path):
+        abort(404)
+    # Variants are only rendered for approved images; an original is served
+    # if one of the memes sharing it is visible to this viewer
+    key = os.path.relpath(path, image_store.root).replace(os.sep, "/")
+    if not key.startswith("variants/"):
+        try:
+            sharing = repo.memes.image_memes(key)
+        except STORAGE_ERRORS as e:
+            print(f"Storage error: {e}")
+            abort(503)
+        if not any(image_visible_to_viewer(item) for item in sharing):
+            abort(404)
+    return send_file(path, as_attachment=request.args.get("download") == "1")
+
 
 # ==========================================
 # RUN APP
@@ -374,9 +1496,10 @@ if __name__ == "__main__":
     host = os.environ.get("FLASK_RUN_HOST", "0.0.0.0")
     port = int(os.environ.get("FLASK_RUN_PORT", "5000"))
     print("\n" + "="*50)
-    print("MEME MUSEUM - LOCAL DEVELOPMENT")
+    print("MEME MUSEUM")
     print("="*50)
     print(f"Running on http://{host}:{port}")
-    print("Using in-memory dictionary storage (NOT AWS)")
+    print(f"Storage: {STORAGE_BACKEND}" + (f" ({SQLITE_PATH})" if STORAGE_BACKEND == "sqlite" else ""))
+    print(f"Images: {'s3://' + S3_BUCKET if S3_BUCKET else LOCAL_IMAGE_DIR}")
     print("="*50 + "\n")
     app.run(host=host, port=port, debug=debug)
@@ -0,0 +1,220 @@
+"""boto3 clients with per-service timeouts, retries and pool sizes.
+
+app.py used to build its Rekognition, SNS, S3 and DynamoDB clients at
+import with botocore's defaults: 10 pooled connections, legacy retries
+and a 60-second read timeout, so one stalled Rekognition call held a
+request (and a pool connection) for a minute. ``ClientFactory`` builds
+every client from one botocore ``Config`` per service:
+
+* connect/read timeouts and attempts per service (``SERVICE_DEFAULTS``,
+  each overridable from the environment as AWS_<SERVICE>_<SETTING>)
+* adaptive retry mode, which also rate-limits the client when AWS starts
+  throttling, and TCP keepalive on pooled connections
+* one ``max_pool_connections`` for every service (app.py sizes it with
+  serving.aws_pool_size()), overridable per service too
+
+Clients are built on first use in each process and again after a fork,
+like ``jobs.JobWorkerPool``: ``client()``, ``resource()`` and a resource's
+``Table()`` hand out stand-ins that forward to this process's object, so
+the stores can be wired up at import and a preloaded app never shares
+pooled sockets between gunicorn workers.
+
+``stats()`` reports per service the API calls, HTTP attempts (retries
+are the difference), requests in flight and their peak, and how many
+requests were sent with every pooled connection busy. urllib3's
+"Connection pool is full" discards are counted as well.
+"""
+import logging
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+# Per-service defaults: DynamoDB calls are small and retried more (adaptive
+# mode backs off on throttling), S3 uploads of up to 15 MB get a longer
+# read timeout
+SERVICE_DEFAULTS = {
+    "dynamodb": {"connect_timeout": 1.0, "read_timeout": 5.0, "max_attempts": 5},
+    "rekognition": {"connect_timeout": 2.0, "read_timeout": 10.0, "max_attempts": 3},
+    "s3": {"connect_timeout": 2.0, "read_timeout": 30.0, "max_attempts": 3},
+    "sns": {"connect_timeout": 2.0, "read_timeout": 5.0, "max_attempts": 3},
+}
+SETTINGS = {
+    "connect_timeout": float,
+    "read_timeout": float,
+    "max_attempts": int,
+    "max_pool_connections": int,
+}
+
+
+def service_overrides(environ=os.environ) -> dict:
+    """{service: {setting: value}} from AWS_<SERVICE>_<SETTING> variables (e.g. AWS_REKOGNITION_READ_TIMEOUT)."""
+    overrides = {}
+    for service in SERVICE_DEFAULTS:
+        for setting, cast in SETTINGS.items():
+            value = environ.get(f"AWS_{service.upper()}_{setting.upper()}")
+            if value:
+                overrides.setdefault(service, {})[setting] = cast(value)
+    return overrides
+
+
+class _PoolFullCounter(logging.Filter):
+    """Counts urllib3's warning for a connection dropped because its pool was full."""
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def filter(self, record) -> bool:
+        if record.getMessage().startswith("Connection pool is full"):
+            self.count += 1
+        return True
+
+
+_pool_full = _PoolFullCounter()
+logging.getLogger("urllib3.connectionpool").addFilter(_pool_full)
+
+
+class _ServiceStats:
+    def __init__(self, pool_size: int):
+        self.pool_size = pool_size
+        self.calls = 0
+        self.attempts = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.saturated = 0
+        self.lock = threading.Lock()
+
+    def on_call(self, **kwargs):
+        with self.lock:
+            self.calls += 1
+
+    def on_send(self, **kwargs):
+        with self.lock:
+            self.attempts += 1
+            if self.in_flight >= self.pool_size:
+                self.saturated += 1  # every pooled connection is busy; this one opens another
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def on_response(self, **kwargs):
+        with self.lock:
+            self.in_flight = max(0, self.in_flight - 1)
+
+    def to_dict(self) -> dict:
+        return {
+            "max_pool_connections": self.pool_size,
+            "calls": self.calls,
+            "retries": max(0, self.attempts - self.calls),
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "saturated": self.saturated,
+        }
+
+
+class _ForkSafe:
+    """Forwards attribute access to the factory's object for ``key`` in this process."""
+
+    def __init__(self, factory, key: tuple):
+        self._factory = factory
+        self._key = key
+
+    def __getattr__(self, name):
+        return getattr(self._factory._get(self._key), name)
+
+    def __repr__(self):
+        return f"<{'/'.join(self._key)} via ClientFactory>"
+
+
+class _ForkSafeResource(_ForkSafe):
+    def Table(self, name: str):
+        return _ForkSafe(self._factory, ("table",) + self._key[1:] + (name,))
+
+
+class ClientFactory:
+    """Builds and caches configured boto3 clients and resources, per process."""
+
+    def __init__(self, region: str, max_pool_connections: int = 10, retry_mode: str = "adaptive",
+                 tcp_keepalive: bool = True, overrides: dict = None):
+        self.region = region
+        self.max_pool_connections = max_pool_connections
+        self.retry_mode = retry_mode
+        self.tcp_keepalive = tcp_keepalive
+        self.overrides = overrides or {}
+        self._session = None
+        self._built = {}
+        self._stats = {}
+        self._pid = None
+        self._lock = threading.RLock()  # a table is built from its resource under the same lock
+
+    def settings(self, service: str) -> dict:
+        settings = {"max_pool_connections": self.max_pool_connections, "connect_timeout": 2.0,
+                    "read_timeout": 10.0, "max_attempts": 3}
+        settings.update(SERVICE_DEFAULTS.get(service, {}))
+        settings.update(self.overrides.get(service, {}))
+        return settings
+
+    def config(self, service: str) -> Config:
+        settings = self.settings(service)
+        return Config(
+            region_name=self.region,
+            connect_timeout=settings["connect_timeout"],
+            read_timeout=settings["read_timeout"],
+            max_pool_connections=settings["max_pool_connections"],
+            retries={"mode": self.retry_mode, "total_max_attempts": settings["max_attempts"]},
+            tcp_keepalive=self.tcp_keepalive
+        )
+
+    def client(self, service: str):
+        return _ForkSafe(self, ("client", service))
+
+    def resource(self, service: str):
+        return _ForkSafeResource(self, ("resource", service))
+
+    def _get(self, key: tuple):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Clients inherited through fork would share pooled sockets with the parent
+                    self._session = boto3.Session(region_name=self.region)
+                    self._built = {}
+                    self._stats = {}
+                    self._pid = os.getpid()
+        built = self._built.get(key)
+        if built is None:
+            with self._lock:
+                built = self._built.get(key)
+                if built is None:
+                    built = self._built[key] = self._build(key)
+        return built
+
+    def _build(self, key: tuple):
+        kind, service = key[0], key[1]
+        if kind == "table":
+            return self._get(("resource", service)).Table(key[2])
+        # boto3 sessions are not thread-safe; this runs under the lock
+        if kind == "resource":
+            built = self._session.resource(service, config=self.config(service))
+            client = built.meta.client
+        else:
+            built = client = self._session.client(service, config=self.config(service))
+        # A resource has its own client, so its own pool
+        stats = self._stats[service if kind == "client" else f"{service} resource"] = _ServiceStats(
+            self.settings(service)["max_pool_connections"]
+        )
+        events = client.meta.events
+        events.register("before-call", stats.on_call)
+        events.register("before-send", stats.on_send)
+        events.register("response-received", stats.on_response)
+        return built
+
+    def stats(self) -> dict:
+        services = {}
+        if self._pid == os.getpid():
+            services = {service: stats.to_dict() for service, stats in self._stats.items()}
+        return {
+            "retry_mode": self.retry_mode,
+            "services": services,
+            "pool_full_discards": _pool_full.count,
+        }
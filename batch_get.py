@@ -0,0 +1,102 @@
+"""Parallel BatchGetItem.
+
+Resolving a page of ids (search and trending results, tag pages, saved
+memes, the liked state of a feed) used to walk its 100-key BatchGetItem
+chunks one after another, and retried ``UnprocessedKeys`` straight away,
+which under throttling just gets throttled again. ``BatchGetter`` sends
+the chunks of one call concurrently on a small thread pool and retries
+each chunk's unprocessed keys with capped, jittered exponential backoff.
+
+It works on the low-level client, which is thread-safe (boto3 resources
+are not), so keys are in the typed ``{"S": ...}`` form and callers
+deserialize the items they get back. The pool is created lazily and again
+after a fork, like ``jobs.JobWorkerPool``.
+
+Typed requests need a client from ``low_level_client()``: the client
+behind a resource (``resource.meta.client``, ``table.meta.client``)
+serializes values itself, so ``{"S": "x"}`` would be sent as a map.
+"""
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.exceptions import BotoCoreError
+
+BATCH_GET_LIMIT = 100  # keys per BatchGetItem call
+
+
+def low_level_client(client):
+    """A plain DynamoDB client for the region, endpoint and config (pool size) of ``client`` (e.g. ``resource.meta.client``)."""
+    return boto3.client("dynamodb", region_name=client.meta.region_name, endpoint_url=client.meta.endpoint_url,
+                        config=client.meta.config)
+
+
+class UnprocessedKeysError(BotoCoreError):
+    """Keys still unprocessed after every retry (caught with the other storage errors)."""
+
+    fmt = "BatchGetItem on {table} left {count} keys unprocessed after {attempts} attempts"
+
+
+class BatchGetter:
+    """Runs one BatchGetItem per ``chunk_size`` keys, ``max_workers`` at a time."""
+
+    def __init__(self, client, max_workers: int = 4, chunk_size: int = BATCH_GET_LIMIT, max_attempts: int = 8,
+                 base_delay: float = 0.05, max_delay: float = 1.0):
+        self.client = client
+        self.max_workers = max(1, int(max_workers))
+        self.chunk_size = min(BATCH_GET_LIMIT, max(1, int(chunk_size)))
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # A pool inherited through fork has no threads behind it
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="batch-get")
+                    self._pid = os.getpid()
+        return self._executor
+
+    def get(self, table_name: str, keys: list, projection: str = None, names: dict = None) -> list:
+        """All items found for ``keys`` (typed, in no particular order)."""
+        chunks = [keys[i:i + self.chunk_size] for i in range(0, len(keys), self.chunk_size)]
+        if len(chunks) <= 1:
+            return self._get_chunk(table_name, chunks[0], projection, names) if chunks else []
+        futures = [self._pool().submit(self._get_chunk, table_name, chunk, projection, names) for chunk in chunks]
+        items = []
+        for future in futures:
+            items.extend(future.result())
+        return items
+
+    def _get_chunk(self, table_name: str, keys: list, projection: str, names: dict) -> list:
+        request = {"Keys": keys}
+        if projection:
+            request["ProjectionExpression"] = projection
+        if names:
+            request["ExpressionAttributeNames"] = names
+        items = []
+        for attempt in range(self.max_attempts):
+            if attempt:
+                # Full jitter, so throttled chunks do not all come back at once
+                self.retries += 1
+                time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+            self.calls += 1
+            resp = self.client.batch_get_item(RequestItems={table_name: request})
+            items.extend(resp.get("Responses", {}).get(table_name, []))
+            unprocessed = resp.get("UnprocessedKeys", {}).get(table_name)
+            if not unprocessed:
+                return items
+            request = unprocessed
+        raise UnprocessedKeysError(table=table_name, count=len(request["Keys"]), attempts=self.max_attempts)
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "retries": self.retries, "max_workers": self.max_workers}
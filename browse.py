@@ -0,0 +1,455 @@
+"""Browse approved memes by category and by tag, with facet counts.
+
+Listing used to be per user only. Approved memes are now indexed two ways:
+
+* by category, through the sparse ``by_category`` GSI on the memes table
+  (hash ``browse_category``, range ``created_at``). ``browse_category`` is
+  only set once a meme is approved, so pending and rejected memes never
+  appear and pages need no filter;
+* by tag, through adjacency items in the browse table:
+  ``pk = "TAG#<tag>"``, ``sk = "<created_at>#<meme_id>"``.
+
+The browse table also holds the counts per category and per tag, split
+over ``COUNT_SHARDS`` partitions (``pk = "COUNTS"``, ``"COUNTS#1"`` ...,
+``sk = "CATEGORY#<category>"`` / ``"TAG#<tag>"``), so facet lists and the
+tag cloud are a few queries rather than a scan. Each update adds to one
+shard picked at random, and readers sum them.
+
+``index()`` sets ``browse_category``, writes the adjacency items and bumps
+the counts in one transaction, conditional on ``browse_category`` not
+being set yet, so indexing the same meme twice is a no-op and the counts
+always match the items. ``unindex()`` is the reverse. Approvals in the
+same category touch the same count item; sharding makes that rarer, and a
+transaction cancelled by such a conflict is retried with backoff. Once an
+``unindex()`` leaves a category or tag summing to zero, its count items
+are deleted (conditional on none having changed since they were read), so
+emptied names do not pile up in the count queries. A worker's own
+writes drop its cached counts at once; other workers see them within
+``counts_ttl``.
+``scripts/backfill_browse.py`` indexes memes approved before this existed.
+
+``LocalBrowseIndex`` mirrors it in memory with an ``OrderedIndex`` (a dict
+of sorted lists) per kind and plain dicts of counts; ``SQLiteBrowseIndex``
+with the ``browse_category`` column of ``memes``, a ``browse_tags`` table
+and a ``browse_counts`` table, all changed in one transaction.
+"""
+import random
+import re
+import threading
+import time
+
+import botocore
+from boto3.dynamodb.types import TypeSerializer
+
+from batch_get import BatchGetter, low_level_client
+from pagination import OrderedIndex, encode_cursor, project_card
+from sqlite_db import meme_from_row
+
+DEFAULT_CATEGORY = "Uncategorized"
+# A transaction holds at most 100 items: 2 for the meme and its category
+# count, then 2 per tag (adjacency item + count)
+MAX_TAGS = 20
+COUNTS_PK = "COUNTS"
+# Count partitions; shard 0 keeps the original COUNTS key. Readers query
+# every shard, so this can be raised but never lowered
+COUNT_SHARDS = 8
+TRANSACT_ATTEMPTS = 5
+
+_serializer = TypeSerializer()
+
+BROWSE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS browse_tags (
+    tag TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    meme_id TEXT NOT NULL,
+    PRIMARY KEY (tag, created_at, meme_id)
+);
+CREATE INDEX IF NOT EXISTS browse_tags_by_meme ON browse_tags (meme_id);
+CREATE TABLE IF NOT EXISTS browse_counts (
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    n INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (kind, name)
+);
+"""
+
+
+def normalize_category(category: str) -> str:
+    return (category or "").strip() or DEFAULT_CATEGORY
+
+
+def normalize_tag(tag: str) -> str:
+    return re.sub(r"\s+", "-", (tag or "").strip().lower())
+
+
+def meme_tags(item: dict) -> list:
+    """The distinct normalised tags of a meme, at most MAX_TAGS."""
+    tags = [normalize_tag(t) for t in item.get("tags") or []]
+    return list(dict.fromkeys(t for t in tags if t))[:MAX_TAGS]
+
+
+def _counts_pk(shard: int) -> str:
+    return COUNTS_PK if shard == 0 else f"{COUNTS_PK}#{shard}"
+
+
+def _decrement(counts: dict, name: str):
+    """Take one from ``counts[name]``, dropping the name when none are left."""
+    if counts.get(name, 0) > 1:
+        counts[name] -= 1
+    else:
+        counts.pop(name, None)
+
+
+def _top(counts: dict, limit: int = None) -> list:
+    ordered = sorted(((n, name) for name, n in counts.items() if n > 0), key=lambda c: (-c[0], c[1]))
+    return [(name, n) for n, name in ordered[:limit]]
+
+
+class LocalBrowseIndex:
+    """In-memory category/tag indexes and counts for app.py."""
+
+    def __init__(self, memes: dict):
+        self.memes = memes  # the memory meme store's items
+        self._by_category = OrderedIndex()  # {category: [(created_at, meme_id)]}
+        self._by_tag = OrderedIndex()  # {tag: [(created_at, meme_id)]}
+        self._category_counts = {}
+        self._tag_counts = {}
+        self._indexed = {}  # {meme_id: (category, tags, created_at)}
+        self._lock = threading.Lock()
+
+    def index(self, item: dict) -> bool:
+        meme_id = item["meme_id"]
+        category = normalize_category(item.get("category"))
+        tags = meme_tags(item)
+        with self._lock:
+            if meme_id in self._indexed:
+                return False
+            self._indexed[meme_id] = (category, tags, item["created_at"])
+            self._category_counts[category] = self._category_counts.get(category, 0) + 1
+            for tag in tags:
+                self._tag_counts[tag] = self._tag_counts.get(tag, 0) + 1
+        self._by_category.add(category, item["created_at"], meme_id)
+        for tag in tags:
+            self._by_tag.add(tag, item["created_at"], meme_id)
+        return True
+
+    def unindex(self, item: dict) -> bool:
+        meme_id = item["meme_id"]
+        with self._lock:
+            entry = self._indexed.pop(meme_id, None)
+            if entry is None:
+                return False
+            category, tags, created_at = entry
+            _decrement(self._category_counts, category)
+            for tag in tags:
+                _decrement(self._tag_counts, tag)
+        self._by_category.remove(category, created_at, meme_id)
+        for tag in tags:
+            self._by_tag.remove(tag, created_at, meme_id)
+        return True
+
+    def category_page(self, category: str, limit: int, cursor: dict = None):
+        """Return ([feed cards newest first], next_cursor token)."""
+        ids, next_key = self._by_category.page(normalize_category(category), limit, cursor)
+        return [project_card(self.memes[i]) for i in ids if i in self.memes], encode_cursor(next_key)
+
+    def tag_page(self, tag: str, limit: int, cursor: dict = None):
+        """Return ([meme ids newest first], next_cursor token)."""
+        ids, next_key = self._by_tag.page(normalize_tag(tag), limit, cursor)
+        return ids, encode_cursor(next_key)
+
+    def category_counts(self, limit: int = None) -> list:
+        with self._lock:
+            return _top(self._category_counts, limit)
+
+    def tag_counts(self, limit: int = None) -> list:
+        with self._lock:
+            return _top(self._tag_counts, limit)
+
+
+class SQLiteBrowseIndex:
+    """Category column on ``memes`` plus ``browse_tags`` rows and ``browse_counts``."""
+
+    def __init__(self, db):
+        self.db = db
+        db.ensure_schema(BROWSE_SCHEMA)
+
+    def _count(self, conn, kind: str, name: str, delta: int):
+        conn.execute(
+            "INSERT INTO browse_counts (kind, name, n) VALUES (?, ?, ?) "
+            "ON CONFLICT (kind, name) DO UPDATE SET n = n + excluded.n",
+            (kind, name, delta)
+        )
+        if delta < 0:
+            conn.execute("DELETE FROM browse_counts WHERE kind = ? AND name = ? AND n <= 0", (kind, name))
+
+    def index(self, item: dict) -> bool:
+        """Add an approved meme to the browse indexes. False if it already was (or is gone)."""
+        meme_id = item["meme_id"]
+        category = normalize_category(item.get("category"))
+        tags = meme_tags(item)
+        with self.db.transaction() as conn:
+            updated = conn.execute(
+                "UPDATE memes SET browse_category = ? WHERE meme_id = ? AND browse_category IS NULL",
+                (category, meme_id)
+            ).rowcount
+            if not updated:
+                return False
+            self._count(conn, "CATEGORY", category, 1)
+            for tag in tags:
+                conn.execute(
+                    "INSERT OR IGNORE INTO browse_tags (tag, created_at, meme_id) VALUES (?, ?, ?)",
+                    (tag, item["created_at"], meme_id)
+                )
+                self._count(conn, "TAG", tag, 1)
+        return True
+
+    def unindex(self, item: dict) -> bool:
+        """Remove a meme from the browse indexes (before deleting it). False if it was not indexed."""
+        meme_id = item["meme_id"]
+        with self.db.transaction() as conn:
+            row = conn.execute("SELECT browse_category FROM memes WHERE meme_id = ?", (meme_id,)).fetchone()
+            if row is None or row["browse_category"] is None:
+                return False
+            tags = [r["tag"] for r in conn.execute("SELECT tag FROM browse_tags WHERE meme_id = ?", (meme_id,))]
+            conn.execute("UPDATE memes SET browse_category = NULL WHERE meme_id = ?", (meme_id,))
+            conn.execute("DELETE FROM browse_tags WHERE meme_id = ?", (meme_id,))
+            self._count(conn, "CATEGORY", row["browse_category"], -1)
+            for tag in tags:
+                self._count(conn, "TAG", tag, -1)
+        return True
+
+    def _page(self, sql: str, params: list, limit: int, cursor: dict):
+        if cursor:
+            sql += " AND (created_at, meme_id) < (?, ?)"
+            params = params + [cursor.get("created_at", ""), cursor.get("id", "")]
+        rows = self.db.query(sql + " ORDER BY created_at DESC, meme_id DESC LIMIT ?", params + [limit + 1])
+        next_key = None
+        if len(rows) > limit:
+            next_key = {"created_at": rows[limit - 1]["created_at"], "id": rows[limit - 1]["meme_id"]}
+        return rows[:limit], encode_cursor(next_key)
+
+    def category_page(self, category: str, limit: int, cursor: dict = None):
+        """Return ([feed cards newest first], next_cursor token)."""
+        rows, token = self._page("SELECT * FROM memes WHERE browse_category = ?", [normalize_category(category)],
+                                 limit, cursor)
+        return [project_card(meme_from_row(row)) for row in rows], token
+
+    def tag_page(self, tag: str, limit: int, cursor: dict = None):
+        """Return ([meme ids newest first], next_cursor token)."""
+        rows, token = self._page("SELECT created_at, meme_id FROM browse_tags WHERE tag = ?", [normalize_tag(tag)],
+                                 limit, cursor)
+        return [row["meme_id"] for row in rows], token
+
+    def _counts(self, kind: str, limit: int = None) -> list:
+        rows = self.db.query(
+            "SELECT name, n FROM browse_counts WHERE kind = ? AND n > 0 ORDER BY n DESC, name LIMIT ?",
+            (kind, -1 if limit is None else limit)
+        )
+        return [(row["name"], row["n"]) for row in rows]
+
+    def category_counts(self, limit: int = None) -> list:
+        return self._counts("CATEGORY", limit)
+
+    def tag_counts(self, limit: int = None) -> list:
+        return self._counts("TAG", limit)
+
+
+class DynamoBrowseIndex:
+    """Category GSI on the memes table plus tag adjacency and count items in ``table``."""
+
+    def __init__(self, table, memes_table, category_index: str = "by_category", counts_ttl: float = 60.0, client=None,
+                 batch_getter: BatchGetter = None):
+        self.table = table
+        self.memes_table = memes_table
+        self.client = client or low_level_client(table.meta.client)  # for the typed transactions
+        self.batch_getter = batch_getter or BatchGetter(self.client)
+        self.category_index = category_index
+        self.counts_ttl = counts_ttl
+        self._counts = {}  # {kind: (fetched_at, {name: n})}
+        self._lock = threading.Lock()
+
+    def _count_update(self, kind: str, name: str, delta: int) -> dict:
+        shard = random.randrange(COUNT_SHARDS)
+        return {
+            "Update": {
+                "TableName": self.table.name,
+                "Key": {"pk": {"S": _counts_pk(shard)}, "sk": {"S": f"{kind}#{name}"}},
+                "UpdateExpression": "ADD n :d",
+                "ExpressionAttributeValues": {":d": {"N": str(delta)}}
+            }
+        }
+
+    def _transact(self, items: list) -> bool:
+        client = self.client
+        for attempt in range(TRANSACT_ATTEMPTS):
+            try:
+                client.transact_write_items(TransactItems=items)
+                return True
+            except client.exceptions.TransactionCanceledException as e:
+                reasons = [r.get("Code") for r in e.response.get("CancellationReasons", [])]
+                if "ConditionalCheckFailed" in reasons:
+                    return False
+                if "TransactionConflict" not in reasons or attempt == TRANSACT_ATTEMPTS - 1:
+                    raise
+            time.sleep(random.uniform(0, 0.05 * 2 ** attempt))  # another transaction holds a count item
+
+    def index(self, item: dict) -> bool:
+        """Add an approved meme to the browse indexes. False if it already was (or is gone)."""
+        meme_id = item["meme_id"]
+        category = normalize_category(item.get("category"))
+        tags = meme_tags(item)
+        items = [
+            {
+                "Update": {
+                    "TableName": self.memes_table.name,
+                    "Key": {"meme_id": {"S": meme_id}},
+                    "UpdateExpression": "SET browse_category = :c, browse_tags = :t",
+                    "ConditionExpression": "attribute_exists(meme_id) AND attribute_not_exists(browse_category)",
+                    "ExpressionAttributeValues": {":c": {"S": category}, ":t": _serializer.serialize(tags)}
+                }
+            },
+            self._count_update("CATEGORY", category, 1)
+        ]
+        for tag in tags:
+            items.append({
+                "Put": {
+                    "TableName": self.table.name,
+                    "Item": {
+                        "pk": {"S": f"TAG#{tag}"},
+                        "sk": {"S": f"{item['created_at']}#{meme_id}"},
+                        "meme_id": {"S": meme_id}
+                    }
+                }
+            })
+            items.append(self._count_update("TAG", tag, 1))
+        if not self._transact(items):
+            return False
+        self._forget_counts()
+        return True
+
+    def unindex(self, item: dict) -> bool:
+        """Remove a meme from the browse indexes (before deleting it). False if it was not indexed."""
+        category = item.get("browse_category")
+        if not category:
+            return False
+        tags = item.get("browse_tags") or []
+        items = [
+            {
+                "Update": {
+                    "TableName": self.memes_table.name,
+                    "Key": {"meme_id": {"S": item["meme_id"]}},
+                    "UpdateExpression": "REMOVE browse_category, browse_tags",
+                    "ConditionExpression": "browse_category = :c",
+                    "ExpressionAttributeValues": {":c": {"S": category}}
+                }
+            },
+            self._count_update("CATEGORY", category, -1)
+        ]
+        for tag in tags:
+            items.append({
+                "Delete": {
+                    "TableName": self.table.name,
+                    "Key": {"pk": {"S": f"TAG#{tag}"}, "sk": {"S": f"{item['created_at']}#{item['meme_id']}"}}
+                }
+            })
+            items.append(self._count_update("TAG", tag, -1))
+        if not self._transact(items):
+            return False
+        self._forget_counts()
+        self._drop_empty_counts([("CATEGORY", category)] + [("TAG", tag) for tag in tags])
+        return True
+
+    def _forget_counts(self):
+        with self._lock:
+            self._counts.clear()
+
+    def _drop_empty_counts(self, names: list):
+        """
+        Delete the count items of the (kind, name) pairs whose shards sum to
+        zero or less. Each delete is conditional on the value read, so an
+        index() racing with this keeps its count (and the name).
+        """
+        keys = [
+            {"pk": {"S": _counts_pk(shard)}, "sk": {"S": f"{kind}#{name}"}}
+            for kind, name in names for shard in range(COUNT_SHARDS)
+        ]
+        try:
+            shards = {}  # {sk: {pk: n}}
+            for row in self.batch_getter.get(self.table.name, keys):
+                shards.setdefault(row["sk"]["S"], {})[row["pk"]["S"]] = row.get("n", {"N": "0"})["N"]
+            for sk, found in shards.items():
+                if sum(int(n) for n in found.values()) > 0:
+                    continue
+                self._transact([
+                    {
+                        "Delete": {
+                            "TableName": self.table.name,
+                            "Key": {"pk": {"S": pk}, "sk": {"S": sk}},
+                            "ConditionExpression": "n = :n",
+                            "ExpressionAttributeValues": {":n": {"N": n}}
+                        }
+                    }
+                    for pk, n in found.items()
+                ])
+        except (botocore.exceptions.ClientError, botocore.exceptions.BotoCoreError) as e:
+            # The meme is unindexed either way; the zero count is just not listed
+            print(f"Error dropping empty browse counts: {e}")
+
+    def category_page(self, category: str, limit: int, cursor: dict = None):
+        """Return ([feed cards newest first], next_cursor token) from the category GSI."""
+        kwargs = {
+            "IndexName": self.category_index,
+            "KeyConditionExpression": "browse_category = :c",
+            "ExpressionAttributeValues": {":c": normalize_category(category)},
+            "ScanIndexForward": False,
+            "Limit": limit
+        }
+        if cursor:
+            kwargs["ExclusiveStartKey"] = cursor
+        resp = self.memes_table.query(**kwargs)
+        return resp.get("Items", []), encode_cursor(resp.get("LastEvaluatedKey"))
+
+    def tag_page(self, tag: str, limit: int, cursor: dict = None):
+        """Return ([meme ids newest first], next_cursor token) from the tag's adjacency items."""
+        kwargs = {
+            "KeyConditionExpression": "pk = :pk",
+            "ExpressionAttributeValues": {":pk": f"TAG#{normalize_tag(tag)}"},
+            "ProjectionExpression": "meme_id",
+            "ScanIndexForward": False,
+            "Limit": limit
+        }
+        if cursor:
+            kwargs["ExclusiveStartKey"] = cursor
+        resp = self.table.query(**kwargs)
+        return [i["meme_id"] for i in resp.get("Items", [])], encode_cursor(resp.get("LastEvaluatedKey"))
+
+    def _load_counts(self, kind: str) -> dict:
+        """{name: n} for one kind, re-read from the table at most every counts_ttl seconds."""
+        with self._lock:
+            cached = self._counts.get(kind)
+            if cached and time.monotonic() - cached[0] < self.counts_ttl:
+                return cached[1]
+        counts = {}
+        for shard in range(COUNT_SHARDS):
+            kwargs = {
+                "KeyConditionExpression": "pk = :pk AND begins_with(sk, :kind)",
+                "ExpressionAttributeValues": {":pk": _counts_pk(shard), ":kind": f"{kind}#"}
+            }
+            while True:
+                resp = self.table.query(**kwargs)
+                for row in resp.get("Items", []):
+                    name = row["sk"][len(kind) + 1:]
+                    counts[name] = counts.get(name, 0) + int(row.get("n", 0))
+                if "LastEvaluatedKey" not in resp:
+                    break
+                kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+        with self._lock:
+            self._counts[kind] = (time.monotonic(), counts)
+        return counts
+
+    def category_counts(self, limit: int = None) -> list:
+        return _top(self._load_counts("CATEGORY"), limit)
+
+    def tag_counts(self, limit: int = None) -> list:
+        return _top(self._load_counts("TAG"), limit)
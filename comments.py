@@ -0,0 +1,182 @@
+"""Comments stored outside the meme item.
+
+Comments used to be appended to a ``comments`` list on the meme item, so
+the item grew with every comment, each /view read all of them, and a
+popular meme would eventually hit DynamoDB's 400 KB item limit. They now
+live in their own table keyed ``(meme_id, comment_id)`` where
+``comment_id`` is ``<created_at>#<suffix>``, so a query on one meme returns
+its comments in time order and pages with the usual opaque cursor.
+
+Adding a comment and bumping the meme's ``comment_count`` happen in one
+transaction that also checks the meme still exists.
+``scripts/migrate_comments.py`` moves comments embedded in old items over.
+
+``LocalCommentStore`` and ``SQLiteCommentStore`` keep the same layout in
+memory and in a ``comments`` table.
+"""
+import hashlib
+import threading
+import uuid
+
+from boto3.dynamodb.types import TypeSerializer
+
+from batch_get import low_level_client
+from pagination import OrderedIndex, encode_cursor
+
+_serializer = TypeSerializer()
+
+COMMENTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS comments (
+    meme_id TEXT NOT NULL,
+    comment_id TEXT NOT NULL,
+    user TEXT NOT NULL,
+    text TEXT NOT NULL,
+    ts TEXT NOT NULL,
+    PRIMARY KEY (meme_id, comment_id)
+);
+"""
+
+
+def new_comment_id(ts: str) -> str:
+    return f"{ts}#{uuid.uuid4().hex[:8]}"
+
+
+def legacy_comment_id(meme_id: str, position: int, comment: dict) -> str:
+    """Deterministic id for an embedded comment, so re-running the migration is harmless."""
+    digest = hashlib.sha1(f"{meme_id}|{position}|{comment.get('user')}|{comment.get('text')}".encode("utf-8"))
+    return f"{comment.get('ts', '')}#{digest.hexdigest()[:8]}"
+
+
+class LocalCommentStore:
+    """In-memory comments per meme, paged newest first like the table."""
+
+    def __init__(self, memes: dict):
+        self.memes = memes  # the memory meme store's items, whose "comment_count" is kept in step
+        self._index = OrderedIndex()  # {meme_id: [(comment_id, comment_id)]}
+        self._comments = {}  # {comment_id: comment}
+        self._lock = threading.Lock()
+
+    def add(self, meme_id: str, user: str, text: str, ts: str) -> dict:
+        item = self.memes.get(meme_id)
+        if item is None:
+            return None
+        comment = {"meme_id": meme_id, "comment_id": new_comment_id(ts), "user": user, "text": text, "ts": ts}
+        with self._lock:
+            self._comments[comment["comment_id"]] = comment
+            item["comment_count"] = item.get("comment_count", 0) + 1
+        self._index.add(meme_id, comment["comment_id"], comment["comment_id"])
+        return comment
+
+    def page(self, meme_id: str, limit: int, cursor: dict = None):
+        """Return ([comments newest first], next_cursor token)."""
+        ids, next_key = self._index.page(meme_id, limit, cursor)
+        return [self._comments[i] for i in ids if i in self._comments], encode_cursor(next_key)
+
+    def delete_all(self, meme_id: str):
+        ids, _ = self._index.page(meme_id, self._index.count(meme_id))
+        with self._lock:
+            for comment_id in ids:
+                self._comments.pop(comment_id, None)
+        for comment_id in ids:
+            self._index.remove(meme_id, comment_id, comment_id)
+
+
+class SQLiteCommentStore:
+    """Comments in the ``comments`` table, counted on the ``memes`` row in the same transaction."""
+
+    def __init__(self, db):
+        self.db = db
+        db.ensure_schema(COMMENTS_SCHEMA)
+
+    def add(self, meme_id: str, user: str, text: str, ts: str) -> dict:
+        """Store a comment and count it. Returns None if the meme does not exist."""
+        comment = {"meme_id": meme_id, "comment_id": new_comment_id(ts), "user": user, "text": text, "ts": ts}
+        with self.db.transaction() as conn:
+            if conn.execute("UPDATE memes SET comment_count = comment_count + 1 WHERE meme_id = ?", (meme_id,)).rowcount == 0:
+                return None
+            conn.execute(
+                "INSERT INTO comments (meme_id, comment_id, user, text, ts) VALUES (?, ?, ?, ?, ?)",
+                (meme_id, comment["comment_id"], user, text, ts)
+            )
+        return comment
+
+    def page(self, meme_id: str, limit: int, cursor: dict = None):
+        """Return ([comments newest first], next_cursor token)."""
+        sql = "SELECT * FROM comments WHERE meme_id = ?"
+        params = [meme_id]
+        if cursor:
+            sql += " AND comment_id < ?"
+            params.append(cursor.get("comment_id", ""))
+        rows = self.db.query(sql + " ORDER BY comment_id DESC LIMIT ?", params + [limit + 1])
+        comments = [dict(row) for row in rows[:limit]]
+        next_key = {"meme_id": meme_id, "comment_id": comments[-1]["comment_id"]} if len(rows) > limit else None
+        return comments, encode_cursor(next_key)
+
+    def delete_all(self, meme_id: str):
+        self.db.execute("DELETE FROM comments WHERE meme_id = ?", (meme_id,))
+
+
+class DynamoCommentStore:
+    """Comments in their own table (hash ``meme_id``, range ``comment_id``)."""
+
+    def __init__(self, table, memes_table_name: str, client=None):
+        self.table = table
+        self.memes_table_name = memes_table_name
+        self.client = client or low_level_client(table.meta.client)  # for the typed transaction
+
+    def add(self, meme_id: str, user: str, text: str, ts: str) -> dict:
+        """Store a comment and count it. Returns None if the meme does not exist."""
+        comment = {"meme_id": meme_id, "comment_id": new_comment_id(ts), "user": user, "text": text, "ts": ts}
+        client = self.client
+        try:
+            client.transact_write_items(TransactItems=[
+                {
+                    "Put": {
+                        "TableName": self.table.name,
+                        "Item": {k: _serializer.serialize(v) for k, v in comment.items()}
+                    }
+                },
+                {
+                    "Update": {
+                        "TableName": self.memes_table_name,
+                        "Key": {"meme_id": {"S": meme_id}},
+                        "UpdateExpression": "ADD comment_count :one",
+                        "ConditionExpression": "attribute_exists(meme_id)",
+                        "ExpressionAttributeValues": {":one": {"N": "1"}}
+                    }
+                }
+            ])
+        except client.exceptions.TransactionCanceledException as e:
+            reasons = [r.get("Code") for r in e.response.get("CancellationReasons", [])]
+            if "ConditionalCheckFailed" in reasons:
+                return None
+            raise
+        return comment
+
+    def page(self, meme_id: str, limit: int, cursor: dict = None):
+        """Return ([comments newest first], next_cursor token)."""
+        kwargs = {
+            "KeyConditionExpression": "meme_id = :m",
+            "ExpressionAttributeValues": {":m": meme_id},
+            "ScanIndexForward": False,
+            "Limit": limit
+        }
+        if cursor:
+            kwargs["ExclusiveStartKey"] = cursor
+        resp = self.table.query(**kwargs)
+        return resp.get("Items", []), encode_cursor(resp.get("LastEvaluatedKey"))
+
+    def delete_all(self, meme_id: str):
+        kwargs = {
+            "KeyConditionExpression": "meme_id = :m",
+            "ExpressionAttributeValues": {":m": meme_id},
+            "ProjectionExpression": "meme_id, comment_id"
+        }
+        with self.table.batch_writer() as batch:
+            while True:
+                resp = self.table.query(**kwargs)
+                for key in resp.get("Items", []):
+                    batch.delete_item(Key=key)
+                if "LastEvaluatedKey" not in resp:
+                    break
+                kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
@@ -0,0 +1,276 @@
+"""Write-behind counters for views, likes and downloads.
+
+Each hit used to be its own ``update_item ... ADD``, so a viral meme meant
+a hot partition and one write capacity unit per view. ``CounterBuffer``
+accumulates increments in memory per worker and a background thread
+flushes the coalesced deltas every ``flush_interval`` seconds: one write per
+meme per interval per worker, however many hits it received.
+
+Sinks:
+
+* ``DynamoCounterSink`` adds the deltas to the meme item itself
+  (conditional on the meme still existing, so deleted memes are not
+  recreated by a late flush).
+* ``ShardedDynamoCounterSink`` adds them to one of ``shards`` counter items
+  (``<meme_id>#<shard>``) in a separate table, picked per worker, so
+  several workers flushing the same meme hit different partitions. Totals
+  are the meme item's own counts plus the sum of its shards, and
+  ``delete`` removes the shards with the meme (a flush still pending in
+  another worker can write one back; it is only ever read by meme id).
+* ``SQLiteCounterSink`` and ``MemoryCounterSink`` add them to the meme's
+  row or dict for the other storage backends.
+
+Pending deltas are merged into items before rendering (``live_counts``), so
+a user sees their own view/like immediately even though it has not been
+written yet. Counts are approximate across workers until their next flush.
+``on_flush(item_id, deltas)`` is called after each successful write, so a
+cache of the items (``meme_cache.MemeCache.add_counts``) can add what was
+just written instead of going stale.
+"""
+import os
+import random
+import threading
+
+from batch_get import BatchGetter, low_level_client
+
+COUNTER_FIELDS = ("views", "likes", "downloads")
+
+
+class MemoryCounterSink:
+    """Adds deltas to the memory meme store's items."""
+
+    def __init__(self, items: dict):
+        self.items = items
+        self._lock = threading.Lock()
+
+    def apply(self, item_id: str, deltas: dict):
+        with self._lock:
+            item = self.items.get(item_id)
+            if item is None:
+                return
+            for field, delta in deltas.items():
+                item[field] = item.get(field, 0) + delta
+
+    def totals(self, item_ids: list) -> dict:
+        return {}
+
+    def delete(self, item_id: str):
+        pass  # counts live on the item
+
+
+class SQLiteCounterSink:
+    """Adds deltas to the count columns of the ``memes`` table."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def apply(self, item_id: str, deltas: dict):
+        fields = [f for f in sorted(deltas) if f in COUNTER_FIELDS]
+        if not fields:
+            return
+        self.db.execute(
+            f"UPDATE memes SET {', '.join(f'{f} = {f} + ?' for f in fields)} WHERE meme_id = ?",
+            [deltas[f] for f in fields] + [item_id]
+        )
+
+    def totals(self, item_ids: list) -> dict:
+        return {}
+
+    def delete(self, item_id: str):
+        pass  # counts live on the item
+
+
+class DynamoCounterSink:
+    """Adds deltas straight onto the items of ``table``."""
+
+    def __init__(self, table, key_name: str = "meme_id"):
+        self.table = table
+        self.key_name = key_name
+
+    def apply(self, item_id: str, deltas: dict):
+        names = {}
+        values = {}
+        adds = []
+        for i, (field, delta) in enumerate(sorted(deltas.items())):
+            names[f"#f{i}"] = field
+            values[f":d{i}"] = delta
+            adds.append(f"#f{i} :d{i}")
+        try:
+            self.table.update_item(
+                Key={self.key_name: item_id},
+                UpdateExpression="ADD " + ", ".join(adds),
+                ConditionExpression=f"attribute_exists({self.key_name})",
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values
+            )
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            pass  # item deleted since the hits were counted
+
+    def totals(self, item_ids: list) -> dict:
+        """Counts held outside the items themselves (none for this sink)."""
+        return {}
+
+    def delete(self, item_id: str):
+        """Drop counts held outside the item (none for this sink)."""
+
+
+class ShardedDynamoCounterSink:
+    """Spreads deltas over ``shards`` counter items in ``table`` (key ``counter_id``)."""
+
+    def __init__(self, table, shards: int = 8, batch_getter: BatchGetter = None):
+        self.table = table
+        self.shards = max(1, int(shards))
+        self.batch_getter = batch_getter or BatchGetter(low_level_client(table.meta.client))
+        self._shard = None
+        self._pid = None
+
+    def _worker_shard(self) -> int:
+        # One shard per worker process keeps each worker's writes on one item
+        if self._pid != os.getpid():
+            self._shard = random.randrange(self.shards)
+            self._pid = os.getpid()
+        return self._shard
+
+    def apply(self, item_id: str, deltas: dict):
+        names = {}
+        values = {":id": item_id}
+        adds = []
+        for i, (field, delta) in enumerate(sorted(deltas.items())):
+            names[f"#f{i}"] = field
+            values[f":d{i}"] = delta
+            adds.append(f"#f{i} :d{i}")
+        self.table.update_item(
+            Key={"counter_id": f"{item_id}#{self._worker_shard()}"},
+            UpdateExpression="SET item_id = :id ADD " + ", ".join(adds),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+
+    def totals(self, item_ids: list) -> dict:
+        """Sum the shards of each item: {item_id: {field: count}}."""
+        keys = [{"counter_id": {"S": f"{item_id}#{s}"}} for item_id in dict.fromkeys(item_ids) for s in range(self.shards)]
+        totals = {}
+        for row in self.batch_getter.get(self.table.name, keys):
+            item_id = row["counter_id"]["S"].rsplit("#", 1)[0]
+            counts = totals.setdefault(item_id, {})
+            for field in COUNTER_FIELDS:
+                if field in row:
+                    counts[field] = counts.get(field, 0) + int(row[field]["N"])
+        return totals
+
+    def delete(self, item_id: str):
+        """Delete every shard of a deleted item."""
+        with self.table.batch_writer() as batch:
+            for s in range(self.shards):
+                batch.delete_item(Key={"counter_id": f"{item_id}#{s}"})
+
+
+class CounterBuffer:
+    """Per-worker accumulator of counter increments with a background flusher.
+
+    The flusher thread is started lazily and restarted after a fork, like
+    ``jobs.JobWorkerPool``; deltas buffered before a fork stay with the
+    parent.
+    """
+
+    def __init__(self, sink, flush_interval: float = 5.0, on_flush=None):
+        self.sink = sink
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self._pending = {}  # {item_id: {field: delta}}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.increments = 0
+        self.writes = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            if self._pid is not None:
+                self._pending = {}
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="counter-flusher", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def incr(self, item_id: str, field: str, amount: int = 1):
+        self._ensure_started()
+        with self._lock:
+            deltas = self._pending.setdefault(item_id, {})
+            deltas[field] = deltas.get(field, 0) + amount
+            self.increments += 1
+
+    def pending(self, item_id: str) -> dict:
+        with self._lock:
+            return dict(self._pending.get(item_id, {}))
+
+    def discard(self, item_id: str):
+        """Forget unflushed deltas for an item (e.g. it was deleted)."""
+        with self._lock:
+            self._pending.pop(item_id, None)
+
+    def live_counts(self, items: list) -> list:
+        """Copies of ``items`` with sink-side totals and pending deltas added."""
+        totals = {}
+        try:
+            totals = self.sink.totals([item["meme_id"] for item in items])
+        except Exception as e:
+            print(f"Counter read error: {e}")
+        with self._lock:
+            merged = []
+            for item in items:
+                extra = dict(totals.get(item["meme_id"], {}))
+                for field, delta in self._pending.get(item["meme_id"], {}).items():
+                    extra[field] = extra.get(field, 0) + delta
+                merged.append(dict(item, **{f: int(item.get(f, 0)) + d for f, d in extra.items()}))
+        return merged
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Write every pending delta now (one write per item)."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            for item_id, deltas in batch.items():
+                deltas = {f: d for f, d in deltas.items() if d}
+                if not deltas:
+                    continue
+                try:
+                    self.sink.apply(item_id, deltas)
+                    self.writes += 1
+                except Exception as e:
+                    self.failed += 1
+                    print(f"Counter flush error for {item_id}: {e}")
+                    # Keep the deltas for the next flush
+                    with self._lock:
+                        pending = self._pending.setdefault(item_id, {})
+                        for field, delta in deltas.items():
+                            pending[field] = pending.get(field, 0) + delta
+                    continue
+                if self.on_flush is not None:
+                    self.on_flush(item_id, deltas)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=5)
+        self._thread = None
+        self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending_items": len(self._pending),
+            "increments": self.increments,
+            "writes": self.writes,
+            "failed": self.failed,
+        }
@@ -0,0 +1,36 @@
+"""Gunicorn settings for app.py (``gunicorn -c gunicorn.conf.py app:app``).
+
+The worker class and counts come from WEB_WORKER_CLASS, WEB_WORKERS,
+WEB_THREADS and WEB_WORKER_CONNECTIONS (see serving.py and .env.example);
+bind and log paths stay on the command line. deployments/SIZING.md has
+the measurements behind the defaults.
+"""
+import os
+
+import serving
+
+worker_class = serving.worker_class()
+workers = serving.workers()
+if worker_class == "gthread":
+    threads = serving.threads()
+if worker_class == "gevent":
+    worker_connections = serving.worker_connections()
+
+# The app is imported in each worker, never in the arbiter: a gevent
+# worker has to patch the stdlib before boto3/ssl are imported, and the
+# app's background threads (activity/counter flushers, index loaders) would
+# not survive the fork anyway
+preload_app = False
+
+# Idle keep-alive connections from the load balancer (the ALB keeps them
+# for 60s); sync workers ignore this
+keepalive = int(os.environ.get("WEB_KEEPALIVE", "65"))
+timeout = int(os.environ.get("WEB_TIMEOUT", "30"))
+graceful_timeout = int(os.environ.get("WEB_GRACEFUL_TIMEOUT", "30"))
+
+
+def on_starting(server):
+    if worker_class == "gevent" and os.environ.get("STORAGE_BACKEND", "memory").lower() == "sqlite":
+        # sqlite3 calls do not yield, and a write waiting on the lock stalls
+        # every greenlet in the worker for up to SQLITE_BUSY_TIMEOUT
+        print("Warning: gevent workers block on SQLite; gthread suits STORAGE_BACKEND=sqlite better")
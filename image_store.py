@@ -0,0 +1,339 @@
+"""Image storage backends and a presigned URL cache.
+
+``S3ImageStore`` keeps uploads in the meme bucket and hands out presigned
+GET URLs; ``LocalImageStore`` writes them under a local directory and
+serves them through the app's ``/media/<key>`` route. Keys are content
+addressed (``memes/<sha256><ext>``) so identical uploads share one object.
+
+Uploads are written with ``put_stream()``, which copies the request stream
+to storage in chunks while hashing it, so a worker never holds the whole
+image in memory (S3 uploads larger than one part use multipart upload).
+The hash also bounds the size: ``max_bytes`` is checked chunk by chunk.
+Once the hash is known, a key that already exists is not written again.
+
+Signing a URL is cheap but not free, and a feed page renders many of them,
+so ``PresignedUrlCache`` reuses a URL until it gets close to expiry.
+"""
+import hashlib
+import os
+import time
+import uuid
+
+from analysis_cache import LRUCache
+
+CHUNK_SIZE = 256 * 1024
+# S3 requires every multipart part except the last to be at least 5 MB
+S3_PART_SIZE = 5 * 1024 * 1024
+
+CONTENT_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+}
+
+
+def image_key_for(digest: str, filename: str = "") -> str:
+    """Content-addressed storage key for an upload."""
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext not in CONTENT_TYPES:
+        ext = ""
+    return f"memes/{digest}{ext}"
+
+
+def content_type_for(key: str) -> str:
+    return CONTENT_TYPES.get(os.path.splitext(key)[1].lower(), "application/octet-stream")
+
+
+class UploadTooLarge(Exception):
+    """Raised by ``put_stream()`` as soon as the stream passes ``max_bytes``."""
+
+
+def _read_chunks(stream, max_bytes: int, sha):
+    """Yield chunks from ``stream``, hashing them and enforcing ``max_bytes``."""
+    size = 0
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        size += len(chunk)
+        if max_bytes and size > max_bytes:
+            raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+        sha.update(chunk)
+        yield chunk
+
+
+def _seekable(stream) -> bool:
+    try:
+        return stream.seekable()
+    except AttributeError:
+        return hasattr(stream, "seek") and hasattr(stream, "tell")
+
+
+def _iter_parts(first: bytearray, chunks, part_size: int):
+    """Regroup a chunk iterator into multipart bodies of at least ``part_size``."""
+    yield first
+    buf = bytearray()
+    for chunk in chunks:
+        buf += chunk
+        if len(buf) >= part_size:
+            yield buf
+            buf = bytearray()
+    if buf:
+        yield buf
+
+
+class LocalImageStore:
+    """Filesystem backend; URLs point at the app's /media route.
+
+    Partial files are written to ``incoming_dir`` (by default a sibling of
+    ``root``, so on the same filesystem) and renamed into place, so /media
+    never serves an incomplete upload.
+    """
+
+    def __init__(self, root: str, url_prefix: str = "/media", incoming_dir: str = None):
+        self.root = os.path.abspath(root)
+        self.url_prefix = url_prefix.rstrip("/")
+        self.incoming_dir = os.path.abspath(
+            incoming_dir or os.path.join(os.path.dirname(self.root), f".{os.path.basename(self.root)}-incoming")
+        )
+        os.makedirs(self.root, exist_ok=True)
+        os.makedirs(self.incoming_dir, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid image key: {key}")
+        return path
+
+    def put(self, key: str, data: bytes, content_type: str = None):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = os.path.join(self.incoming_dir, f"{uuid.uuid4()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def put_stream(self, stream, key_fn, max_bytes: int = None, content_type: str = None):
+        """
+        Copy ``stream`` to disk in chunks. The final key is ``key_fn(sha256)``;
+        if that file already exists the copy is discarded. Returns (key, digest, size).
+        """
+        tmp = os.path.join(self.incoming_dir, f"{uuid.uuid4()}.tmp")
+        sha = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp, "wb") as f:
+                for chunk in _read_chunks(stream, max_bytes, sha):
+                    f.write(chunk)
+                    size += len(chunk)
+            key = key_fn(sha.hexdigest())
+            path = self.path(key)
+            if os.path.exists(path):
+                os.remove(tmp)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return key, sha.hexdigest(), size
+
+    def open(self, key: str):
+        return open(self.path(key), "rb")
+
+    def get(self, key: str):
+        try:
+            with open(self.path(key), "rb") as f:
+                return f.read()
+        except (OSError, ValueError):
+            return None
+
+    def exists(self, key: str) -> bool:
+        try:
+            return os.path.exists(self.path(key))
+        except ValueError:
+            return False
+
+    def delete(self, key: str):
+        try:
+            os.remove(self.path(key))
+        except (OSError, ValueError):
+            pass
+
+    def generate_url(self, key: str, expires_in: int, download: bool = False) -> str:
+        url = f"{self.url_prefix}/{key}"
+        return f"{url}?download=1" if download else url
+
+
+class S3ImageStore:
+    """S3 backend; URLs are presigned GETs."""
+
+    def __init__(self, client, bucket: str):
+        self.client = client
+        self.bucket = bucket
+
+    def put(self, key: str, data: bytes, content_type: str = None):
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=key,
+            Body=data,
+            ContentType=content_type or content_type_for(key)
+        )
+
+    def put_stream(self, stream, key_fn, max_bytes: int = None, content_type: str = None,
+                   part_size: int = S3_PART_SIZE):
+        """
+        Copy ``stream`` to S3 at ``key_fn(sha256)``. Returns (key, digest, size).
+
+        Seekable streams (werkzeug spools uploads to a temporary file) are
+        hashed in one pass and then sent straight to their final key, either
+        as a put_object that botocore reads from the file or as a multipart
+        upload holding one part in memory at a time. Other streams are staged
+        part by part under incoming/ and copied once the hash is known. An
+        existing key is not written again (one HEAD request per upload).
+        """
+        sha = hashlib.sha256()
+        if _seekable(stream):
+            start = stream.tell()
+            size = sum(len(chunk) for chunk in _read_chunks(stream, max_bytes, sha))
+            key = key_fn(sha.hexdigest())
+            if self.exists(key):
+                return key, sha.hexdigest(), size
+            stream.seek(start)
+            if size <= part_size:
+                self.client.put_object(
+                    Bucket=self.bucket,
+                    Key=key,
+                    Body=stream,
+                    ContentType=content_type or content_type_for(key)
+                )
+            else:
+                self._multipart_upload(key, iter(lambda: stream.read(part_size), b""), content_type)
+            return key, sha.hexdigest(), size
+
+        chunks = _read_chunks(stream, max_bytes, sha)
+        first = bytearray()
+        for chunk in chunks:
+            first += chunk
+            if len(first) >= part_size:
+                break
+        if len(first) < part_size:
+            key = key_fn(sha.hexdigest())
+            if not self.exists(key):
+                self.put(key, first, content_type)
+            return key, sha.hexdigest(), len(first)
+
+        tmp_key = f"incoming/{uuid.uuid4()}"
+        size = self._multipart_upload(tmp_key, _iter_parts(first, chunks, part_size), content_type)
+        key = key_fn(sha.hexdigest())
+        if not self.exists(key):
+            self.client.copy_object(
+                Bucket=self.bucket,
+                Key=key,
+                CopySource={"Bucket": self.bucket, "Key": tmp_key},
+                ContentType=content_type or content_type_for(key),
+                MetadataDirective="REPLACE"
+            )
+        self.client.delete_object(Bucket=self.bucket, Key=tmp_key)
+        return key, sha.hexdigest(), size
+
+    def _multipart_upload(self, key: str, parts, content_type: str = None) -> int:
+        """Upload an iterable of part bodies as one object. Returns the total size."""
+        upload_id = self.client.create_multipart_upload(
+            Bucket=self.bucket,
+            Key=key,
+            ContentType=content_type or content_type_for(key)
+        )["UploadId"]
+        done = []
+        size = 0
+        try:
+            # No enumerate(): its result tuple would keep the previous part alive
+            number = 0
+            for body in parts:
+                number += 1
+                resp = self.client.upload_part(
+                    Bucket=self.bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                    PartNumber=number,
+                    Body=body
+                )
+                done.append({"ETag": resp["ETag"], "PartNumber": number})
+                size += len(body)
+                body = None  # release this part before the next one is read
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": done}
+            )
+        except BaseException:
+            try:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            except Exception as e:
+                print(f"S3 abort multipart error: {e}")
+            raise
+        return size
+
+    def rekognition_image(self, key: str) -> dict:
+        """Rekognition Image argument that reads the object straight from S3."""
+        return {"S3Object": {"Bucket": self.bucket, "Name": key}}
+
+    def get(self, key: str):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+        except Exception as e:
+            print(f"S3 get error: {e}")
+            return None
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except Exception:
+            return False
+
+    def delete(self, key: str):
+        try:
+            self.client.delete_object(Bucket=self.bucket, Key=key)
+        except Exception as e:
+            print(f"S3 delete error: {e}")
+
+    def generate_url(self, key: str, expires_in: int, download: bool = False) -> str:
+        params = {"Bucket": self.bucket, "Key": key}
+        if download:
+            params["ResponseContentDisposition"] = f'attachment; filename="{os.path.basename(key)}"'
+        return self.client.generate_presigned_url("get_object", Params=params, ExpiresIn=expires_in)
+
+
+class PresignedUrlCache:
+    """Reuses signed URLs until less than ``refresh_margin`` of their lifetime is left."""
+
+    def __init__(self, store, expiration: int = 3600, refresh_margin: float = 0.25, maxsize: int = 10000):
+        self.store = store
+        self.expiration = expiration
+        self.min_remaining = expiration * refresh_margin
+        self._urls = LRUCache(maxsize)
+        self.hits = 0
+        self.misses = 0
+
+    def url(self, key: str, download: bool = False) -> str:
+        if not key:
+            return None
+        cache_key = (key, download)
+        cached = self._urls.get(cache_key)
+        now = time.time()
+        if cached is not None and cached[1] - now > self.min_remaining:
+            self.hits += 1
+            return cached[0]
+        self.misses += 1
+        url = self.store.generate_url(key, self.expiration, download=download)
+        self._urls.put(cache_key, (url, now + self.expiration))
+        return url
+
+    def invalidate(self, key: str):
+        self._urls.pop((key, False))
+        self._urls.pop((key, True))
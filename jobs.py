@@ -0,0 +1,183 @@
+"""Background job queue and worker pool for the upload pipeline.
+
+Uploads enqueue an analysis job and return straight away; a small pool of
+daemon worker threads picks jobs off the queue and runs the (slow)
+moderation / label / text detection step, then writes the result back to
+the meme record.
+
+The queue backend is pluggable. ``LocalJobQueue`` is an in-process FIFO
+used by both apps by default and in tests, so the pipeline works without
+any AWS resources.
+
+A job whose handler raises is retried up to ``max_attempts`` times and
+then passed to ``on_failure``, so the caller can record it rather than
+leave it waiting forever. Jobs still queued when the process exits are
+lost with the queue; ``close()`` gives the workers a little time to finish
+them first, and the caller is expected to find and re-submit the rest.
+``HostLock`` lets one worker process per machine do that re-submitting.
+"""
+import os
+import queue
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no gunicorn workers to coordinate
+    fcntl = None
+
+
+class HostLock:
+    """Non-blocking lock on a file, held by one process on the machine until it exits.
+
+    The OS releases it when the holder dies, so the next ``acquire()`` in
+    another process takes over. Without fcntl every process gets it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._pid = None
+
+    def acquire(self) -> bool:
+        if self._file is not None and self._pid == os.getpid():
+            return True
+        if fcntl is None:
+            return True
+        f = open(self.path, "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        self._pid = os.getpid()
+        return True
+
+
+class LocalJobQueue:
+    """In-process FIFO job queue backed by ``queue.Queue``."""
+
+    def __init__(self, maxsize: int = 0):
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def put(self, job: dict):
+        self._queue.put(job)
+
+    def get(self, timeout: float = None):
+        """Return the next job, or None if nothing arrived within ``timeout``."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def task_done(self):
+        self._queue.task_done()
+
+    def join(self, timeout: float = None) -> bool:
+        """Wait until every job put has been processed. False if ``timeout`` ran out first."""
+        done = self._queue.all_tasks_done
+        with done:
+            return done.wait_for(lambda: not self._queue.unfinished_tasks, timeout)
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+
+class JobWorkerPool:
+    """Fixed-size pool of daemon threads that feed jobs to ``handler``.
+
+    Threads are started lazily on the first ``submit()`` and restarted if
+    the process has forked since (gunicorn imports the app in the master
+    and forks workers, and threads do not survive a fork).
+    """
+
+    def __init__(self, handler, job_queue=None, workers: int = 2, name: str = "jobs", max_attempts: int = 1,
+                 retry_delay: float = 1.0, on_failure=None):
+        self.handler = handler
+        self.queue = job_queue or LocalJobQueue()
+        self.workers = max(1, int(workers))
+        self.name = name
+        self.max_attempts = max(1, int(max_attempts))
+        self.retry_delay = retry_delay
+        self.on_failure = on_failure  # on_failure(job, error) once the last attempt has failed
+        self.retries = 0
+        self.failed = 0
+        self._threads = []
+        self._pid = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._pid == os.getpid() and self._threads:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._threads:
+                return
+            self._stop.clear()
+            self._threads = []
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+            self._pid = os.getpid()
+
+    def _run(self):
+        while not self._stop.is_set():
+            job = self.queue.get(timeout=0.5)
+            if job is None:
+                continue
+            try:
+                self.handler(job)
+            except Exception as e:
+                self._handle_error(job, e)
+            finally:
+                self.queue.task_done()
+
+    def _handle_error(self, job: dict, error: Exception):
+        attempts = job.get("attempts", 1)
+        if attempts < self.max_attempts:
+            print(f"Job {self.name} error (attempt {attempts} of {self.max_attempts}, retrying): {error}")
+            self.retries += 1
+            time.sleep(self.retry_delay * attempts)
+            self.queue.put(dict(job, attempts=attempts + 1))
+            return
+        print(f"Job {self.name} failed after {attempts} attempt(s): {error}")
+        self.failed += 1
+        if self.on_failure is not None:
+            try:
+                self.on_failure(job, error)
+            except Exception as e:
+                print(f"Job {self.name} failure handler error: {e}")
+
+    def submit(self, job: dict):
+        """Queue a job for background processing."""
+        self._ensure_started()
+        self.queue.put(job)
+
+    def drain(self, timeout: float = None) -> bool:
+        """Block until every queued job has been processed (False if ``timeout`` ran out first)."""
+        return self.queue.join(timeout)
+
+    def stop(self, wait: bool = True):
+        self._stop.set()
+        if wait:
+            for t in self._threads:
+                t.join(timeout=5)
+        self._threads = []
+        self._pid = None
+
+    def close(self, timeout: float = 10.0):
+        """Give the workers up to ``timeout`` seconds to finish the queue, then stop them (at exit)."""
+        if self._pid != os.getpid() or not self._threads:
+            return
+        if not self.drain(timeout):
+            print(f"Job {self.name}: {self.queue.qsize()} job(s) still queued at exit")
+        self.stop()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(),
+            "retries": self.retries,
+            "failed": self.failed,
+        }
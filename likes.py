@@ -0,0 +1,237 @@
+"""Idempotent likes.
+
+A like is a ``(meme_id, user)`` row in the MemeLikes table. ``like()`` and
+``unlike()`` write that row and move the meme's ``likes`` count in one
+``transact_write_items`` call, with conditions on the row, so refreshing
+/like or double-submitting never counts twice and the count never drifts
+from the rows. Both return False when there was nothing to change.
+
+``LocalLikeStore`` has the same API over in-memory sets, and
+``SQLiteLikeStore`` over a ``likes`` table updated in one SQLite
+transaction with the meme's count.
+
+``LikedCache`` remembers, per logged-in user, which memes they have or
+have not liked, so a feed page needs at most one ``batch_get_item`` for the
+memes it has not seen before instead of a ``get_item`` per card.
+"""
+import threading
+from datetime import datetime
+
+from analysis_cache import LRUCache
+from batch_get import BatchGetter
+from sqlite_db import json_ids
+
+LIKES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS likes (
+    meme_id TEXT NOT NULL,
+    user TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (meme_id, user)
+);
+CREATE INDEX IF NOT EXISTS likes_by_user ON likes (user, meme_id);
+"""
+
+
+def _now_iso() -> str:
+    return datetime.utcnow().isoformat()
+
+
+class LocalLikeStore:
+    """Likes kept as a set of (meme_id, user) pairs, indexed both ways."""
+
+    def __init__(self, memes: dict):
+        self.memes = memes  # the memory meme store's items, whose "likes" counts are kept in step
+        self._by_meme = {}  # {meme_id: {user}}
+        self._by_user = {}  # {user: {meme_id}}
+        self._lock = threading.Lock()
+
+    def like(self, meme_id: str, user: str) -> bool:
+        with self._lock:
+            if meme_id not in self.memes or user in self._by_meme.get(meme_id, ()):
+                return False
+            self._by_meme.setdefault(meme_id, set()).add(user)
+            self._by_user.setdefault(user, set()).add(meme_id)
+            self.memes[meme_id]["likes"] = self.memes[meme_id].get("likes", 0) + 1
+            return True
+
+    def unlike(self, meme_id: str, user: str) -> bool:
+        with self._lock:
+            users = self._by_meme.get(meme_id)
+            if not users or user not in users:
+                return False
+            users.discard(user)
+            self._by_user.get(user, set()).discard(meme_id)
+            if meme_id in self.memes:
+                self.memes[meme_id]["likes"] = max(0, self.memes[meme_id].get("likes", 0) - 1)
+            return True
+
+    def liked(self, user: str, meme_ids: list) -> set:
+        """The subset of ``meme_ids`` that ``user`` has liked."""
+        with self._lock:
+            return self._by_user.get(user, set()).intersection(meme_ids)
+
+    def remove_meme(self, meme_id: str):
+        with self._lock:
+            for user in self._by_meme.pop(meme_id, set()):
+                self._by_user.get(user, set()).discard(meme_id)
+
+
+class SQLiteLikeStore:
+    """Likes in the ``likes`` table, counted on the ``memes`` row in the same transaction."""
+
+    def __init__(self, db):
+        self.db = db
+        db.ensure_schema(LIKES_SCHEMA)
+
+    def like(self, meme_id: str, user: str) -> bool:
+        with self.db.transaction() as conn:
+            if conn.execute("SELECT 1 FROM memes WHERE meme_id = ?", (meme_id,)).fetchone() is None:
+                return False
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO likes (meme_id, user, created_at) VALUES (?, ?, ?)",
+                (meme_id, user, _now_iso())
+            ).rowcount
+            if inserted:
+                conn.execute("UPDATE memes SET likes = likes + 1 WHERE meme_id = ?", (meme_id,))
+        return bool(inserted)
+
+    def unlike(self, meme_id: str, user: str) -> bool:
+        with self.db.transaction() as conn:
+            deleted = conn.execute("DELETE FROM likes WHERE meme_id = ? AND user = ?", (meme_id, user)).rowcount
+            if deleted:
+                conn.execute("UPDATE memes SET likes = MAX(0, likes - 1) WHERE meme_id = ?", (meme_id,))
+        return bool(deleted)
+
+    def liked(self, user: str, meme_ids: list) -> set:
+        """The subset of ``meme_ids`` that ``user`` has liked."""
+        rows = self.db.query(
+            "SELECT meme_id FROM likes WHERE user = ? AND meme_id IN (SELECT value FROM json_each(?))",
+            (user, json_ids(dict.fromkeys(meme_ids)))
+        )
+        return {row["meme_id"] for row in rows}
+
+    def remove_meme(self, meme_id: str):
+        self.db.execute("DELETE FROM likes WHERE meme_id = ?", (meme_id,))
+
+
+class DynamoLikeStore:
+    """Likes in the MemeLikes table, counted on the meme item transactionally."""
+
+    def __init__(self, client, likes_table: str, memes_table: str, batch_getter: BatchGetter = None):
+        self.client = client
+        self.likes_table = likes_table
+        self.memes_table = memes_table
+        self.batch_getter = batch_getter or BatchGetter(client)  # client must be a low_level_client()
+
+    def _transact(self, meme_id: str, like_op: dict, delta: int) -> bool:
+        try:
+            self.client.transact_write_items(TransactItems=[
+                like_op,
+                {
+                    "Update": {
+                        "TableName": self.memes_table,
+                        "Key": {"meme_id": {"S": meme_id}},
+                        "UpdateExpression": "ADD likes :d",
+                        "ConditionExpression": "attribute_exists(meme_id)",
+                        "ExpressionAttributeValues": {":d": {"N": str(delta)}}
+                    }
+                }
+            ])
+        except self.client.exceptions.TransactionCanceledException as e:
+            # Already liked / not liked, or the meme is gone: nothing changed
+            reasons = [r.get("Code") for r in e.response.get("CancellationReasons", [])]
+            if any(code not in ("None", "ConditionalCheckFailed", None) for code in reasons):
+                raise
+            return False
+        return True
+
+    def like(self, meme_id: str, user: str) -> bool:
+        return self._transact(meme_id, {
+            "Put": {
+                "TableName": self.likes_table,
+                "Item": {"meme_id": {"S": meme_id}, "user": {"S": user}, "created_at": {"S": _now_iso()}},
+                "ConditionExpression": "attribute_not_exists(#u)",
+                "ExpressionAttributeNames": {"#u": "user"}
+            }
+        }, 1)
+
+    def unlike(self, meme_id: str, user: str) -> bool:
+        return self._transact(meme_id, {
+            "Delete": {
+                "TableName": self.likes_table,
+                "Key": {"meme_id": {"S": meme_id}, "user": {"S": user}},
+                "ConditionExpression": "attribute_exists(#u)",
+                "ExpressionAttributeNames": {"#u": "user"}
+            }
+        }, -1)
+
+    def liked(self, user: str, meme_ids: list) -> set:
+        """The subset of ``meme_ids`` that ``user`` has liked (batch_get_item, 100 keys a call)."""
+        keys = [{"meme_id": {"S": meme_id}, "user": {"S": user}} for meme_id in dict.fromkeys(meme_ids)]
+        return {row["meme_id"]["S"] for row in self.batch_getter.get(self.likes_table, keys, projection="meme_id")}
+
+    def remove_meme(self, meme_id: str):
+        """Delete a meme's like rows (25 per BatchWriteItem)."""
+        kwargs = {
+            "TableName": self.likes_table,
+            "KeyConditionExpression": "meme_id = :m",
+            "ExpressionAttributeValues": {":m": {"S": meme_id}},
+            "ProjectionExpression": "meme_id, #u",
+            "ExpressionAttributeNames": {"#u": "user"}
+        }
+        while True:
+            resp = self.client.query(**kwargs)
+            keys = resp.get("Items", [])
+            for start in range(0, len(keys), 25):
+                request = {self.likes_table: [{"DeleteRequest": {"Key": key}} for key in keys[start:start + 25]]}
+                while request:
+                    request = self.client.batch_write_item(RequestItems=request).get("UnprocessedItems") or None
+            if "LastEvaluatedKey" not in resp:
+                return
+            kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+
+class LikedCache:
+    """Per-user memo of liked / not-liked memes in front of a like store."""
+
+    def __init__(self, store, max_users: int = 10000):
+        self.store = store
+        self._users = LRUCache(max_users)  # {user: {meme_id: bool}}
+        self.lookups = 0
+
+    def liked(self, user: str, meme_ids: list) -> set:
+        known = self._users.get(user)
+        if known is None:
+            known = {}
+            self._users.put(user, known)
+        missing = [m for m in meme_ids if m not in known]
+        if missing:
+            self.lookups += 1
+            try:
+                found = self.store.liked(user, missing)
+            except Exception as e:
+                print(f"Like lookup error: {e}")
+                return {m for m in meme_ids if known.get(m)}
+            for meme_id in missing:
+                known[meme_id] = meme_id in found
+        return {m for m in meme_ids if known.get(m)}
+
+    def set(self, user: str, meme_id: str, liked: bool):
+        known = self._users.get(user)
+        if known is None:
+            known = {}
+            self._users.put(user, known)
+        known[meme_id] = liked
+
+    def known(self, user: str, meme_ids: list) -> dict:
+        """{meme_id: liked} for those of ``meme_ids`` already looked up for ``user``."""
+        known = self._users.get(user) or {}
+        return {m: known[m] for m in meme_ids if m in known}
+
+    def forget(self, user: str):
+        self._users.pop(user)
+
+    def with_liked(self, user: str, items: list) -> list:
+        """Copies of ``items`` with ``liked`` set for ``user``."""
+        liked = self.liked(user, [item["meme_id"] for item in items])
+        return [dict(item, liked=item["meme_id"] in liked) for item in items]
@@ -0,0 +1,215 @@
+"""Read-through cache of meme items.
+
+A meme's metadata barely changes after upload, yet ``/view``, ``/download``
+and ``/delete`` each fetched it again. ``MemeCache`` sits in front of the
+memes store with two tiers:
+
+* a per-worker LRU whose entries expire after ``ttl`` seconds, and
+* an optional shared tier (``shared``) every worker and instance reads,
+  with its own ``shared_ttl``: ``RedisMemeTier`` over any client speaking
+  the Redis protocol (Redis, Valkey, a local ``redis-server`` or fakeredis),
+  or ``DictMemeTier``, an in-process stand-in for development and benchmarks.
+
+Invalidation is explicit, like ``LikedCache.set``: app.py calls
+``invalidate`` after a comment, a delete or a moderation result, and
+``add_counts`` with the deltas of a like or a counter flush, which are
+merged into the cached copy (and drop the shared copy, so the next miss
+reloads the stored totals). Invalidations only reach this worker's LRU and
+the shared tier; another worker's LRU can serve its copy until ``ttl``
+runs out, so ``ttl`` is the bound on cross-worker staleness.
+"""
+import json
+import threading
+import time
+from decimal import Decimal
+
+from analysis_cache import LRUCache
+
+
+def _json_default(value):
+    # DynamoDB numbers come back as Decimal
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class DictMemeTier:
+    """Shared-tier stand-in that lives for the process lifetime.
+
+    Stores the same JSON strings with the same expiry as ``RedisMemeTier``,
+    so the serialisation path is exercised without a server.
+    """
+
+    def __init__(self):
+        self._data = {}  # {key: (expires_at, value)}
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: list) -> list:
+        now = time.monotonic()
+        with self._lock:
+            values = []
+            for key in keys:
+                entry = self._data.get(key)
+                if entry is not None and entry[0] <= now:
+                    del self._data[key]
+                    entry = None
+                values.append(entry[1] if entry else None)
+            return values
+
+    def set(self, key: str, value: str, ttl: float):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class RedisMemeTier:
+    """Shared tier on a Redis-protocol client (``redis.Redis`` or compatible)."""
+
+    def __init__(self, client, prefix: str = "meme:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get_many(self, keys: list) -> list:
+        return self.client.mget([self.prefix + key for key in keys])
+
+    def set(self, key: str, value: str, ttl: float):
+        self.client.set(self.prefix + key, value, ex=max(1, int(ttl)))
+
+    def delete(self, key: str):
+        self.client.delete(self.prefix + key)
+
+
+class MemeCache:
+    """Two-tier (LRU + shared) read-through cache in front of a memes store.
+
+    ``maxsize=0`` turns caching off: every read goes to the store.
+    """
+
+    def __init__(self, store, shared=None, maxsize: int = 2048, ttl: float = 30.0, shared_ttl: float = 300.0):
+        self.store = store
+        self.shared = shared
+        self.enabled = maxsize > 0
+        self.lru = LRUCache(max(1, maxsize))  # {meme_id: (expires_at, item)}
+        self.ttl = ttl
+        self.shared_ttl = shared_ttl
+        # Bumped by every invalidation: a load that started before one is
+        # returned but not cached (in either tier), so it cannot put back
+        # what was just dropped
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    def get(self, meme_id: str):
+        """The meme item (a copy), or None if it does not exist."""
+        items = self.get_many([meme_id])
+        return items[0] if items else None
+
+    def get_many(self, meme_ids: list) -> list:
+        """The found items of ``meme_ids``, in the order given (like the store's ``get_many``)."""
+        if not self.enabled:
+            return self.store.get_many(meme_ids)
+        found = {}
+        missing = []
+        now = time.monotonic()
+        for meme_id in dict.fromkeys(meme_ids):
+            entry = self.lru.get(meme_id)
+            if entry is not None and entry[0] > now:
+                found[meme_id] = entry[1]
+                self.hits += 1
+                continue
+            if entry is not None:
+                self.expired += 1
+            missing.append(meme_id)
+
+        if missing:
+            generation = self._generation
+            from_shared = self._shared_get(missing)
+            self.shared_hits += len(from_shared)
+            from_store = [m for m in missing if m not in from_shared]
+            loaded = {}
+            if from_store:
+                self.misses += len(from_store)
+                loaded = {item["meme_id"]: item for item in self.store.get_many(from_store)}
+            with self._lock:
+                current = generation == self._generation
+                if current:
+                    for meme_id, item in list(from_shared.items()) + list(loaded.items()):
+                        self.lru.put(meme_id, (now + self.ttl, item))
+            if current:
+                for item in loaded.values():
+                    self._shared_set(item)
+            found.update(from_shared)
+            found.update(loaded)
+        return [dict(found[m]) for m in meme_ids if m in found]
+
+    def invalidate(self, meme_id: str):
+        """Drop the meme from this worker's LRU and the shared tier."""
+        with self._lock:
+            self._generation += 1
+            self.lru.pop(meme_id)
+        self.invalidations += 1
+        self._shared_delete(meme_id)
+
+    def add_counts(self, meme_id: str, deltas: dict):
+        """Merge counter deltas already written to the store into the cached copy."""
+        with self._lock:
+            self._generation += 1
+            entry = self.lru.get(meme_id)
+            if entry is not None:
+                expires_at, item = entry
+                merged = dict(item, **{f: int(item.get(f, 0)) + d for f, d in deltas.items()})
+                self.lru.put(meme_id, (expires_at, merged))
+        self._shared_delete(meme_id)
+
+    def _shared_get(self, meme_ids: list) -> dict:
+        if self.shared is None:
+            return {}
+        try:
+            values = self.shared.get_many(meme_ids)
+        except Exception as e:
+            self.errors += 1
+            print(f"Meme cache read error: {e}")
+            return {}
+        return {meme_id: json.loads(value) for meme_id, value in zip(meme_ids, values) if value}
+
+    def _shared_set(self, item: dict):
+        if self.shared is None:
+            return
+        try:
+            self.shared.set(item["meme_id"], json.dumps(item, default=_json_default), self.shared_ttl)
+        except Exception as e:
+            self.errors += 1
+            print(f"Meme cache write error: {e}")
+
+    def _shared_delete(self, meme_id: str):
+        if self.shared is None:
+            return
+        try:
+            self.shared.delete(meme_id)
+        except Exception as e:
+            self.errors += 1
+            print(f"Meme cache invalidation error for {meme_id}: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "shared": type(self.shared).__name__ if self.shared is not None else None,
+            "size": len(self.lru) if self.enabled else 0,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.shared_hits) / lookups, 3) if lookups else None,
+            "expired": self.expired,
+            "evictions": self.lru.evictions,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+        }
@@ -0,0 +1,299 @@
+"""Background SNS notifications with digests and per-topic rate limits.
+
+``publish_sns()`` used to call ``sns.publish`` on the request thread, so
+every registration, and every upload analysed inline, waited a round trip
+to SNS, and a burst of approvals sent one email each. ``NotificationDispatcher``
+queues the message and returns; a background thread sends it.
+
+* Coalescing: messages share a group (by default their topic). The first
+  message in a quiet group goes out at once. Messages arriving within
+  ``coalesce_window`` seconds of the last send are held and then sent as
+  one digest of up to ``max_digest`` messages.
+* Rate limiting: each topic has a token bucket of ``rate`` messages per
+  second with bursts of ``burst``; messages wait for a token.
+* Retries: a failed publish is retried with capped, jittered exponential
+  backoff, up to ``max_attempts`` times, then counted in ``failed``.
+
+At most ``max_queue`` messages are held per worker; beyond that the oldest
+held message is dropped and counted. ``close()`` sends what is left as
+digests when the worker shuts down. The thread is started lazily and again
+after a fork, like ``activity_log.ActivityLogger``. Coalescing is per
+worker, so each worker sends its own digests.
+
+``LocalSNS`` stands in for the boto3 client in development and tests: it
+records messages (and appends them to a JSON-lines file if given one),
+optionally after a delay or failing a share of calls.
+"""
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+
+SUBJECT_LIMIT = 100  # characters SNS accepts in an email subject
+DIGEST_SEPARATOR = "\n\n----------\n\n"
+
+
+class LocalSNS:
+    """The ``publish`` call of an SNS client, recorded in memory (and to ``path``)."""
+
+    def __init__(self, path: str = None, latency: float = 0.0, failure_rate: float = 0.0):
+        self.path = path
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.published = []
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def publish(self, TopicArn: str, Message: str, Subject: str = None, **kwargs) -> dict:
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise ConnectionError("LocalSNS: simulated publish failure")
+        record = {"TopicArn": TopicArn, "Subject": Subject, "Message": Message, "ts": time.time()}
+        with self._lock:
+            self.published.append(record)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+        return {"MessageId": str(len(self.published))}
+
+
+class _TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is free (0 when one is), after refilling."""
+        if self.rate <= 0:
+            return 0.0
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        if self.rate > 0:
+            self.tokens -= 1
+
+
+class _Group:
+    def __init__(self, topic: str, digest_subject: str):
+        self.topic = topic
+        self.digest_subject = digest_subject
+        self.held = []  # (subject, message)
+        self.last_sent = None
+
+
+class NotificationDispatcher:
+    """Queues SNS messages and sends them, coalesced and rate-limited, from a background thread."""
+
+    def __init__(self, client, coalesce_window: float = 60.0, max_digest: int = 50, rate: float = 1.0,
+                 burst: int = 5, max_attempts: int = 5, base_delay: float = 0.5, max_delay: float = 30.0,
+                 max_queue: int = 1000):
+        self.client = client
+        self.coalesce_window = max(0.0, coalesce_window)
+        self.max_digest = max(1, int(max_digest))
+        self.rate = rate
+        self.burst = int(burst)
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_queue = max(1, int(max_queue))
+        self._groups = {}  # {(topic, group): _Group}
+        self._outbox = deque()  # [topic, subject, message, attempts, not_before, rate_limited]
+        self._buckets = {}  # {topic: _TokenBucket}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self.queued = 0
+        self.sent = 0
+        self.digests = 0
+        self.coalesced = 0
+        self.rate_limited = 0
+        self.retries = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def _ensure_started(self):
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._cond:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            if self._pid is not None:
+                # Forked: held messages belong to the parent, which sends them
+                self._groups.clear()
+                self._outbox.clear()
+            self._thread = threading.Thread(target=self._run, name="sns-dispatcher", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def notify(self, topic: str, subject: str, message: str, group: str = None, digest_subject: str = None):
+        """
+        Queue one message for ``topic``. Messages with the same ``group`` are
+        coalesced; a digest's subject is ``digest_subject`` formatted with
+        ``count`` (by default "<count> notifications: <first subject>").
+        """
+        if self._closed:
+            try:
+                self._send(topic, subject, message)
+                self.sent += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"SNS publish error: {e}")
+            return
+        self._ensure_started()
+        now = time.monotonic()
+        with self._cond:
+            key = (topic, group or topic)
+            entry = self._groups.get(key)
+            if entry is None:
+                entry = self._groups[key] = _Group(topic, digest_subject)
+            if self._held() >= self.max_queue:
+                self._drop_oldest()
+            self.queued += 1
+            if not entry.held and (entry.last_sent is None or now - entry.last_sent >= self.coalesce_window):
+                entry.last_sent = now
+                self._outbox.append([topic, subject, message, 0, now, False])
+            else:
+                entry.held.append((subject, message))
+                if len(entry.held) >= self.max_digest:
+                    self._release(entry, now)
+            self._cond.notify_all()
+
+    def _held(self) -> int:
+        return len(self._outbox) + sum(len(entry.held) for entry in self._groups.values())
+
+    def _drop_oldest(self):
+        """Make room for one message (caller holds the condition)."""
+        self.dropped += 1
+        if self._outbox:
+            self._outbox.popleft()
+            return
+        oldest = min((entry for entry in self._groups.values() if entry.held), key=lambda e: e.last_sent or 0)
+        oldest.held.pop(0)
+
+    def _release(self, entry: _Group, now: float):
+        """Move a group's held messages to the outbox as one message or a digest."""
+        held, entry.held = entry.held, []
+        entry.last_sent = now
+        if len(held) == 1:
+            subject, message = held[0]
+        else:
+            self.digests += 1
+            self.coalesced += len(held)
+            template = entry.digest_subject or "{count} notifications: " + held[0][0]
+            subject = template.format(count=len(held))
+            message = DIGEST_SEPARATOR.join(f"{s}\n{m}" for s, m in held)
+        self._outbox.append([entry.topic, subject, message, 0, now, False])
+
+    def _next_ready(self, now: float):
+        """
+        Pop the first outbox message that may be sent now (caller holds the
+        condition). Returns (message or None, seconds until something is due).
+        """
+        wait = self.coalesce_window or 1.0
+        for entry in self._groups.values():
+            if entry.held:
+                due = entry.last_sent + self.coalesce_window - now
+                if due <= 0:
+                    self._release(entry, now)
+                else:
+                    wait = min(wait, due)
+        for i, item in enumerate(self._outbox):
+            if item[4] > now:
+                wait = min(wait, item[4] - now)
+                continue
+            bucket = self._buckets.get(item[0])
+            if bucket is None:
+                bucket = self._buckets[item[0]] = _TokenBucket(self.rate, self.burst)
+            token_wait = bucket.wait_time(now)
+            if token_wait:
+                if not item[5]:
+                    item[5] = True
+                    self.rate_limited += 1
+                wait = min(wait, token_wait)
+                continue
+            bucket.take()
+            del self._outbox[i]
+            return item, 0.0
+        return None, wait
+
+    def _send(self, topic: str, subject: str, message: str):
+        self.client.publish(TopicArn=topic, Subject=subject[:SUBJECT_LIMIT], Message=message)
+
+    def _attempt(self, item: list) -> bool:
+        topic, subject, message, attempts = item[:4]
+        try:
+            self._send(topic, subject, message)
+        except Exception as e:
+            attempts += 1
+            if attempts >= self.max_attempts:
+                self.failed += 1
+                print(f"SNS publish error (giving up after {attempts} attempts): {e}")
+                return False
+            self.retries += 1
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempts))
+            with self._cond:
+                self._outbox.append([topic, subject, message, attempts, time.monotonic() + delay, item[5]])
+            return False
+        self.sent += 1
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                item, wait = self._next_ready(time.monotonic())
+                if item is None:
+                    self._cond.wait(timeout=wait)
+                    continue
+            self._attempt(item)
+
+    def flush(self):
+        """Send everything held now, from the calling thread (one attempt each, no rate limit)."""
+        with self._cond:
+            now = time.monotonic()
+            for entry in self._groups.values():
+                if entry.held:
+                    self._release(entry, now)
+            items, self._outbox = list(self._outbox), deque()
+        for topic, subject, message, *_ in items:
+            try:
+                self._send(topic, subject, message)
+                self.sent += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"SNS publish error: {e}")
+
+    def close(self, timeout: float = 5.0):
+        """Stop the dispatcher thread and send what is held. Later ``notify()`` calls publish directly."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        thread = self._thread
+        if thread is not None and self._pid == os.getpid():
+            thread.join(timeout=timeout)
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._cond:
+            held = self._held()
+        return {
+            "held": held,
+            "queued": self.queued,
+            "sent": self.sent,
+            "digests": self.digests,
+            "coalesced": self.coalesced,
+            "rate_limited": self.rate_limited,
+            "retries": self.retries,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,94 @@
+"""Cursor-based pagination helpers.
+
+Feeds are paged newest-first with opaque continuation tokens. For DynamoDB
+the token wraps the query's ``LastEvaluatedKey``; locally ``OrderedIndex``
+keeps each owner's ``(created_at, id)`` pairs sorted so a page is a bisect
+plus a slice, with the same token semantics.
+
+Feed pages only need the card fields below. The DynamoDB feed index
+projects exactly these (INCLUDE projection), and the full item is read
+only on /view.
+"""
+import base64
+import bisect
+import json
+import threading
+
+# Non-key attributes a feed card renders; keep in sync with the feed GSI
+# projection in infra/cloudformation and scripts/create_resources.py
+FEED_CARD_FIELDS = ["title", "category", "image_key", "variants", "likes", "views", "downloads", "status"]
+FEED_KEY_FIELDS = ["meme_id", "user", "created_at"]
+
+
+def encode_cursor(key: dict) -> str:
+    """Opaque, URL-safe token for a continuation key (None -> None)."""
+    if not key:
+        return None
+    raw = json.dumps(key, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str):
+    """Inverse of ``encode_cursor``; malformed tokens decode to None (first page)."""
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, TypeError):
+        return None
+    return key if isinstance(key, dict) else None
+
+
+def project_card(item: dict) -> dict:
+    """Copy of ``item`` reduced to what the feed index would return."""
+    return {k: item[k] for k in FEED_KEY_FIELDS + FEED_CARD_FIELDS if k in item}
+
+
+def page_size(requested, default: int, maximum: int) -> int:
+    """Clamp a requested page size (e.g. from ?limit=) to 1..maximum."""
+    try:
+        size = int(requested)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, maximum))
+
+
+class OrderedIndex:
+    """Per-owner index of ids sorted by ``created_at`` for newest-first paging."""
+
+    def __init__(self):
+        self._entries = {}  # {owner: sorted [(created_at, id), ...]}
+        self._lock = threading.Lock()
+
+    def add(self, owner: str, created_at: str, item_id: str):
+        with self._lock:
+            bisect.insort(self._entries.setdefault(owner, []), (created_at, item_id))
+
+    def remove(self, owner: str, created_at: str, item_id: str):
+        with self._lock:
+            entries = self._entries.get(owner, [])
+            i = bisect.bisect_left(entries, (created_at, item_id))
+            if i < len(entries) and entries[i] == (created_at, item_id):
+                del entries[i]
+
+    def count(self, owner: str) -> int:
+        return len(self._entries.get(owner, []))
+
+    def page(self, owner: str, limit: int, cursor: dict = None):
+        """
+        Return ([ids newest first], next_cursor). ``cursor`` is the dict
+        previously returned as next_cursor (after decoding).
+        """
+        with self._lock:
+            entries = self._entries.get(owner, [])
+            end = len(entries)
+            if cursor:
+                end = bisect.bisect_left(entries, (cursor.get("created_at", ""), cursor.get("id", "")))
+            start = max(0, end - limit)
+            ids = [item_id for _, item_id in reversed(entries[start:end])]
+            next_cursor = None
+            if start > 0:
+                created_at, item_id = entries[start]
+                next_cursor = {"created_at": created_at, "id": item_id}
+        return ids, next_cursor
@@ -0,0 +1,148 @@
+"""Password hashing and login verification.
+
+``hash_password``/``verify_password`` used to call ``pbkdf2_sha256``
+directly on the request thread with passlib's default rounds. A burst of
+logins, or one client retrying a wrong password, kept every worker busy
+hashing. ``PasswordHasher`` changes three things:
+
+* The scheme and rounds come from config (a passlib ``CryptContext``).
+  After a successful login, a hash made with other parameters is
+  returned re-hashed, so the app can store it and users move to new
+  settings as they log in (``verify_and_update``).
+* With ``processes`` set, hashing and verifying run in a spawned process
+  pool, like ``thumbnails.VariantGenerator``. Threaded or gevent workers
+  then keep serving I/O-bound requests while a login hashes.
+* Failed attempts are remembered for ``failure_ttl`` seconds. An exact
+  repeat (same stored hash, same password) fails without hashing again,
+  and an account with ``max_failures`` recent failures fails without
+  hashing until the window passes. Both are per worker. Repeats are keyed
+  by an HMAC with a per-process random key, so no password is kept.
+"""
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from passlib.context import CryptContext
+
+from analysis_cache import LRUCache
+
+DEFAULT_SCHEME = "pbkdf2_sha256"
+DEFAULT_ROUNDS = 29000  # passlib's pbkdf2_sha256 default, what existing hashes use
+
+
+@lru_cache(maxsize=8)
+def crypt_context(scheme: str, rounds: int) -> CryptContext:
+    """The context for one set of parameters (built once per process)."""
+    return CryptContext(schemes=[scheme], **{f"{scheme}__rounds": rounds})
+
+
+def _hash(scheme: str, rounds: int, password: str) -> str:
+    return crypt_context(scheme, rounds).hash(password)
+
+
+def _verify_and_update(scheme: str, rounds: int, password: str, hashed: str):
+    """(ok, new_hash or None). Module-level so the process pool can run it."""
+    try:
+        return crypt_context(scheme, rounds).verify_and_update(password, hashed)
+    except (ValueError, TypeError):
+        return False, None  # not a hash this context knows
+
+
+class PasswordHasher:
+    """Configurable hashing with optional process-pool offload and a failed-attempt cache."""
+
+    def __init__(self, scheme: str = DEFAULT_SCHEME, rounds: int = DEFAULT_ROUNDS, processes: int = 0,
+                 failure_ttl: float = 60.0, max_failures: int = 10, max_entries: int = 10000):
+        self.scheme = scheme
+        self.rounds = int(rounds)
+        crypt_context(scheme, self.rounds)  # fail at startup on a bad scheme/rounds
+        self.processes = max(0, int(processes))
+        self.failure_ttl = failure_ttl
+        self.max_failures = max(1, int(max_failures))
+        self._failed = LRUCache(max_entries)  # {hmac(hash, password): failed_at}
+        self._failures = LRUCache(max_entries)  # {account: [failed_at, ...]}
+        self._key = os.urandom(32)
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.verified = 0
+        self.failed = 0
+        self.repeats_skipped = 0
+        self.throttled = 0
+        self.rehashed = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pid != os.getpid():
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.processes,
+                        mp_context=multiprocessing.get_context("spawn")
+                    )
+                    self._pid = os.getpid()
+        return self._pool
+
+    def _run(self, fn, *args):
+        if not self.processes:
+            return fn(*args)
+        return self._get_pool().submit(fn, *args).result()
+
+    def hash(self, password: str) -> str:
+        return self._run(_hash, self.scheme, self.rounds, password)
+
+    def _attempt_key(self, hashed: str, password: str) -> bytes:
+        return hmac.new(self._key, f"{hashed}\0{password}".encode(), hashlib.sha256).digest()
+
+    def _recent_failures(self, account: str, now: float) -> list:
+        return [t for t in self._failures.get(account, []) if now - t < self.failure_ttl]
+
+    def verify(self, account: str, password: str, hashed: str):
+        """
+        Check ``password`` against the stored ``hashed`` for ``account``.
+        Returns (ok, new_hash): new_hash is set when the login succeeded and
+        the stored hash should be replaced (it used other parameters).
+        """
+        now = time.monotonic()
+        key = self._attempt_key(hashed, password)
+        failed_at = self._failed.get(key)
+        if failed_at is not None and now - failed_at < self.failure_ttl:
+            self.repeats_skipped += 1
+            return False, None
+        if len(self._recent_failures(account, now)) >= self.max_failures:
+            self.throttled += 1
+            return False, None
+
+        ok, new_hash = self._run(_verify_and_update, self.scheme, self.rounds, password, hashed)
+        if not ok:
+            self.failed += 1
+            self._failed.put(key, now)
+            self._failures.put(account, self._recent_failures(account, now) + [now])
+            return False, None
+        self.verified += 1
+        self._failures.pop(account)
+        if new_hash:
+            self.rehashed += 1
+        return True, new_hash
+
+    def stats(self) -> dict:
+        return {
+            "scheme": self.scheme,
+            "rounds": self.rounds,
+            "processes": self.processes,
+            "verified": self.verified,
+            "failed": self.failed,
+            "repeats_skipped": self.repeats_skipped,
+            "throttled": self.throttled,
+            "rehashed": self.rehashed,
+        }
+
+    def shutdown(self):
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.shutdown()
+        self._pool = None
+        self._pid = None
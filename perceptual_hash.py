@@ -0,0 +1,133 @@
+"""Perceptual hashing and a near-duplicate index.
+
+``dhash()`` reduces an image to a 64-bit difference hash that survives
+re-encoding, resizing and light cropping. ``HammingIndex`` finds stored
+hashes within a small Hamming distance using multi-index hashing: the hash
+is split into ``chunks`` substrings, and by the pigeonhole principle any
+hash within distance ``r`` matches at least one substring within
+``r // chunks`` bits. Each query probes a handful of small buckets instead
+of scanning every meme. With the default five chunks, radius-4 lookups are
+exact bucket probes only, which keeps them under a millisecond at a million
+memes (see scripts/bench_phash.py).
+"""
+import io
+import threading
+from itertools import combinations
+
+from PIL import Image
+
+HASH_BITS = 64
+
+
+def dhash(image, hash_size: int = 8):
+    """
+    Return the difference hash of an image (bytes or a binary file object)
+    as an int, or None if it cannot be decoded.
+    """
+    if isinstance(image, (bytes, bytearray)):
+        image = io.BytesIO(image)
+    try:
+        with Image.open(image) as img:
+            img.draft("L", (hash_size * 4, hash_size * 4))
+            small = img.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+            pixels = list(small.getdata())
+    except Exception as e:
+        print(f"Perceptual hash error: {e}")
+        return None
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+if hasattr(int, "bit_count"):
+    def hamming(a: int, b: int) -> int:
+        return (a ^ b).bit_count()
+else:
+    def hamming(a: int, b: int) -> int:
+        return bin(a ^ b).count("1")
+
+
+def hash_to_hex(value: int) -> str:
+    return f"{value:016x}"
+
+
+def hex_to_hash(text: str) -> int:
+    return int(text, 16)
+
+
+class HammingIndex:
+    """Multi-index hash table for Hamming-distance lookups on 64-bit hashes."""
+
+    def __init__(self, chunks: int = 5, bits: int = HASH_BITS):
+        self.chunks = chunks
+        # Spread the bits as evenly as possible, e.g. 64 bits / 5 -> 13,13,13,13,12
+        self._widths = [bits // chunks + (1 if i < bits % chunks else 0) for i in range(chunks)]
+        self._shifts = [sum(self._widths[:i]) for i in range(chunks)]
+        self._tables = [dict() for _ in range(chunks)]
+        self._hashes = {}  # {key: hash}
+        self._lock = threading.RLock()
+
+    def _parts(self, value: int):
+        return [(value >> shift) & ((1 << width) - 1) for shift, width in zip(self._shifts, self._widths)]
+
+    @staticmethod
+    def _neighbours(part: int, width: int, radius: int):
+        """Yield every chunk value within ``radius`` bits of ``part``."""
+        yield part
+        for r in range(1, radius + 1):
+            for bits in combinations(range(width), r):
+                flipped = part
+                for b in bits:
+                    flipped ^= 1 << b
+                yield flipped
+
+    def add(self, key: str, value: int):
+        with self._lock:
+            if key in self._hashes:
+                self.remove(key)
+            self._hashes[key] = value
+            for table, part in zip(self._tables, self._parts(value)):
+                table.setdefault(part, set()).add(key)
+
+    def remove(self, key: str):
+        with self._lock:
+            value = self._hashes.pop(key, None)
+            if value is None:
+                return
+            for table, part in zip(self._tables, self._parts(value)):
+                bucket = table.get(part)
+                if bucket is not None:
+                    bucket.discard(key)
+                    if not bucket:
+                        del table[part]
+
+    def get(self, key: str):
+        return self._hashes.get(key)
+
+    def query(self, value: int, radius: int = 4, limit: int = None):
+        """Return [(distance, key), ...] within ``radius``, nearest first."""
+        sub_radius = radius // self.chunks
+        seen = set()
+        matches = []
+        with self._lock:
+            hashes = self._hashes
+            for table, part, width in zip(self._tables, self._parts(value), self._widths):
+                for probe in self._neighbours(part, width, sub_radius):
+                    for key in table.get(probe, ()):
+                        if key in seen:
+                            continue
+                        seen.add(key)
+                        distance = hamming(value, hashes[key])
+                        if distance <= radius:
+                            matches.append((distance, key))
+        matches.sort()
+        return matches[:limit] if limit else matches
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def __contains__(self, key):
+        return key in self._hashes
@@ -0,0 +1,770 @@
+"""Storage backends behind one interface.
+
+app.py reads and writes through a ``Repository``, a bundle of stores that
+have the same API whichever backend is underneath. STORAGE_BACKEND picks
+the backend:
+
+* ``memory``: dicts in this process. Good for development. Data is lost on
+  restart and is not shared between gunicorn workers.
+* ``sqlite``: tables in one SQLite file in WAL mode, shared by every
+  worker on the box (see sqlite_db.py).
+* ``dynamodb``: the tables from the CloudFormation stack.
+
+The stores:
+
+* ``users``: ``get(email)``, ``create(email, password_hash, created_at)``,
+  which returns False if the user exists, ``set_password(email,
+  password_hash)`` (a login re-hashing with new parameters), and the
+  user's saved memes:
+  ``save(email, meme_id)``, ``unsave(email, *meme_ids)`` and
+  ``saved(email)`` (the ids, in no particular order).
+* ``memes``: ``get``, ``get_many(ids)`` (in the order given), ``put``,
+  ``update(meme_id, fields)`` (False if the meme is gone), ``delete``
+  (returns the deleted item), ``user_page(user, limit, cursor)``,
+  ``scan(approved_only, since, fields)``, ``image_in_use(image_key)``,
+  ``image_memes(image_key, limit)`` (meme_id, user and status of the memes
+  sharing an image, to check who may see it),
+  ``claim_trending_alert(meme_id, now, since)``,
+  ``pending_analysis(since, before)`` (ids of memes still pending, uploaded
+  in that window) and ``claim_analysis(meme_id, now, stale_before)``
+  (re-analysing a meme whose job was lost).
+* ``likes``, ``comments`` and ``browse``: the stores in likes.py,
+  comments.py and browse.py.
+* ``activity_sink`` and ``counter_sink``: sinks for ``ActivityLogger`` and
+  ``CounterBuffer``.
+* ``images``: ``LocalImageStore`` or ``S3ImageStore``, picked by S3_BUCKET
+  rather than by backend.
+
+The caching, batching and paging layers (LikedCache, CounterBuffer,
+ActivityLogger, the feed cursors) wrap these stores, so each is written
+once and runs on every backend. ``scripts/bench_repository.py`` times the
+same workload against each one.
+"""
+import json
+import sqlite3
+import threading
+from decimal import Decimal
+
+import botocore
+from boto3.dynamodb.types import TypeDeserializer
+
+from activity_log import DynamoActivitySink, FileActivitySink, SQLiteActivitySink
+from batch_get import BatchGetter, low_level_client
+from browse import DynamoBrowseIndex, LocalBrowseIndex, SQLiteBrowseIndex
+from comments import DynamoCommentStore, LocalCommentStore, SQLiteCommentStore
+from counters import DynamoCounterSink, MemoryCounterSink, ShardedDynamoCounterSink, SQLiteCounterSink
+from likes import DynamoLikeStore, LocalLikeStore, SQLiteLikeStore
+from pagination import OrderedIndex, encode_cursor, project_card
+from sqlite_db import MEME_COLUMNS, MEMES_SCHEMA, SQLiteDatabase, json_ids, meme_from_row, meme_row, placeholders
+
+BACKENDS = ("memory", "sqlite", "dynamodb")
+
+# What a failed read or write raises, whichever the backend
+STORAGE_ERRORS = (botocore.exceptions.ClientError, botocore.exceptions.BotoCoreError, sqlite3.Error)
+
+
+class Repository:
+    """The stores of one storage backend."""
+
+    def __init__(self, backend: str, users, memes, likes, comments, browse, activity_sink, counter_sink, images,
+                 db: SQLiteDatabase = None):
+        self.backend = backend
+        self.users = users
+        self.memes = memes
+        self.likes = likes
+        self.comments = comments
+        self.browse = browse
+        self.activity_sink = activity_sink
+        self.counter_sink = counter_sink
+        self.images = images
+        self.db = db
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+
+
+# ==========================================
+# MEMORY
+# ==========================================
+class MemoryUserStore:
+    def __init__(self):
+        self._users = {}  # {email: {email, password, created_at, bio}}
+        self._saved = {}  # {email: {meme_id}}
+        self._lock = threading.Lock()
+
+    def get(self, email: str):
+        user = self._users.get(email)
+        return dict(user) if user else None
+
+    def create(self, email: str, password_hash: str, created_at: str) -> bool:
+        with self._lock:
+            if email in self._users:
+                return False
+            self._users[email] = {"email": email, "password": password_hash, "created_at": created_at, "bio": ""}
+            return True
+
+    def set_password(self, email: str, password_hash: str):
+        with self._lock:
+            if email in self._users:
+                self._users[email]["password"] = password_hash
+
+    def save(self, email: str, meme_id: str):
+        with self._lock:
+            self._saved.setdefault(email, set()).add(meme_id)
+
+    def unsave(self, email: str, *meme_ids: str):
+        with self._lock:
+            self._saved.get(email, set()).difference_update(meme_ids)
+
+    def saved(self, email: str) -> list:
+        with self._lock:
+            return list(self._saved.get(email, ()))
+
+
+class MemoryMemeStore:
+    """Memes in a dict, with a per-user ``OrderedIndex`` standing in for the feed GSI."""
+
+    def __init__(self):
+        self.items = {}  # {meme_id: item}; shared with the memory likes/comments/browse stores
+        self._by_user = OrderedIndex()  # {user: [(created_at, meme_id)]}
+        self._image_refs = {}  # {image_key: {meme_ids using it}}; identical uploads share one file
+        self._lock = threading.Lock()
+
+    def get(self, meme_id: str):
+        item = self.items.get(meme_id)
+        return dict(item) if item else None
+
+    def get_many(self, meme_ids: list) -> list:
+        return [dict(self.items[m]) for m in meme_ids if m in self.items]
+
+    def put(self, item: dict):
+        with self._lock:
+            self.items[item["meme_id"]] = dict(item)
+            if item.get("image_key"):
+                self._image_refs.setdefault(item["image_key"], set()).add(item["meme_id"])
+        self._by_user.add(item["user"], item["created_at"], item["meme_id"])
+
+    def update(self, meme_id: str, fields: dict) -> bool:
+        with self._lock:
+            item = self.items.get(meme_id)
+            if item is None:
+                return False
+            item.update(fields)
+            return True
+
+    def delete(self, meme_id: str):
+        with self._lock:
+            item = self.items.pop(meme_id, None)
+            if item is None:
+                return None
+            refs = self._image_refs.get(item.get("image_key"))
+            if refs is not None:
+                refs.discard(meme_id)
+                if not refs:
+                    del self._image_refs[item["image_key"]]
+        self._by_user.remove(item["user"], item["created_at"], meme_id)
+        return item
+
+    def user_page(self, user: str, limit: int, cursor: dict = None):
+        """Return ([feed cards newest first], next_cursor token)."""
+        ids, next_key = self._by_user.page(user, limit, cursor)
+        return [project_card(self.items[i]) for i in ids if i in self.items], encode_cursor(next_key)
+
+    def scan(self, approved_only: bool = False, since: str = None, fields: list = None):
+        for item in list(self.items.values()):
+            if approved_only and item.get("status") != "approved":
+                continue
+            if since and item.get("created_at", "") < since:
+                continue
+            yield dict(item)
+
+    def image_in_use(self, image_key: str) -> bool:
+        return bool(self._image_refs.get(image_key))
+
+    def image_memes(self, image_key: str, limit: int = 20) -> list:
+        ids = list(self._image_refs.get(image_key, ()))[:limit]
+        return [
+            {"meme_id": i, "user": self.items[i]["user"], "status": self.items[i]["status"]}
+            for i in ids if i in self.items
+        ]
+
+    def claim_trending_alert(self, meme_id: str, now: str, since: str):
+        """Mark the meme alerted unless it was after ``since``. Returns the item, or None."""
+        with self._lock:
+            item = self.items.get(meme_id)
+            if item is None or (item.get("trending_alerted_at") or "") >= since:
+                return None
+            item["trending_alerted_at"] = now
+            return dict(item)
+
+    def pending_analysis(self, since: str, before: str) -> list:
+        return [
+            item["meme_id"] for item in list(self.items.values())
+            if item.get("status") == "pending" and since <= item.get("created_at", "") < before
+        ]
+
+    def claim_analysis(self, meme_id: str, now: str, stale_before: str):
+        """Mark a pending meme claimed unless it was uploaded or claimed after ``stale_before``. Returns the item, or None."""
+        with self._lock:
+            item = self.items.get(meme_id)
+            if item is None or item.get("status") != "pending":
+                return None
+            if (item.get("analysis_claimed_at") or item.get("created_at", "")) >= stale_before:
+                return None
+            item["analysis_claimed_at"] = now
+            return dict(item)
+
+
+def memory_repository(images, activity_log_file: str) -> Repository:
+    memes = MemoryMemeStore()
+    return Repository(
+        "memory",
+        users=MemoryUserStore(),
+        memes=memes,
+        likes=LocalLikeStore(memes.items),
+        comments=LocalCommentStore(memes.items),
+        browse=LocalBrowseIndex(memes.items),
+        activity_sink=FileActivitySink(activity_log_file),  # JSON lines: {id, ts, action, user, meta}
+        counter_sink=MemoryCounterSink(memes.items),
+        images=images
+    )
+
+
+# ==========================================
+# SQLITE
+# ==========================================
+USERS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    email TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    bio TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS saved (
+    user TEXT NOT NULL,
+    meme_id TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (user, meme_id)
+);
+"""
+
+
+# Statements are built once so each pooled connection prepares them once
+_MEME_INSERT = (f"INSERT OR REPLACE INTO memes ({', '.join(MEME_COLUMNS)}, data) "
+                f"VALUES ({placeholders(len(MEME_COLUMNS) + 1)})")
+_MEME_UPDATE = f"UPDATE memes SET {', '.join(c + ' = ?' for c in MEME_COLUMNS[1:])}, data = ? WHERE meme_id = ?"
+_MEMES_BY_IDS = "SELECT * FROM memes WHERE meme_id IN (SELECT value FROM json_each(?))"
+
+
+class SQLiteUserStore:
+    def __init__(self, db: SQLiteDatabase):
+        self.db = db
+        db.ensure_schema(USERS_SCHEMA)
+
+    def get(self, email: str):
+        row = self.db.query_one("SELECT * FROM users WHERE email = ?", (email,))
+        return dict(row) if row else None
+
+    def create(self, email: str, password_hash: str, created_at: str) -> bool:
+        return self.db.execute(
+            "INSERT OR IGNORE INTO users (email, password, created_at) VALUES (?, ?, ?)",
+            (email, password_hash, created_at)
+        ) == 1
+
+    def set_password(self, email: str, password_hash: str):
+        self.db.execute("UPDATE users SET password = ? WHERE email = ?", (password_hash, email))
+
+    def save(self, email: str, meme_id: str):
+        self.db.execute(
+            "INSERT OR IGNORE INTO saved (user, meme_id, created_at) VALUES (?, ?, datetime('now'))",
+            (email, meme_id)
+        )
+
+    def unsave(self, email: str, *meme_ids: str):
+        self.db.execute(
+            "DELETE FROM saved WHERE user = ? AND meme_id IN (SELECT value FROM json_each(?))",
+            (email, json_ids(meme_ids))
+        )
+
+    def saved(self, email: str) -> list:
+        return [row["meme_id"] for row in self.db.query("SELECT meme_id FROM saved WHERE user = ?", (email,))]
+
+
+class SQLiteMemeStore:
+    """Memes in the ``memes`` table: queried fields as columns, the rest as JSON."""
+
+    def __init__(self, db: SQLiteDatabase):
+        self.db = db
+        db.ensure_schema(MEMES_SCHEMA)
+
+    def get(self, meme_id: str):
+        row = self.db.query_one("SELECT * FROM memes WHERE meme_id = ?", (meme_id,))
+        return meme_from_row(row) if row else None
+
+    def get_many(self, meme_ids: list) -> list:
+        found = {}
+        for row in self.db.query(_MEMES_BY_IDS, (json_ids(dict.fromkeys(meme_ids)),)):
+            found[row["meme_id"]] = meme_from_row(row)
+        return [found[m] for m in meme_ids if m in found]
+
+    def put(self, item: dict):
+        self.db.execute(_MEME_INSERT, meme_row(item))
+
+    def update(self, meme_id: str, fields: dict) -> bool:
+        with self.db.transaction() as conn:
+            row = conn.execute("SELECT * FROM memes WHERE meme_id = ?", (meme_id,)).fetchone()
+            if row is None:
+                return False
+            item = meme_from_row(row)
+            item.update(fields)
+            conn.execute(_MEME_UPDATE, meme_row(item)[1:] + (meme_id,))
+        return True
+
+    def delete(self, meme_id: str):
+        with self.db.transaction() as conn:
+            row = conn.execute("SELECT * FROM memes WHERE meme_id = ?", (meme_id,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("DELETE FROM memes WHERE meme_id = ?", (meme_id,))
+        return meme_from_row(row)
+
+    def user_page(self, user: str, limit: int, cursor: dict = None):
+        """Return ([feed cards newest first], next_cursor token)."""
+        sql = "SELECT * FROM memes WHERE user = ?"
+        params = [user]
+        if cursor:
+            sql += " AND (created_at, meme_id) < (?, ?)"
+            params += [cursor.get("created_at", ""), cursor.get("id", "")]
+        rows = self.db.query(sql + " ORDER BY created_at DESC, meme_id DESC LIMIT ?", params + [limit + 1])
+        items = [project_card(meme_from_row(row)) for row in rows[:limit]]
+        next_key = None
+        if len(rows) > limit:
+            next_key = {"created_at": items[-1]["created_at"], "id": items[-1]["meme_id"]}
+        return items, encode_cursor(next_key)
+
+    def scan(self, approved_only: bool = False, since: str = None, fields: list = None):
+        sql = "SELECT * FROM memes WHERE 1 = 1"
+        params = []
+        if approved_only:
+            sql += " AND status = 'approved'"
+        if since:
+            sql += " AND created_at >= ?"
+            params.append(since)
+        for row in self.db.query(sql, params):
+            yield meme_from_row(row)
+
+    def image_in_use(self, image_key: str) -> bool:
+        return self.db.query_one("SELECT 1 FROM memes WHERE image_key = ? LIMIT 1", (image_key,)) is not None
+
+    def image_memes(self, image_key: str, limit: int = 20) -> list:
+        rows = self.db.query("SELECT meme_id, user, status FROM memes WHERE image_key = ? LIMIT ?", (image_key, limit))
+        return [{"meme_id": row["meme_id"], "user": row["user"], "status": row["status"]} for row in rows]
+
+    def claim_trending_alert(self, meme_id: str, now: str, since: str):
+        """Mark the meme alerted unless it was after ``since``. Returns the item, or None."""
+        with self.db.transaction() as conn:
+            row = conn.execute("SELECT * FROM memes WHERE meme_id = ?", (meme_id,)).fetchone()
+            if row is None:
+                return None
+            item = meme_from_row(row)
+            if (item.get("trending_alerted_at") or "") >= since:
+                return None
+            item["trending_alerted_at"] = now
+            conn.execute("UPDATE memes SET data = ? WHERE meme_id = ?", (meme_row(item)[-1], meme_id))
+        return item
+
+    def pending_analysis(self, since: str, before: str) -> list:
+        rows = self.db.query(
+            "SELECT meme_id FROM memes WHERE status = 'pending' AND created_at >= ? AND created_at < ?",
+            (since, before)
+        )
+        return [row["meme_id"] for row in rows]
+
+    def claim_analysis(self, meme_id: str, now: str, stale_before: str):
+        """Mark a pending meme claimed unless it was uploaded or claimed after ``stale_before``. Returns the item, or None."""
+        with self.db.transaction() as conn:
+            row = conn.execute("SELECT * FROM memes WHERE meme_id = ?", (meme_id,)).fetchone()
+            if row is None:
+                return None
+            item = meme_from_row(row)
+            if item.get("status") != "pending":
+                return None
+            if (item.get("analysis_claimed_at") or item.get("created_at", "")) >= stale_before:
+                return None
+            item["analysis_claimed_at"] = now
+            conn.execute("UPDATE memes SET data = ? WHERE meme_id = ?", (meme_row(item)[-1], meme_id))
+        return item
+
+
+def sqlite_repository(path: str, images, pool_size: int = 8, busy_timeout: float = 5.0) -> Repository:
+    db = SQLiteDatabase(path, pool_size=pool_size, busy_timeout=busy_timeout)
+    memes = SQLiteMemeStore(db)  # first: the other stores update its counts
+    return Repository(
+        "sqlite",
+        users=SQLiteUserStore(db),
+        memes=memes,
+        likes=SQLiteLikeStore(db),
+        comments=SQLiteCommentStore(db),
+        browse=SQLiteBrowseIndex(db),
+        activity_sink=SQLiteActivitySink(db),
+        counter_sink=SQLiteCounterSink(db),
+        images=images,
+        db=db
+    )
+
+
+# ==========================================
+# DYNAMODB
+# ==========================================
+def to_dynamo(value):
+    """``value`` with floats as Decimal (boto3 rejects floats)."""
+    return json.loads(json.dumps(value), parse_float=Decimal)
+
+
+class DynamoUserStore:
+    def __init__(self, table):
+        self.table = table
+
+    def get(self, email: str):
+        return self.table.get_item(Key={"email": email}).get("Item")
+
+    def create(self, email: str, password_hash: str, created_at: str) -> bool:
+        try:
+            self.table.put_item(
+                Item={"email": email, "password": password_hash, "created_at": created_at, "bio": ""},
+                ConditionExpression="attribute_not_exists(email)"
+            )
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+    def set_password(self, email: str, password_hash: str):
+        try:
+            self.table.update_item(
+                Key={"email": email},
+                UpdateExpression="SET password = :p",
+                ConditionExpression="attribute_exists(email)",
+                ExpressionAttributeValues={":p": password_hash}
+            )
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            pass  # deleted since the login read it
+
+    # Saved memes are a string set on the user item: ADD/DELETE are idempotent
+    def save(self, email: str, meme_id: str):
+        self.table.update_item(
+            Key={"email": email},
+            UpdateExpression="ADD saved :m",
+            ConditionExpression="attribute_exists(email)",
+            ExpressionAttributeValues={":m": {meme_id}}
+        )
+
+    def unsave(self, email: str, *meme_ids: str):
+        if meme_ids:
+            self.table.update_item(
+                Key={"email": email},
+                UpdateExpression="DELETE saved :m",
+                ExpressionAttributeValues={":m": set(meme_ids)}
+            )
+
+    def saved(self, email: str) -> list:
+        item = self.table.get_item(Key={"email": email}, ProjectionExpression="saved").get("Item") or {}
+        return list(item.get("saved", ()))
+
+
+class DynamoMemeStore:
+    """Memes in the memes table; user feeds from the card-only feed GSI.
+
+    A meme carries ``analysis_state = "pending"`` until its status leaves
+    pending, so the sparse ``pending_index`` GSI (hash analysis_state, range
+    created_at) lists only memes awaiting analysis. The ``image_index`` GSI
+    (hash image_key) finds the memes sharing an image, for visibility checks
+    and for deleting the image with the last of them. Approved-only scans
+    (search catch-up, backfills) query the ``status_index`` GSI (hash
+    status, range created_at) rather than scanning the table.
+    """
+
+    def __init__(self, resource, table, user_index: str = "by_user", feed_index: str = "feed_by_user",
+                 validate_indexes: bool = True, batch_getter: BatchGetter = None,
+                 pending_index: str = "pending_analysis", image_index: str = "by_image",
+                 status_index: str = "by_status"):
+        self.resource = resource
+        self.table = table
+        self.batch_getter = batch_getter or BatchGetter(low_level_client(resource.meta.client))
+        self._deserializer = TypeDeserializer()
+        self.user_index = user_index
+        self.pending_index = pending_index
+        self.image_index = image_index
+        self.status_index = status_index
+        self._status_index_found = None
+        self.feed_index = self.resolve_feed_index(feed_index) if validate_indexes else feed_index
+
+    def resolve_feed_index(self, feed_index: str) -> str:
+        """
+        Check the configured GSIs exist on the memes table. Returns the index
+        user feeds should query: the card-only feed index, or the full by-user
+        index if the feed index has not been created yet.
+        """
+        try:
+            table = self.table.meta.client.describe_table(TableName=self.table.name)["Table"]
+        except (botocore.exceptions.ClientError, botocore.exceptions.BotoCoreError) as e:
+            print(f"Could not validate indexes on {self.table.name}: {e}")
+            return feed_index
+        names = {gsi["IndexName"] for gsi in table.get("GlobalSecondaryIndexes", [])}
+        if feed_index in names:
+            return feed_index
+        if self.user_index in names:
+            print(f"Feed index {feed_index} not found on {self.table.name}; using {self.user_index}")
+            return self.user_index
+        raise RuntimeError(
+            f"Neither {feed_index} nor {self.user_index} exists on {self.table.name} "
+            f"(found: {', '.join(sorted(names)) or 'none'}). Run scripts/create_resources.py "
+            f"or set MEMES_FEED_INDEX / MEMES_USER_INDEX."
+        )
+
+    def get(self, meme_id: str):
+        return self.table.get_item(Key={"meme_id": meme_id}).get("Item")
+
+    def get_many(self, meme_ids: list) -> list:
+        """batch_get_item, 100 keys a call in parallel, in the order given (missing ones skipped)."""
+        keys = [{"meme_id": {"S": meme_id}} for meme_id in dict.fromkeys(meme_ids)]
+        found = {}
+        for row in self.batch_getter.get(self.table.name, keys):
+            item = {name: self._deserializer.deserialize(value) for name, value in row.items()}
+            found[item["meme_id"]] = item
+        return [found[meme_id] for meme_id in meme_ids if meme_id in found]
+
+    def put(self, item: dict):
+        if item.get("status") == "pending":
+            item = dict(item, analysis_state="pending")
+        self.table.put_item(Item=to_dynamo(item))
+
+    def update(self, meme_id: str, fields: dict) -> bool:
+        names = {}
+        values = {}
+        sets = []
+        for i, (field, value) in enumerate(fields.items()):
+            names[f"#f{i}"] = field
+            values[f":v{i}"] = to_dynamo(value)
+            sets.append(f"#f{i} = :v{i}")
+        expression = "SET " + ", ".join(sets)
+        if fields.get("status", "pending") != "pending":
+            expression += " REMOVE analysis_state"  # out of the pending index
+        try:
+            self.table.update_item(
+                Key={"meme_id": meme_id},
+                UpdateExpression=expression,
+                ConditionExpression="attribute_exists(meme_id)",
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values
+            )
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+    def delete(self, meme_id: str):
+        return self.table.delete_item(Key={"meme_id": meme_id}, ReturnValues="ALL_OLD").get("Attributes")
+
+    def user_page(self, user: str, limit: int, cursor: dict = None):
+        """Return ([feed cards newest first], next_cursor token)."""
+        kwargs = {
+            "IndexName": self.feed_index,
+            "KeyConditionExpression": "#u = :user",
+            "ExpressionAttributeNames": {"#u": "user"},
+            "ExpressionAttributeValues": {":user": user},
+            "ScanIndexForward": False,
+            "Limit": limit
+        }
+        if cursor:
+            kwargs["ExclusiveStartKey"] = cursor
+        resp = self.table.query(**kwargs)
+        return resp.get("Items", []), encode_cursor(resp.get("LastEvaluatedKey"))
+
+    def scan(self, approved_only: bool = False, since: str = None, fields: list = None):
+        kwargs = {}
+        names = {}
+        values = {}
+        filters = []
+        if fields:
+            names.update({f"#p{i}": f for i, f in enumerate(fields)})
+            kwargs["ProjectionExpression"] = ", ".join(f"#p{i}" for i in range(len(fields)))
+        if approved_only:
+            names["#st"] = "status"
+            values[":approved"] = "approved"
+            filters.append("#st = :approved")
+        if since:
+            values[":since"] = since
+            filters.append("created_at >= :since")
+        if names:
+            kwargs["ExpressionAttributeNames"] = names
+        if values:
+            kwargs["ExpressionAttributeValues"] = values
+        read = self.table.scan
+        if approved_only and self.status_index and self._has_status_index():
+            # Only the approved memes (since ``since``) are read, in time order
+            read = self.table.query
+            kwargs["IndexName"] = self.status_index
+            kwargs["KeyConditionExpression"] = " AND ".join(filters)
+        elif filters:
+            kwargs["FilterExpression"] = " AND ".join(filters)
+        while True:
+            resp = read(**kwargs)
+            yield from resp.get("Items", [])
+            if "LastEvaluatedKey" not in resp:
+                return
+            kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+    def _has_status_index(self) -> bool:
+        """Whether the status index exists (checked once; a scan is used without it)."""
+        if self._status_index_found is None:
+            try:
+                table = self.table.meta.client.describe_table(TableName=self.table.name)["Table"]
+            except (botocore.exceptions.ClientError, botocore.exceptions.BotoCoreError) as e:
+                print(f"Could not check for {self.status_index} on {self.table.name}: {e}")
+                return False
+            names = {gsi["IndexName"] for gsi in table.get("GlobalSecondaryIndexes", [])}
+            self._status_index_found = self.status_index in names
+            if not self._status_index_found:
+                print(f"Status index {self.status_index} not found on {self.table.name}; "
+                      f"approved-only reads scan the table")
+        return self._status_index_found
+
+    def image_in_use(self, image_key: str) -> bool:
+        """
+        Whether any meme still uses the image, from the image index. The
+        index lags the table, so each hit is confirmed with a consistent
+        read (the meme just deleted can still be listed). Without the index
+        the image is reported in use and kept.
+        """
+        kwargs = {
+            "IndexName": self.image_index,
+            "KeyConditionExpression": "image_key = :key",
+            "ExpressionAttributeValues": {":key": image_key},
+            "ProjectionExpression": "meme_id"
+        }
+        try:
+            while True:
+                resp = self.table.query(**kwargs)
+                for hit in resp.get("Items", []):
+                    item = self.table.get_item(
+                        Key={"meme_id": hit["meme_id"]}, ProjectionExpression="image_key", ConsistentRead=True
+                    ).get("Item")
+                    if item and item.get("image_key") == image_key:
+                        return True
+                if "LastEvaluatedKey" not in resp:
+                    return False
+                kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+        except botocore.exceptions.ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("ValidationException", "ResourceNotFoundException"):
+                raise
+            print(f"Image index {self.image_index} not found on {self.table.name}; keeping {image_key}")
+            return True
+
+    def image_memes(self, image_key: str, limit: int = 20) -> list:
+        """Query the image index (empty, with a warning, if it does not exist)."""
+        try:
+            resp = self.table.query(
+                IndexName=self.image_index,
+                KeyConditionExpression="image_key = :key",
+                ExpressionAttributeNames={"#u": "user", "#st": "status"},
+                ExpressionAttributeValues={":key": image_key},
+                ProjectionExpression="meme_id, #u, #st",
+                Limit=limit
+            )
+        except botocore.exceptions.ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("ValidationException", "ResourceNotFoundException"):
+                raise
+            print(f"Image index {self.image_index} not found on {self.table.name}; "
+                  f"run scripts/create_resources.py")
+            return []
+        return resp.get("Items", [])
+
+    def claim_trending_alert(self, meme_id: str, now: str, since: str):
+        """
+        Set trending_alerted_at unless it is after ``since``. The conditional
+        update lets exactly one worker (of any instance) through per cooldown.
+        Returns the item, or None.
+        """
+        try:
+            return self.table.update_item(
+                Key={"meme_id": meme_id},
+                UpdateExpression="SET trending_alerted_at = :now",
+                ConditionExpression="attribute_exists(meme_id) AND "
+                                    "(attribute_not_exists(trending_alerted_at) OR trending_alerted_at < :since)",
+                ExpressionAttributeValues={":now": now, ":since": since},
+                ReturnValues="ALL_NEW"
+            )["Attributes"]
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            return None
+
+    def pending_analysis(self, since: str, before: str) -> list:
+        """Query the sparse pending index (empty, with a warning, if it does not exist)."""
+        kwargs = {
+            "IndexName": self.pending_index,
+            "KeyConditionExpression": "analysis_state = :pending AND created_at BETWEEN :since AND :before",
+            "ExpressionAttributeValues": {":pending": "pending", ":since": since, ":before": before},
+            "ProjectionExpression": "meme_id"
+        }
+        ids = []
+        try:
+            while True:
+                resp = self.table.query(**kwargs)
+                ids.extend(item["meme_id"] for item in resp.get("Items", []))
+                if "LastEvaluatedKey" not in resp:
+                    return ids
+                kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+        except botocore.exceptions.ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("ValidationException", "ResourceNotFoundException"):
+                raise
+            print(f"Pending index {self.pending_index} not found on {self.table.name}; "
+                  f"run scripts/create_resources.py to recover lost analysis jobs")
+            return []
+
+    def claim_analysis(self, meme_id: str, now: str, stale_before: str):
+        """
+        Set analysis_claimed_at on a pending meme unless it was uploaded or
+        claimed after ``stale_before``, so one worker re-submits a lost
+        job. Returns the item, or None.
+        """
+        try:
+            return self.table.update_item(
+                Key={"meme_id": meme_id},
+                UpdateExpression="SET analysis_claimed_at = :now",
+                ConditionExpression="#st = :pending AND ("
+                                    "(attribute_not_exists(analysis_claimed_at) AND created_at < :stale) OR "
+                                    "analysis_claimed_at < :stale)",
+                ExpressionAttributeNames={"#st": "status"},
+                ExpressionAttributeValues={":now": now, ":stale": stale_before, ":pending": "pending"},
+                ReturnValues="ALL_NEW"
+            )["Attributes"]
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            return None
+
+
+def dynamo_repository(resource, images, users_table: str, memes_table: str, likes_table: str, comments_table: str,
+                      browse_table: str, activity_table: str, counters_table: str = None, counter_shards: int = 8,
+                      user_index: str = "by_user", feed_index: str = "feed_by_user",
+                      category_index: str = "by_category", validate_indexes: bool = True,
+                      batch_get_workers: int = 4, client=None, pending_index: str = "pending_analysis",
+                      image_index: str = "by_image", status_index: str = "by_status") -> Repository:
+    memes = resource.Table(memes_table)
+    # The stores that build typed requests share one plain client (``client``,
+    # or one like the resource's), and one pool for their batch reads
+    client = client or low_level_client(resource.meta.client)
+    batch_getter = BatchGetter(client, max_workers=batch_get_workers)
+    return Repository(
+        "dynamodb",
+        users=DynamoUserStore(resource.Table(users_table)),
+        memes=DynamoMemeStore(
+            resource, memes, user_index, feed_index, validate_indexes, batch_getter, pending_index, image_index,
+            status_index
+        ),
+        likes=DynamoLikeStore(client, likes_table, memes_table, batch_getter),
+        comments=DynamoCommentStore(resource.Table(comments_table), memes_table, client),
+        browse=DynamoBrowseIndex(resource.Table(browse_table), memes, category_index, client=client,
+                                 batch_getter=batch_getter),
+        activity_sink=DynamoActivitySink(resource.Table(activity_table)),
+        counter_sink=ShardedDynamoCounterSink(resource.Table(counters_table), counter_shards, batch_getter)
+        if counters_table else DynamoCounterSink(memes),
+        images=images
+    )
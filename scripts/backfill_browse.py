@@ -0,0 +1,66 @@
+"""Add memes approved before the browse indexes existed to them.
+
+Scans the memes table for approved memes without ``browse_category`` and
+indexes each one (sets browse_category, writes its tag adjacency items and
+bumps the counts in one transaction). Indexing is conditional on
+browse_category still being unset, so re-running, or running while the app
+is indexing new approvals, never counts a meme twice.
+Usage: python scripts/backfill_browse.py --memes-table MemeTable --browse-table MemeBrowse --region us-east-1
+"""
+import argparse
+import os
+import sys
+
+import boto3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from browse import DynamoBrowseIndex
+
+
+def unindexed_memes(table):
+    """Yield approved memes that are not in the browse indexes yet."""
+    kwargs = {
+        "ProjectionExpression": "meme_id, category, tags, created_at",
+        "FilterExpression": "#s = :approved AND attribute_not_exists(browse_category)",
+        "ExpressionAttributeNames": {"#s": "status"},
+        "ExpressionAttributeValues": {":approved": "approved"}
+    }
+    while True:
+        resp = table.scan(**kwargs)
+        for item in resp.get("Items", []):
+            yield item
+        if "LastEvaluatedKey" not in resp:
+            return
+        kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--memes-table", default=os.environ.get("MEMES_TABLE", "MemeTable"))
+    parser.add_argument("--browse-table", default=os.environ.get("BROWSE_TABLE", "MemeBrowse"))
+    parser.add_argument("--region", default=os.environ.get("AWS_DEFAULT_REGION", "us-east-1"))
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    dynamodb = boto3.Session(region_name=args.region).resource("dynamodb")
+    memes = dynamodb.Table(args.memes_table)
+    browse = DynamoBrowseIndex(dynamodb.Table(args.browse_table), memes)
+
+    indexed = 0
+    skipped = 0
+    for item in unindexed_memes(memes):
+        if args.dry_run:
+            print(f"{item['meme_id']}: {item.get('category')} {item.get('tags') or []}")
+            indexed += 1
+        elif browse.index(item):
+            indexed += 1
+        else:
+            skipped += 1  # indexed (or deleted) since the scan read it
+
+    action = "Would index" if args.dry_run else "Indexed"
+    print(f"{action} {indexed} memes ({skipped} already indexed)")
+
+
+if __name__ == "__main__":
+    main()
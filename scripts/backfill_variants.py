@@ -0,0 +1,127 @@
+"""Backfill responsive image variants for memes uploaded before they existed.
+
+Scans the memes store for approved memes with an image but no variants,
+renders them on a process pool (all cores by default) and writes the
+variant list back to each meme. The store and images are the app's, read
+from the same .env settings: STORAGE_BACKEND (sqlite or dynamodb), with
+SQLITE_PATH or MEMES_TABLE, and S3_BUCKET or LOCAL_IMAGE_DIR.
+
+Updated memes are dropped from the shared meme cache (MEME_CACHE_REDIS_URL)
+so pages pick up the variants; workers' own LRU copies expire within
+MEME_CACHE_TTL.
+Usage: python scripts/backfill_variants.py --backend dynamodb --bucket <MemeBucket>
+       python scripts/backfill_variants.py --backend sqlite --sqlite-path meme_museum.sqlite3
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dotenv import load_dotenv
+
+from image_store import LocalImageStore, S3ImageStore
+from meme_cache import MemeCache, RedisMemeTier
+from repository import STORAGE_ERRORS, dynamo_repository, sqlite_repository
+from thumbnails import VARIANT_WIDTHS, VariantGenerator
+
+
+def build(args, images):
+    if args.backend == "sqlite":
+        return sqlite_repository(args.sqlite_path, images)
+    import boto3
+    resource = boto3.Session(region_name=args.region).resource("dynamodb")
+    return dynamo_repository(
+        resource,
+        images,
+        users_table=os.environ.get("USERS_TABLE", "UsersTable"),
+        memes_table=args.table,
+        likes_table=os.environ.get("LIKES_TABLE", "MemeLikes"),
+        comments_table=os.environ.get("COMMENTS_TABLE", "MemeComments"),
+        browse_table=os.environ.get("BROWSE_TABLE", "MemeBrowse"),
+        activity_table=os.environ.get("ACTIVITY_LOG_TABLE", "ActivityLogTable"),
+        counters_table=os.environ.get("COUNTERS_TABLE"),
+        user_index=os.environ.get("MEMES_USER_INDEX", "by_user"),
+        feed_index=os.environ.get("MEMES_FEED_INDEX", "feed_by_user"),
+        category_index=os.environ.get("MEMES_CATEGORY_INDEX", "by_category"),
+        validate_indexes=False
+    )
+
+
+def pending_memes(memes):
+    """Yield (meme_id, image_key) for approved memes without variants."""
+    for item in memes.scan(approved_only=True, fields=["meme_id", "image_key", "variants", "status"]):
+        if item.get("image_key") and not item.get("variants"):
+            yield item["meme_id"], item["image_key"]
+
+
+def main():
+    load_dotenv(os.path.join(ROOT, ".env"))
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=("sqlite", "dynamodb"),
+                        default=os.environ.get("STORAGE_BACKEND", "sqlite").lower())
+    parser.add_argument("--sqlite-path", default=os.environ.get("SQLITE_PATH", os.path.join(ROOT, "meme_museum.sqlite3")))
+    parser.add_argument("--table", default=os.environ.get("MEMES_TABLE", "MemeTable"))
+    parser.add_argument("--bucket", default=os.environ.get("S3_BUCKET"), help="without one, images are read from --image-dir")
+    parser.add_argument("--image-dir", default=os.environ.get("LOCAL_IMAGE_DIR", os.path.join(ROOT, "uploads")))
+    parser.add_argument("--region", default=os.environ.get("AWS_DEFAULT_REGION", "us-east-1"))
+    parser.add_argument("--redis-url", default=os.environ.get("MEME_CACHE_REDIS_URL"))
+    parser.add_argument("--widths", default=",".join(map(str, VARIANT_WIDTHS)))
+    parser.add_argument("--processes", type=int, default=None, help="defaults to all cores")
+    parser.add_argument("--batch", type=int, default=50, help="images rendered per batch")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    if args.bucket:
+        import boto3
+        store = S3ImageStore(boto3.Session(region_name=args.region).client("s3"), args.bucket)
+    else:
+        store = LocalImageStore(args.image_dir)
+    repo = build(args, store)
+    shared = None
+    if args.redis_url and args.redis_url != "local":  # "local" is a per-process dict
+        import redis
+        shared = RedisMemeTier(redis.Redis.from_url(args.redis_url, socket_timeout=0.25))
+    meme_cache = MemeCache(repo.memes, shared=shared)
+    generator = VariantGenerator(
+        store,
+        widths=[int(w) for w in args.widths.split(",")],
+        processes=args.processes
+    )
+
+    done = 0
+    batch = []
+
+    def flush():
+        nonlocal done
+        by_key = {}
+        for meme_id, image_key in batch:
+            by_key.setdefault(image_key, []).append(meme_id)
+        results = generator.generate_many(list(by_key))
+        for image_key, variants in results.items():
+            for meme_id in by_key[image_key]:
+                try:
+                    repo.memes.update(meme_id, {"variants": variants})
+                    done += 1
+                except STORAGE_ERRORS as e:
+                    print(f"Error updating {meme_id}: {e}")
+                    continue
+                meme_cache.invalidate(meme_id)
+        print(f"Backfilled {done} memes")
+        batch.clear()
+
+    for meme_id, image_key in pending_memes(repo.memes):
+        if args.dry_run:
+            print(meme_id, image_key)
+            continue
+        batch.append((meme_id, image_key))
+        if len(batch) >= args.batch:
+            flush()
+    if batch:
+        flush()
+    generator.shutdown()
+
+
+if __name__ == "__main__":
+    main()
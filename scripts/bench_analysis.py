@@ -0,0 +1,81 @@
+"""Benchmark sequential vs parallel Rekognition analysis.
+
+Uses a stub Rekognition client with injected per-call latency, so no AWS
+credentials are needed.
+Usage: python scripts/bench_analysis.py --latency 0.3 --uploads 20 --concurrency 4
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis import AnalysisExecutor, analyze_with_rekognition, parse_labels, parse_moderation, parse_text
+
+
+class StubRekognition:
+    """Mimics the three Rekognition calls, sleeping ``latency`` seconds each."""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def detect_moderation_labels(self, Image, MinConfidence):
+        time.sleep(self.latency)
+        return {"ModerationLabels": []}
+
+    def detect_labels(self, Image, MaxLabels, MinConfidence):
+        time.sleep(self.latency)
+        return {"Labels": [{"Name": "Cat"}, {"Name": "Text"}]}
+
+    def detect_text(self, Image):
+        time.sleep(self.latency)
+        return {"TextDetections": [{"DetectedText": "such wow", "Type": "LINE"}]}
+
+
+def sequential(client, image):
+    approved, reasons = parse_moderation(client.detect_moderation_labels(Image=image, MinConfidence=60.0))
+    labels = parse_labels(client.detect_labels(Image=image, MaxLabels=20, MinConfidence=50))
+    text = parse_text(client.detect_text(Image=image))
+    return approved, reasons, labels, text
+
+
+def run(label, fn, uploads, concurrency):
+    latencies = []
+
+    def one(_):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(uploads)))
+    wall = time.perf_counter() - start
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{label:<10} p50={statistics.median(latencies) * 1000:7.1f}ms "
+          f"p99={p99 * 1000:7.1f}ms  throughput={uploads / wall:6.1f} uploads/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds per Rekognition call")
+    parser.add_argument("--uploads", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4, help="simultaneous uploads")
+    parser.add_argument("--pool-size", type=int, default=12)
+    args = parser.parse_args()
+
+    client = StubRekognition(args.latency)
+    image = {"Bytes": b"\x00" * 1024}
+    executor = AnalysisExecutor(max_workers=args.pool_size, timeout=30)
+
+    run("sequential", lambda: sequential(client, image), args.uploads, args.concurrency)
+    run("parallel", lambda: analyze_with_rekognition(client, image, executor), args.uploads, args.concurrency)
+    executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
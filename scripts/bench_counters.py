@@ -0,0 +1,83 @@
+"""Benchmark write-behind counters under a burst of views on one meme.
+
+Drives ``--rate`` views per second at a single meme for ``--seconds``,
+spread over ``--workers`` CounterBuffers (one per simulated gunicorn
+worker), against a fake table that counts update_item calls. Compares the
+writes issued with the one-write-per-view baseline.
+Usage: python scripts/bench_counters.py --rate 1000 --seconds 10 --workers 4 --flush-interval 5
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from counters import CounterBuffer, DynamoCounterSink
+
+
+class FakeMeta:
+    class client:
+        class exceptions:
+            class ConditionalCheckFailedException(Exception):
+                pass
+
+
+class CountingTable:
+    """Stands in for a DynamoDB Table; counts writes and sums the deltas."""
+
+    meta = FakeMeta
+
+    def __init__(self):
+        self.writes = 0
+        self.views = 0
+        self._lock = threading.Lock()
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues, **kwargs):
+        with self._lock:
+            self.writes += 1
+            self.views += sum(ExpressionAttributeValues.values())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=int, default=1000, help="views per second on the meme")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--flush-interval", type=float, default=5)
+    args = parser.parse_args()
+
+    table = CountingTable()
+    buffers = [CounterBuffer(DynamoCounterSink(table), flush_interval=args.flush_interval)
+               for _ in range(args.workers)]
+
+    tick = 0.01
+    per_tick = args.rate * tick
+    sent = 0
+    owed = 0.0
+    start = time.perf_counter()
+    deadline = start + args.seconds
+    i = 0
+    while time.perf_counter() < deadline:
+        owed += per_tick
+        while owed >= 1:
+            buffers[i % len(buffers)].incr("viral-meme", "views")
+            i += 1
+            sent += 1
+            owed -= 1
+        time.sleep(max(0.0, start + tick * (i / per_tick if per_tick else 0) - time.perf_counter()))
+    elapsed = time.perf_counter() - start
+    for b in buffers:
+        b.close()
+
+    baseline = sent
+    print(f"views sent:           {sent} in {elapsed:.1f}s ({sent / elapsed:.0f}/s)")
+    print(f"views recorded:       {table.views}")
+    print(f"direct update_item:   {baseline} writes ({baseline / elapsed:.0f} WCU/s)")
+    print(f"write-behind:         {table.writes} writes ({table.writes / elapsed:.2f} WCU/s)")
+    print(f"reduction:            {baseline / max(1, table.writes):.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Benchmark login throughput per core, before and after PasswordHasher tuning.
+
+Runs app.py in-process (memory backend) and posts to /login from
+--concurrency threads. A share of the attempts (--fail-ratio) are a
+credential-stuffing style storm that keeps retrying a few wrong
+passwords. Scenarios:
+
+* before: passlib defaults on the request thread, every attempt hashed
+  (what hash_password/verify_password used to do)
+* cache: the same rounds with the failed-attempt cache
+* tuned: --rounds and --processes from the command line, with the cache
+  (the first login of each user also re-hashes their stored password)
+
+Prints logins/s, logins/s per core (os.cpu_count()), p50/p99 latency and
+how many hashes were actually computed.
+Usage: python scripts/bench_login.py --requests 400 --concurrency 4 --fail-ratio 0.5 --rounds 29000 --processes 2
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def run(meme_app, attempts: list, concurrency: int):
+    """Post every (email, password) in ``attempts``; returns (seconds, latencies)."""
+    latencies = []
+    lock = threading.Lock()
+    position = iter(range(len(attempts)))
+
+    def worker():
+        client = meme_app.app.test_client()
+        while True:
+            with lock:
+                i = next(position, None)
+            if i is None:
+                return
+            email, password = attempts[i]
+            start = time.perf_counter()
+            client.post("/login", data={"email": email, "password": password})
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--fail-ratio", type=float, default=0.5, help="share of attempts with a wrong password")
+    parser.add_argument("--rounds", type=int, default=29000, help="PASSWORD_ROUNDS for the tuned scenario")
+    parser.add_argument("--processes", type=int, default=0, help="PASSWORD_PROCESSES for the tuned scenario")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_login_")
+    os.environ.update({
+        "STORAGE_BACKEND": "memory",
+        "LOCAL_IMAGE_DIR": os.path.join(workdir, "images"),
+        "ACTIVITY_LOG_FILE": os.path.join(workdir, "activity.jsonl"),
+        "REKOGNITION_ENABLED": "false",
+        "S3_BUCKET": "",
+    })
+    import app as meme_app
+    from passwords import DEFAULT_ROUNDS, PasswordHasher
+
+    rng = random.Random(args.seed)
+    users = [f"bench-{u}@example.com" for u in range(args.users)]
+    wrong = [f"wrong-{w}" for w in range(5)]
+    attempts = [
+        (rng.choice(users), rng.choice(wrong) if rng.random() < args.fail_ratio else "bench-password")
+        for _ in range(args.requests)
+    ]
+
+    scenarios = [
+        ("before", dict(rounds=DEFAULT_ROUNDS, processes=0, failure_ttl=0)),
+        ("cache", dict(rounds=DEFAULT_ROUNDS, processes=0)),
+        (f"tuned r={args.rounds} p={args.processes}", dict(rounds=args.rounds, processes=args.processes)),
+    ]
+    cores = os.cpu_count() or 1
+    rows = []
+    for name, params in scenarios:
+        # Fresh accounts hashed with the old defaults, as existing users are
+        old_hash = PasswordHasher(rounds=DEFAULT_ROUNDS).hash("bench-password")
+        for email in users:
+            if not meme_app.repo.users.create(email, old_hash, "2026-01-01T00:00:00"):
+                meme_app.repo.users.set_password(email, old_hash)
+        hasher = PasswordHasher(max_failures=10 ** 6, **params)
+        meme_app.password_hasher = hasher
+        if hasher.processes:
+            hasher.hash("warm-up")  # start the pool outside the timing
+        seconds, latencies = run(meme_app, attempts, args.concurrency)
+        stats = hasher.stats()
+        rows.append((name, len(latencies) / seconds, len(latencies) / seconds / cores,
+                     percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000,
+                     stats["verified"] + stats["failed"], stats["rehashed"]))
+        hasher.shutdown()
+
+    print(f"{args.requests} logins, {args.concurrency} concurrent, {args.fail_ratio:.0%} failing, {cores} cores")
+    print(f"{'scenario':24s}{'logins/s':>10s}{'per core':>10s}{'p50 ms':>9s}{'p99 ms':>9s}{'hashed':>8s}{'rehashed':>9s}")
+    for name, rate, per_core, p50, p99, hashed, rehashed in rows:
+        print(f"{name:24s}{rate:10.1f}{per_core:10.1f}{p50:9.2f}{p99:9.2f}{hashed:8d}{rehashed:9d}")
+    meme_app.counter_buffer.close()
+
+
+if __name__ == "__main__":
+    main()
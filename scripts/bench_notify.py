@@ -0,0 +1,117 @@
+"""Benchmark /upload and /register latency with SNS inline vs the background dispatcher.
+
+Runs app.py in-process (memory backend, analysis inline so the approval
+notification is sent while the upload request waits, as with
+ASYNC_ANALYSIS=false) with every topic pointed at a LocalSNS that takes
+--sns-latency ms per publish. Scenarios:
+
+* inline: publish_sns() calling sns.publish on the request thread, as
+  it used to
+* dispatcher: NotificationDispatcher with the app's coalescing and rate
+  limit settings
+
+Prints p50/p99 per route, and then how many SNS messages and digests the
+run ended up sending (after close() drains what is held).
+Usage: python scripts/bench_notify.py --uploads 200 --sns-latency 80
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def png(i: int) -> bytes:
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.new("RGB", (32, 32), (i % 256, (i // 256) % 256, 90)).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uploads", type=int, default=200)
+    parser.add_argument("--registrations", type=int, default=100)
+    parser.add_argument("--sns-latency", type=float, default=80.0, help="ms per LocalSNS publish")
+    parser.add_argument("--coalesce-window", type=float, default=60.0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_notify_")
+    os.environ.update({
+        "STORAGE_BACKEND": "memory",
+        "LOCAL_IMAGE_DIR": os.path.join(workdir, "images"),
+        "ACTIVITY_LOG_FILE": os.path.join(workdir, "activity.jsonl"),
+        "REKOGNITION_ENABLED": "false",
+        "ASYNC_ANALYSIS": "false",
+        "S3_BUCKET": "",
+        "TRENDING_THRESHOLD": "1e9",
+        "PASSWORD_ROUNDS": "1000",
+        "NEW_MEME_UPLOAD_SNS_TOPIC": "arn:aws:sns:us-east-1:000000000000:bench-uploads",
+        "MODERATION_ALERT_SNS_TOPIC": "arn:aws:sns:us-east-1:000000000000:bench-moderation",
+        "SNS_LOCAL_FILE": os.path.join(workdir, "sns.jsonl"),
+    })
+    import app as meme_app
+    from notifications import SUBJECT_LIMIT, LocalSNS, NotificationDispatcher
+
+    images = [png(i) for i in range(2 * args.uploads)]
+    client = meme_app.app.test_client()
+    client.post("/register", data={"email": "bench@example.com", "password": "bench-password"})
+    client.post("/login", data={"email": "bench@example.com", "password": "bench-password"})
+    dispatch_publish = meme_app.publish_sns
+
+    rows = []
+    for run, name in enumerate(("inline", "dispatcher")):
+        sns = LocalSNS(latency=args.sns_latency / 1000)
+        if name == "inline":
+            def inline_publish(topic_arn, subject, message, group=None, digest_subject=None):
+                if topic_arn:
+                    sns.publish(TopicArn=topic_arn, Subject=subject[:SUBJECT_LIMIT], Message=message)
+            meme_app.publish_sns = inline_publish
+            notifier = None
+        else:
+            meme_app.publish_sns = dispatch_publish
+            notifier = meme_app.notifier = NotificationDispatcher(
+                sns, coalesce_window=args.coalesce_window, max_digest=meme_app.NOTIFY_MAX_DIGEST,
+                rate=meme_app.NOTIFY_RATE, burst=meme_app.NOTIFY_BURST
+            )
+        latencies = {"upload": [], "register": []}
+        for i in range(args.uploads):
+            data = {"title": f"bench {run}-{i}", "description": "", "category": "Tech", "tags": "bench",
+                    "image": (io.BytesIO(images[run * args.uploads + i]), f"{i}.png")}
+            start = time.perf_counter()
+            resp = client.post("/upload", data=data, content_type="multipart/form-data")
+            latencies["upload"].append(time.perf_counter() - start)
+            if resp.status_code != 302:
+                sys.exit(f"/upload returned {resp.status_code}")
+        other = meme_app.app.test_client()
+        for i in range(args.registrations):
+            start = time.perf_counter()
+            other.post("/register", data={"email": f"bench-{run}-{i}@example.com", "password": "bench-password"})
+            latencies["register"].append(time.perf_counter() - start)
+        if notifier:
+            notifier.close()
+        events = args.uploads + args.registrations
+        rows.append((name, latencies, events, len(sns.published), notifier.stats()["digests"] if notifier else 0))
+
+    print(f"{args.uploads} uploads, {args.registrations} registrations, SNS publish {args.sns_latency} ms, "
+          f"coalesce window {args.coalesce_window}s")
+    print(f"{'mode':12s}{'upload p50':>12s}{'upload p99':>12s}{'register p50':>14s}{'register p99':>14s}"
+          f"{'events':>8s}{'published':>11s}{'digests':>9s}")
+    for name, latencies, events, published, digests in rows:
+        up, reg = latencies["upload"], latencies["register"]
+        print(f"{name:12s}{percentile(up, 50) * 1000:12.2f}{percentile(up, 99) * 1000:12.2f}"
+              f"{percentile(reg, 50) * 1000:14.2f}{percentile(reg, 99) * 1000:14.2f}"
+              f"{events:8d}{published:11d}{digests:9d}")
+    meme_app.counter_buffer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark the perceptual-hash near-duplicate index.
+
+Builds a HammingIndex over N random 64-bit hashes (plus a few planted
+near-duplicates) and reports build time and query latency.
+Usage: python scripts/bench_phash.py --size 1000000 --queries 2000 --radius 4
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from perceptual_hash import HammingIndex, hamming
+
+
+def flip_bits(value, count, rng):
+    for bit in rng.sample(range(64), count):
+        value ^= 1 << bit
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--radius", type=int, default=4)
+    parser.add_argument("--linear-sample", type=int, default=20, help="queries to time with a linear scan")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    hashes = [rng.getrandbits(64) for _ in range(args.size)]
+
+    index = HammingIndex()
+    start = time.perf_counter()
+    for i, value in enumerate(hashes):
+        index.add(str(i), value)
+    build = time.perf_counter() - start
+    print(f"build: {args.size} hashes in {build:.2f}s ({args.size / build:,.0f}/s)")
+
+    # Half the queries are near-duplicates of stored hashes, half are random
+    queries = []
+    for i in range(args.queries):
+        if i % 2 == 0:
+            queries.append(flip_bits(rng.choice(hashes), rng.randint(0, args.radius), rng))
+        else:
+            queries.append(rng.getrandbits(64))
+
+    latencies = []
+    found = 0
+    for q in queries:
+        start = time.perf_counter()
+        matches = index.query(q, radius=args.radius)
+        latencies.append(time.perf_counter() - start)
+        found += bool(matches)
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"index query (r={args.radius}): p50={statistics.median(latencies) * 1e6:.0f}us "
+          f"p99={p99 * 1e6:.0f}us  hits={found}/{len(queries)}")
+
+    start = time.perf_counter()
+    for q in queries[:args.linear_sample]:
+        [v for v in hashes if hamming(q, v) <= args.radius]
+    linear = (time.perf_counter() - start) / max(1, args.linear_sample)
+    print(f"linear scan: {linear * 1000:.1f}ms per query")
+
+
+if __name__ == "__main__":
+    main()
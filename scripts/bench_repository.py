@@ -0,0 +1,264 @@
+"""Run one workload against each storage backend and compare.
+
+Builds a repository per backend (memory, a fresh SQLite file, and with
+--backends ...,dynamodb the tables named in .env), then times the same
+operations on each: user and meme writes, point and batch reads, feed,
+category and tag pages, likes (raw and through LikedCache), comments,
+write-behind counters and the buffered activity log. Afterwards it checks
+that each backend gave the same answers: every feed page walk returns each
+meme once in order, like and comment counts match the rows, and browse
+counts match the memes indexed.
+The memes written to DynamoDB are deleted again at the end.
+Usage: python scripts/bench_repository.py --backends memory,sqlite --memes 2000 --users 50
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from activity_log import ActivityLogger
+from counters import CounterBuffer
+from image_store import LocalImageStore
+from likes import LikedCache
+from pagination import decode_cursor
+from repository import BACKENDS, dynamo_repository, memory_repository, sqlite_repository
+
+CATEGORIES = ["Animals", "Gaming", "Politics", "Sports", "Tech"]
+TAGS = ["cat", "dog", "lol", "wholesome", "fail", "retro", "meta", "cursed"]
+
+
+def build(backend: str, workdir: str):
+    images = LocalImageStore(os.path.join(workdir, "images"))
+    if backend == "memory":
+        return memory_repository(images, os.path.join(workdir, "activity.jsonl"))
+    if backend == "sqlite":
+        return sqlite_repository(os.path.join(workdir, "bench.sqlite3"), images)
+    import boto3
+    from dotenv import load_dotenv
+    load_dotenv()
+    resource = boto3.resource("dynamodb", region_name=os.environ.get("AWS_DEFAULT_REGION", "us-east-1"))
+    return dynamo_repository(
+        resource,
+        images,
+        users_table=os.environ.get("USERS_TABLE", "UsersTable"),
+        memes_table=os.environ.get("MEMES_TABLE", "MemeTable"),
+        likes_table=os.environ.get("LIKES_TABLE", "MemeLikes"),
+        comments_table=os.environ.get("COMMENTS_TABLE", "MemeComments"),
+        browse_table=os.environ.get("BROWSE_TABLE", "MemeBrowse"),
+        activity_table=os.environ.get("ACTIVITY_LOG_TABLE", "ActivityLogTable"),
+        counters_table=os.environ.get("COUNTERS_TABLE"),
+        user_index=os.environ.get("MEMES_USER_INDEX", "by_user"),
+        feed_index=os.environ.get("MEMES_FEED_INDEX", "feed_by_user"),
+        category_index=os.environ.get("MEMES_CATEGORY_INDEX", "by_category")
+    )
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def timed(results: list, name: str, count: int, fn):
+    """Call fn(i) for i in range(count) and record per-call latency."""
+    latencies = []
+    for i in range(count):
+        start = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - start)
+    total = sum(latencies)
+    results.append((name, count, count / total if total else 0.0,
+                    percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000))
+
+
+def walk(page_fn) -> list:
+    """Follow a paged listing to the end; returns every item seen."""
+    seen = []
+    cursor = None
+    while True:
+        items, token = page_fn(cursor)
+        seen.extend(items)
+        if not token:
+            return seen
+        cursor = decode_cursor(token)
+
+
+def run(backend: str, args, workdir: str):
+    rng = random.Random(args.seed)
+    repo = build(backend, workdir)
+    run_id = uuid.uuid4().hex[:8]
+    users = [f"bench-{run_id}-{u}@example.com" for u in range(args.users)]
+    memes = []
+    for i in range(args.memes):
+        memes.append({
+            "meme_id": f"bench-{run_id}-{i:06d}",
+            "user": users[i % len(users)],
+            "title": f"meme {i}",
+            "description": "benchmark",
+            "category": rng.choice(CATEGORIES),
+            "tags": rng.sample(TAGS, 2),
+            "labels": [{"name": "Text", "confidence": 99.1}],
+            "likes": 0,
+            "views": 0,
+            "downloads": 0,
+            "status": "approved",
+            "reject_reasons": [],
+            "created_at": f"2026-01-01T00:00:00.{i:06d}",
+            "image_key": f"memes/{i:064x}.png",
+            "variants": [],
+            "comment_count": 0
+        })
+    ids = [m["meme_id"] for m in memes]
+    results = []
+
+    timed(results, "users.create", len(users), lambda i: repo.users.create(users[i], "hash", "2026-01-01T00:00:00"))
+    timed(results, "users.get", len(users), lambda i: repo.users.get(users[i]))
+    timed(results, "memes.put", len(memes), lambda i: repo.memes.put(memes[i]))
+    timed(results, "browse.index", len(memes), lambda i: repo.browse.index(memes[i]))
+    timed(results, "memes.get", args.reads, lambda i: repo.memes.get(rng.choice(ids)))
+    timed(results, "memes.get_many(20)", args.reads // 10, lambda i: repo.memes.get_many(rng.sample(ids, 20)))
+    timed(results, "memes.user_page(12)", args.reads, lambda i: repo.memes.user_page(rng.choice(users), 12))
+    timed(results, "browse.category_page(20)", args.reads,
+          lambda i: repo.browse.category_page(rng.choice(CATEGORIES), 20))
+    timed(results, "browse.tag_page(20)", args.reads, lambda i: repo.browse.tag_page(rng.choice(TAGS), 20))
+    timed(results, "browse.counts", args.reads // 10,
+          lambda i: (repo.browse.category_counts(), repo.browse.tag_counts(100)))
+
+    liked_pairs = [(ids[i % len(ids)], users[i % len(users)]) for i in range(args.likes)]
+    timed(results, "likes.like", len(liked_pairs), lambda i: repo.likes.like(*liked_pairs[i]))
+    timed(results, "likes.like (repeat)", len(liked_pairs) // 10, lambda i: repo.likes.like(*liked_pairs[i]))
+    timed(results, "likes.liked(12)", args.reads, lambda i: repo.likes.liked(rng.choice(users), rng.sample(ids, 12)))
+    cache = LikedCache(repo.likes)
+    feed = {u: rng.sample(ids, 12) for u in users}
+    timed(results, "LikedCache.liked(12)", args.reads, lambda i: cache.liked(users[i % len(users)], feed[users[i % len(users)]]))
+
+    commented = ids[:max(1, len(ids) // 20)]
+    timed(results, "comments.add", args.comments,
+          lambda i: repo.comments.add(commented[i % len(commented)], users[i % len(users)], f"comment {i}",
+                                      f"2026-01-02T00:00:00.{i:06d}"))
+    timed(results, "comments.page(20)", args.reads // 10, lambda i: repo.comments.page(rng.choice(commented), 20))
+
+    counters = CounterBuffer(repo.counter_sink, flush_interval=3600)
+    timed(results, "CounterBuffer.incr", args.reads, lambda i: counters.incr(rng.choice(ids), "views"))
+    timed(results, "CounterBuffer.flush", 1, lambda i: counters.flush())
+    counters.close()
+
+    logger = ActivityLogger(repo.activity_sink, flush_interval=3600)
+    timed(results, "ActivityLogger.log", args.reads, lambda i: logger.log({
+        "id": f"{run_id}-{i}", "log_id": f"{run_id}-{i}", "ts": "2026-01-01T00:00:00", "action": "view",
+        "user": users[i % len(users)], "meta": json.dumps({"meme_id": ids[i % len(ids)]})
+    }))
+    timed(results, "ActivityLogger.flush", 1, lambda i: logger.flush())
+    logger.close()
+
+    id_set = set(ids)
+    timed(results, "memes.scan", 1, lambda i: sum(1 for m in repo.memes.scan(approved_only=True) if m["meme_id"] in id_set))
+
+    problems = check(repo, users, memes, liked_pairs, commented, args.comments)
+
+    if backend == "dynamodb":
+        for meme in memes:
+            item = repo.memes.get(meme["meme_id"])
+            if item:
+                repo.browse.unindex(item)
+                repo.memes.delete(meme["meme_id"])
+                repo.likes.remove_meme(meme["meme_id"])
+                repo.comments.delete_all(meme["meme_id"])
+                repo.counter_sink.delete(meme["meme_id"])
+    repo.close()
+    return results, problems
+
+
+def check(repo, users, memes, liked_pairs, commented, comment_count) -> list:
+    """Answers every backend must agree on."""
+    problems = []
+    by_user = {}
+    for meme in memes:
+        by_user.setdefault(meme["user"], []).append(meme["meme_id"])
+    for user in users[:5]:
+        seen = [m["meme_id"] for m in walk(lambda c: repo.memes.user_page(user, 7, c))]
+        if seen != sorted(by_user.get(user, []), reverse=True):
+            problems.append(f"user_page walk for {user} returned {len(seen)} memes out of order or duplicated")
+
+    ids = [m["meme_id"] for m in memes]
+    sample = ids[::max(1, len(ids) // 50)][::-1]
+    if [m["meme_id"] for m in repo.memes.get_many(sample + ["missing"])] != sample:
+        problems.append("get_many did not return the found ids in the order asked")
+
+    likes = {}
+    for meme_id, _ in set(liked_pairs):  # repeat likes are no-ops
+        likes[meme_id] = likes.get(meme_id, 0) + 1
+    for meme_id, expected in list(likes.items())[:50]:
+        got = int(repo.memes.get(meme_id).get("likes", 0))
+        if got != expected:
+            problems.append(f"{meme_id} has likes={got}, expected {expected}")
+
+    total_comments = sum(int(repo.memes.get(m).get("comment_count", 0)) for m in commented)
+    if total_comments != comment_count:
+        problems.append(f"comment_count sums to {total_comments}, expected {comment_count}")
+    paged = sum(len(walk(lambda c: repo.comments.page(m, 7, c))) for m in commented)
+    if paged != comment_count:
+        problems.append(f"comment pages returned {paged} comments, expected {comment_count}")
+
+    id_set = set(ids)
+    categories = {}
+    for meme in memes:
+        categories[meme["category"]] = categories.get(meme["category"], 0) + 1
+    counted = dict(repo.browse.category_counts())
+    for category, n in categories.items():
+        if counted.get(category, 0) < n:
+            problems.append(f"category {category} counted {counted.get(category, 0)}, expected at least {n}")
+        in_pages = [m for m in walk(lambda c: repo.browse.category_page(category, 50, c)) if m["meme_id"] in id_set]
+        if len(in_pages) != n:
+            problems.append(f"category {category} pages returned {len(in_pages)} of {n} memes")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", default="memory,sqlite", help=f"comma-separated, from {', '.join(BACKENDS)}")
+    parser.add_argument("--memes", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--reads", type=int, default=2000, help="calls per read benchmark")
+    parser.add_argument("--likes", type=int, default=1000)
+    parser.add_argument("--comments", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    unknown = [b for b in backends if b not in BACKENDS]
+    if unknown:
+        parser.error(f"unknown backend(s): {', '.join(unknown)}")
+
+    all_results = {}
+    failed = False
+    for backend in backends:
+        with tempfile.TemporaryDirectory() as workdir:
+            results, problems = run(backend, args, workdir)
+        all_results[backend] = {name: row for name, *row in results}
+        for problem in problems:
+            print(f"[{backend}] CHECK FAILED: {problem}")
+        failed = failed or bool(problems)
+
+    names = [name for name in all_results[backends[0]]]
+    header = f"{'operation':28s}" + "".join(f"{b + ' ops/s':>16s}{'p50 ms':>9s}{'p99 ms':>9s}" for b in backends)
+    print(header)
+    print("-" * len(header))
+    for name in names:
+        line = f"{name:28s}"
+        for backend in backends:
+            count, rate, p50, p99 = all_results[backend][name]
+            line += f"{rate:16.0f}{p50:9.3f}{p99:9.3f}"
+        print(line)
+    if failed:
+        sys.exit(1)
+    print("\nAll backends passed the consistency checks.")
+
+
+if __name__ == "__main__":
+    main()
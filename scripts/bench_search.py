@@ -0,0 +1,151 @@
+"""Generate a synthetic meme corpus and benchmark the search index.
+
+Words, tags and labels are drawn from Zipf-like distributions so some
+terms are very common (long posting lists) and most are rare, as in real
+captions. For each size the corpus is indexed in chunks (each chunk saved
+as a new segment, as a long-running worker would), then the index is
+reopened from disk and timed on a mix of queries.
+Usage: python scripts/bench_search.py --sizes 100000,1000000 --queries 500
+"""
+import argparse
+import bisect
+import itertools
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search import SearchIndex
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "ta", "po", "zi", "bo", "sa", "de", "fu", "gi", "ho", "ju", "ly", "we", "xo"]
+
+
+class ZipfVocabulary:
+    """``size`` made-up words sampled with probability ~ 1 / rank."""
+
+    def __init__(self, size: int, rng: random.Random, prefix: str = ""):
+        self.words = []
+        seen = set()
+        while len(self.words) < size:
+            word = prefix + "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+            if word not in seen:
+                seen.add(word)
+                self.words.append(word)
+        self.cumulative = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(size)))
+        self.rng = rng
+
+    def sample(self, k: int) -> list:
+        total = self.cumulative[-1]
+        return [self.words[bisect.bisect_left(self.cumulative, self.rng.random() * total)] for _ in range(k)]
+
+
+def generate_corpus(size: int, seed: int = 42):
+    """Yield (meme_id, meme fields) for ``size`` synthetic memes."""
+    rng = random.Random(seed)
+    words = ZipfVocabulary(20000, rng)
+    tags = ZipfVocabulary(2000, rng)
+    labels = ZipfVocabulary(300, rng, prefix="l")
+    for _ in range(size):
+        yield str(uuid.UUID(int=rng.getrandbits(128), version=4)), {
+            "title": " ".join(words.sample(rng.randint(3, 8))),
+            "description": " ".join(words.sample(rng.randint(0, 20))),
+            "tags": tags.sample(rng.randint(1, 4)),
+            "labels": labels.sample(rng.randint(2, 6)),
+            "detected_text": " ".join(words.sample(rng.randint(0, 12))),
+        }
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def time_queries(index, queries):
+    """Latencies in ms, and the mean overlap of each top 20 with the exact top 20."""
+    times = []
+    overlap = []
+    for q in queries:
+        start = time.perf_counter()
+        _, hits = index.search(q, limit=20)
+        times.append((time.perf_counter() - start) * 1000)
+        _, exact = index.search(q, limit=20, exact=True)
+        if exact:
+            overlap.append(len({d for _, d in hits} & {d for _, d in exact}) / len(exact))
+    return times, statistics.mean(overlap) if overlap else 1.0
+
+
+def bench(size: int, chunk: int, n_queries: int, seed: int):
+    root = tempfile.mkdtemp(prefix="bench-search-")
+    try:
+        index = SearchIndex(root)
+        build = 0.0
+        save = 0.0
+        sample_memes = []
+        rng = random.Random(seed + 1)
+        for i, (meme_id, meme) in enumerate(generate_corpus(size, seed)):
+            start = time.perf_counter()
+            index.add(meme_id, meme)
+            build += time.perf_counter() - start
+            if len(sample_memes) < 2000 and rng.random() < 0.01:
+                sample_memes.append(meme)
+            if (i + 1) % chunk == 0:
+                start = time.perf_counter()
+                index.save()
+                save += time.perf_counter() - start
+        if index.dirty:
+            start = time.perf_counter()
+            index.save()
+            save += time.perf_counter() - start
+        index.close()
+
+        start = time.perf_counter()
+        index = SearchIndex(root)
+        load = time.perf_counter() - start
+
+        def title_words(k):
+            meme = rng.choice(sample_memes)
+            return " ".join(rng.sample(meme["title"].split(), min(k, len(meme["title"].split()))))
+
+        mixes = {
+            "1 term": [title_words(1) for _ in range(n_queries)],
+            "2 terms": [title_words(2) for _ in range(n_queries)],
+            "3 terms": [title_words(3) for _ in range(n_queries)],
+            "#tag": ["#" + rng.choice(rng.choice(sample_memes)["tags"]) for _ in range(n_queries)],
+        }
+        print(f"\n{size:,} memes: index {build:.1f}s, save {save:.1f}s in {size // chunk or 1} chunks, "
+              f"reopen {load * 1000:.0f} ms")
+        for name, queries in mixes.items():
+            times, overlap = time_queries(index, queries)
+            print(f"  {name:8s} p50 {percentile(times, 0.5):7.2f} ms  p99 {percentile(times, 0.99):7.2f} ms"
+                  f"  top-20 overlap with exact {overlap:.1%}")
+        prefixes = [rng.choice(rng.choice(sample_memes)["tags"])[:2] for _ in range(n_queries)]
+        times = []
+        for p in prefixes:
+            start = time.perf_counter()
+            index.suggest_tags(p)
+            times.append((time.perf_counter() - start) * 1000)
+        print(f"  {'tag ac':8s} p50 {percentile(times, 0.5):7.2f} ms  p99 {percentile(times, 0.99):7.2f} ms")
+        index.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="100000,1000000")
+    parser.add_argument("--chunk", type=int, default=100000, help="memes indexed between saves")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    for size in [int(s) for s in args.sizes.split(",")]:
+        bench(size, args.chunk, args.queries, args.seed)
+
+
+if __name__ == "__main__":
+    main()
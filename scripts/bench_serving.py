@@ -0,0 +1,303 @@
+"""Benchmark gunicorn worker modes against a local DynamoDB stand-in.
+
+Starts moto's server (``pip install "moto[server]"``) as the DynamoDB
+endpoint (the app finds it through AWS_ENDPOINT_URL_DYNAMODB, so botocore
+has to be new enough to read that), behind a small TCP proxy that holds every request for
+--latency ms to stand in for the network round trip to DynamoDB. Creates
+the tables from create_resources.py, seeds --memes approved memes and a
+user, then for each --modes entry runs ``gunicorn -c gunicorn.conf.py
+app:app`` with the dynamodb backend and the meme cache off, and sends
+--requests GET /view/<id> (meme, comments and liked-state reads) from
+--concurrency logged-in clients.
+
+Modes are class:workers or class:workersxN, where N is WEB_THREADS for
+gthread and WEB_WORKER_CONNECTIONS for gevent. Prints req/s, p50/p99,
+errors, DynamoDB calls per request, and the CPU the gunicorn workers
+spent per request. In-flight requests per core that keep the workers
+busy is about (p50 latency / worker CPU per request); deployments/SIZING.md
+explains how to turn that into worker and pool settings.
+Usage: python scripts/bench_serving.py --latency 10 --requests 1500 --concurrency 64 --modes sync:3,gthread:3x8,gevent:3x100
+"""
+import argparse
+import asyncio
+import http.client
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TABLE_ENV = {
+    "USERS_TABLE": "MemeUsers",
+    "MEMES_TABLE": "MemeItems",
+    "LIKES_TABLE": "MemeLikes",
+    "COMMENTS_TABLE": "MemeComments",
+    "BROWSE_TABLE": "MemeBrowse",
+    "ACTIVITY_LOG_TABLE": "MemeLogs",
+    "ACTIVITY_LOG_KEY": "id",
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(host: str, port: int, path: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request("GET", path)
+            if conn.getresponse().status < 500:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    sys.exit(f"{host}:{port}{path} did not come up")
+
+
+class LatencyProxy:
+    """TCP proxy that forwards each chunk a client sends after ``latency`` seconds."""
+
+    def __init__(self, upstream_port: int, latency: float):
+        self.upstream_port = upstream_port
+        self.latency = latency
+        self.port = free_port()
+        self.requests = 0
+        self._loop = asyncio.new_event_loop()
+        ready = threading.Event()
+        threading.Thread(target=self._serve, args=(ready,), daemon=True).start()
+        ready.wait()
+
+    def _serve(self, ready):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(asyncio.start_server(self._handle, "127.0.0.1", self.port))
+        ready.set()
+        self._loop.run_forever()
+
+    async def _pump(self, reader, writer, delay: float):
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                if delay:
+                    self.requests += 1
+                    await asyncio.sleep(delay)
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, client_reader, client_writer):
+        upstream_reader, upstream_writer = await asyncio.open_connection("127.0.0.1", self.upstream_port)
+        await asyncio.gather(
+            self._pump(client_reader, upstream_writer, self.latency),
+            self._pump(upstream_reader, client_writer, 0)
+        )
+
+
+def cpu_seconds(pids: list) -> float:
+    """utime + stime of ``pids`` (Linux /proc)."""
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            total += int(fields[11]) + int(fields[12])
+        except (OSError, IndexError):
+            pass
+    return total / os.sysconf("SC_CLK_TCK")
+
+
+def children(pid: int) -> list:
+    found = []
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+                        found.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    return found
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def parse_mode(text: str):
+    name, _, counts = text.partition(":")
+    workers, _, per_worker = (counts or "3").partition("x")
+    env = {"WEB_WORKER_CLASS": name, "WEB_WORKERS": workers}
+    if name == "gthread" and per_worker:
+        env["WEB_THREADS"] = per_worker
+    if name == "gevent" and per_worker:
+        env["WEB_WORKER_CONNECTIONS"] = per_worker
+    return text, env
+
+
+def login(port: int) -> str:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    body = urllib.parse.urlencode({"email": "bench@example.com", "password": "bench-password"})
+    conn.request("POST", "/login", body, {"Content-Type": "application/x-www-form-urlencoded"})
+    resp = conn.getresponse()
+    resp.read()
+    cookie = resp.getheader("Set-Cookie", "").split(";", 1)[0]
+    if not cookie.startswith("session="):
+        sys.exit(f"login failed ({resp.status})")
+    return cookie
+
+
+def run_load(port: int, cookie: str, paths: list, concurrency: int):
+    """GET every path from ``concurrency`` keep-alive connections; returns (seconds, latencies, errors)."""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    position = iter(range(len(paths)))
+
+    def worker():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        while True:
+            with lock:
+                i = next(position, None)
+            if i is None:
+                return
+            start = time.perf_counter()
+            try:
+                conn.request("GET", paths[i], headers={"Cookie": cookie})
+                resp = conn.getresponse()
+                resp.read()
+                ok = resp.status == 200
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start, latencies, errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modes", default="sync:3,gthread:3x8,gevent:3x100")
+    parser.add_argument("--requests", type=int, default=1500)
+    parser.add_argument("--concurrency", type=int, default=64, help="concurrent client connections")
+    parser.add_argument("--latency", type=float, default=10.0, help="ms added to every DynamoDB request")
+    parser.add_argument("--memes", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_serving_")
+    moto_port = free_port()
+    moto = subprocess.Popen([sys.executable, "-m", "moto.server", "-p", str(moto_port)],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for("127.0.0.1", moto_port, "/moto-api/")
+        proxy = LatencyProxy(moto_port, args.latency / 1000)
+        os.environ.update({
+            "AWS_ACCESS_KEY_ID": "bench", "AWS_SECRET_ACCESS_KEY": "bench", "AWS_DEFAULT_REGION": "us-east-1",
+            "AWS_ENDPOINT_URL_DYNAMODB": f"http://127.0.0.1:{moto_port}",
+        })
+        import boto3
+        import create_resources
+        from passwords import PasswordHasher
+        from repository import dynamo_repository
+
+        create_resources.dynamodb = boto3.client("dynamodb", region_name="us-east-1")
+        for defn in create_resources.TABLES:
+            create_resources.create_table(defn)
+        repo = dynamo_repository(
+            boto3.resource("dynamodb", region_name="us-east-1"), None,
+            users_table="MemeUsers", memes_table="MemeItems", likes_table="MemeLikes",
+            comments_table="MemeComments", browse_table="MemeBrowse", activity_table="MemeLogs",
+            validate_indexes=False
+        )
+        repo.users.create("bench@example.com", PasswordHasher(rounds=1000).hash("bench-password"),
+                          "2026-01-01T00:00:00")
+        ids = []
+        for i in range(args.memes):
+            meme_id = f"bench-{i:06d}"
+            repo.memes.put({
+                "meme_id": meme_id, "user": "bench@example.com", "title": f"meme {i}", "description": "benchmark",
+                "category": "Tech", "tags": ["bench"], "labels": [], "detected_text": "", "likes": 0, "views": 0,
+                "downloads": 0, "status": "approved", "reject_reasons": [],
+                "created_at": f"2026-01-01T00:00:00.{i:06d}", "image_key": f"memes/{i:064x}.png",
+                "variants": [], "comment_count": 0
+            })
+            ids.append(meme_id)
+        rng = random.Random(args.seed)
+        paths = [f"/view/{rng.choice(ids)}" for _ in range(args.requests)]
+
+        rows = []
+        for mode in args.modes.split(","):
+            name, mode_env = parse_mode(mode)
+            port = free_port()
+            env = dict(os.environ, **TABLE_ENV, **mode_env, **{
+                "STORAGE_BACKEND": "dynamodb",
+                "AWS_ENDPOINT_URL_DYNAMODB": f"http://127.0.0.1:{proxy.port}",
+                "VALIDATE_INDEXES": "false",
+                "REKOGNITION_ENABLED": "false",
+                "S3_BUCKET": "",
+                "LOCAL_IMAGE_DIR": os.path.join(workdir, "images"),
+                "MEME_CACHE_SIZE": "0",
+                "TRENDING_THRESHOLD": "1e9",
+            })
+            log = open(os.path.join(workdir, f"gunicorn-{name.replace(':', '-')}.log"), "w")
+            print(f"{name}: gunicorn log in {log.name}")
+            server = subprocess.Popen(
+                [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-b", f"127.0.0.1:{port}", "app:app"],
+                cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+            )
+            try:
+                wait_for("127.0.0.1", port, "/health")
+                cookie = login(port)
+                run_load(port, cookie, paths[:min(len(paths), 4 * args.concurrency)], args.concurrency)  # warm up
+                pids = children(server.pid)
+                cpu_before, calls_before = cpu_seconds(pids), proxy.requests
+                seconds, latencies, errors = run_load(port, cookie, paths, args.concurrency)
+                app_cpu = cpu_seconds(pids) - cpu_before
+                calls = proxy.requests - calls_before
+                rows.append((name, len(latencies) / seconds, percentile(latencies, 50) * 1000,
+                             percentile(latencies, 99) * 1000, errors, calls / len(latencies),
+                             app_cpu / len(latencies) * 1000))
+            finally:
+                server.terminate()
+                server.wait()
+                log.close()
+    finally:
+        moto.terminate()
+        moto.wait()
+
+    print(f"{args.requests} /view requests from {args.concurrency} clients, {args.memes} memes, "
+          f"DynamoDB latency +{args.latency} ms, {os.cpu_count()} cores")
+    print(f"{'mode':16s}{'req/s':>9s}{'p50 ms':>9s}{'p99 ms':>9s}{'errors':>8s}{'ddb/req':>9s}{'cpu ms/req':>12s}")
+    for name, rate, p50, p99, errors, calls, cpu in rows:
+        print(f"{name:16s}{rate:9.1f}{p50:9.1f}{p99:9.1f}{errors:8d}{calls:9.2f}{cpu:12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""Benchmark the cost of a session lookup per request, by session store.
+
+Times ``open_session`` + ``save_session`` (what Flask runs around every
+request) for Flask's signed cookie and for each server-side store, with a
+signed-in session holding what app.py caches there: the profile,
+--saved saved ids and --liked like-state entries. Scenarios:
+
+* read: nothing changed and no renewal due (most requests)
+* renew: renewal due, so the expiry is slid with one ``touch``
+* write: the session changed (a like, a save), so it is written in full
+
+The dynamodb store runs against moto in-process when moto is installed,
+so its times are moto's CPU rather than a network round trip (add the
+table's GetItem latency, a few ms in-region). The "users table" row is
+the read a page needed for the profile before it was cached in the
+session.
+
+Last, a simulated day of --requests-per-day requests per user shows how
+many store writes the lazy sliding renewal makes, against renewing on
+every request.
+Usage: python scripts/bench_sessions.py --requests 2000 --saved 50 --liked 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BROWSER_COOKIE_LIMIT = 4093  # bytes a browser keeps per cookie
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def session_payload(saved: int, liked: int) -> dict:
+    return {
+        "user": "bench@example.com",
+        "profile": {"email": "bench@example.com", "bio": "", "created_at": "2026-01-01T00:00:00"},
+        "saved": [str(uuid.uuid4()) for _ in range(saved)],
+        "liked": {str(uuid.uuid4()): i % 3 == 0 for i in range(liked)},
+    }
+
+
+def cookie_value(response, name: str) -> str:
+    for header in response.headers.getlist("Set-Cookie"):
+        key, _, rest = header.partition("=")
+        if key == name:
+            return rest.split(";", 1)[0]
+    return None
+
+
+def time_requests(app, interface, cookie: str, requests: int, scenario: str) -> list:
+    from flask import request
+
+    name = interface.get_cookie_name(app)
+    times = []
+    for i in range(requests):
+        with app.test_request_context(headers={"Cookie": f"{name}={cookie}"}):
+            if scenario == "renew" and hasattr(interface, "renew_interval"):
+                interface.renew_interval = 0
+            start = time.perf_counter()
+            sess = interface.open_session(app, request)
+            if scenario == "write":
+                sess["liked"] = dict(sess["liked"], **{f"bench-{i}": True})
+            interface.save_session(app, sess, app.response_class())
+            times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def bench_interface(label: str, interface, payload: dict, requests: int) -> dict:
+    from flask import Flask, request
+
+    app = Flask(__name__)
+    app.secret_key = "bench"
+    app.session_interface = interface
+    renew_interval = getattr(interface, "renew_interval", None)
+    with app.test_request_context():
+        sess = interface.open_session(app, request)
+        sess.update(payload)
+        response = app.response_class()
+        interface.save_session(app, sess, response)
+    cookie = cookie_value(response, interface.get_cookie_name(app))
+    row = {"store": label, "cookie_bytes": len(cookie)}
+    for scenario in ("read", "renew", "write"):
+        if scenario == "renew" and renew_interval is None:
+            row[scenario] = None  # signed cookies have no server-side expiry to slide
+            continue
+        times = time_requests(app, interface, cookie, requests, scenario)
+        if renew_interval is not None:
+            interface.renew_interval = renew_interval
+        row[scenario] = (percentile(times, 50), percentile(times, 99))
+    return row
+
+
+def simulate_day(store, requests_per_day: int, ttl: float, renew_interval: float) -> int:
+    """Store writes for one user's requests spread over 16 hours, with a fake clock."""
+    import sessions
+    from flask import Flask, request
+
+    class Clock:
+        now = time.time()
+
+        def time(self):
+            return self.now
+
+    clock = Clock()
+    real_time, sessions.time = sessions.time, clock
+    try:
+        app = Flask(__name__)
+        app.secret_key = "bench"
+        interface = sessions.ServerSessionInterface(store, ttl=ttl, renew_interval=renew_interval)
+        with app.test_request_context():
+            sess = interface.open_session(app, request)
+            sess["user"] = "bench@example.com"
+            response = app.response_class()
+            interface.save_session(app, sess, response)
+        cookie = cookie_value(response, interface.get_cookie_name(app))
+        gap = 16 * 3600 / requests_per_day
+        for _ in range(requests_per_day):
+            clock.now += gap
+            with app.test_request_context(headers={"Cookie": f"session={cookie}"}):
+                interface.save_session(app, interface.open_session(app, request), app.response_class())
+        return interface.writes + interface.renewals - 1
+    finally:
+        sessions.time = real_time
+
+
+def fmt(value) -> str:
+    return "-" if value is None else f"{value[0]:.3f} / {value[1]:.3f}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--saved", type=int, default=50, help="saved ids cached in the session")
+    parser.add_argument("--liked", type=int, default=200, help="like-state entries cached in the session")
+    parser.add_argument("--requests-per-day", type=int, default=500)
+    parser.add_argument("--renew-interval", type=float, default=3600)
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore", message="The 'session' cookie is too large")  # reported in the table
+
+    from flask.sessions import SecureCookieSessionInterface
+
+    from sessions import DynamoSessionStore, MemorySessionStore, SQLiteSessionStore, ServerSessionInterface
+    from sqlite_db import SQLiteDatabase
+
+    workdir = tempfile.mkdtemp(prefix="bench_sessions_")
+    db = SQLiteDatabase(os.path.join(workdir, "sessions.sqlite3"))
+    db.ensure_schema("CREATE TABLE IF NOT EXISTS users (email TEXT PRIMARY KEY, password TEXT, created_at TEXT, bio TEXT)")
+    db.execute("INSERT INTO users VALUES ('bench@example.com', 'x', '2026-01-01T00:00:00', '')")
+
+    stores = [("memory", MemorySessionStore()), ("sqlite", SQLiteSessionStore(db))]
+    users_reads = [("sqlite", lambda: db.query_one("SELECT * FROM users WHERE email = ?", ("bench@example.com",)))]
+    mock = None
+    try:
+        import boto3
+        from moto import mock_aws
+    except ImportError:
+        print("moto not installed: skipping the dynamodb store")
+    else:
+        os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+        os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+        mock = mock_aws()
+        mock.start()
+        resource = boto3.resource("dynamodb", region_name="us-east-1")
+        for name, key in (("MemeSessions", "session_id"), ("MemeUsers", "email")):
+            resource.create_table(
+                TableName=name,
+                KeySchema=[{"AttributeName": key, "KeyType": "HASH"}],
+                AttributeDefinitions=[{"AttributeName": key, "AttributeType": "S"}],
+                BillingMode="PAY_PER_REQUEST"
+            )
+        users = resource.Table("MemeUsers")
+        users.put_item(Item={"email": "bench@example.com", "password": "x", "created_at": "2026-01-01T00:00:00", "bio": ""})
+        stores.append(("dynamodb", DynamoSessionStore(resource.Table("MemeSessions"))))
+        users_reads.append(("dynamodb", lambda: users.get_item(Key={"email": "bench@example.com"})))
+
+    try:
+        payload = session_payload(args.saved, args.liked)
+        rows = [bench_interface("cookie", SecureCookieSessionInterface(), payload, args.requests)]
+        for label, store in stores:
+            interface = ServerSessionInterface(store, renew_interval=args.renew_interval)
+            rows.append(bench_interface(label, interface, payload, args.requests))
+
+        print(f"\nSession open + save per request, ms p50 / p99 ({args.requests} requests; "
+              f"{args.saved} saved ids, {args.liked} like-state entries)")
+        print(f"{'store':<10} {'cookie B':>9} {'read':>17} {'renew':>17} {'write':>17}")
+        for row in rows:
+            note = "  (over the browser limit)" if row["cookie_bytes"] > BROWSER_COOKIE_LIMIT else ""
+            print(f"{row['store']:<10} {row['cookie_bytes']:>9} {fmt(row['read']):>17} {fmt(row['renew']):>17} "
+                  f"{fmt(row['write']):>17}{note}")
+
+        print("\nUsers table read a page made for the profile before it was cached, ms p50 / p99")
+        for label, read in users_reads:
+            times = []
+            for _ in range(args.requests):
+                start = time.perf_counter()
+                read()
+                times.append((time.perf_counter() - start) * 1000)
+            print(f"{label:<10} {fmt((percentile(times, 50), percentile(times, 99))):>17}")
+
+        print(f"\nStore writes for {args.requests_per_day} requests by one user over 16 hours")
+        for label, interval in (("every request", 0), (f"every {args.renew_interval:.0f} s", args.renew_interval)):
+            writes = simulate_day(MemorySessionStore(), args.requests_per_day, 7 * 24 * 3600, interval)
+            print(f"renew {label:<16} {writes:>6} writes ({writes / args.requests_per_day:.3f} per request)")
+    finally:
+        if mock is not None:
+            mock.stop()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
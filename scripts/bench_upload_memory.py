@@ -0,0 +1,103 @@
+"""Measure peak Python memory per upload: file.read() vs streaming put_stream().
+
+The upload body comes from a temporary file (as werkzeug spools large
+multipart files to disk), and is written either to a LocalImageStore or to
+an S3ImageStore backed by a stub client that discards the bytes.
+Usage: python scripts/bench_upload_memory.py --sizes 100K,1M,5M,20M
+"""
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_store import LocalImageStore, S3ImageStore, image_key_for
+
+
+def drain(body):
+    """Consume a request body the way botocore would: file bodies in chunks."""
+    if hasattr(body, "read"):
+        while body.read(64 * 1024):
+            pass
+
+
+class StubS3:
+    """Accepts S3 calls and throws the data away."""
+
+    def put_object(self, Body, **kwargs):
+        drain(Body)
+        return {}
+
+    def create_multipart_upload(self, **kwargs):
+        return {"UploadId": "stub"}
+
+    def upload_part(self, PartNumber, Body, **kwargs):
+        drain(Body)
+        return {"ETag": f"etag-{PartNumber}"}
+
+    def complete_multipart_upload(self, **kwargs):
+        return {}
+
+    def copy_object(self, **kwargs):
+        return {}
+
+    def delete_object(self, **kwargs):
+        return {}
+
+    def abort_multipart_upload(self, **kwargs):
+        return {}
+
+
+def parse_size(text):
+    units = {"K": 1024, "M": 1024 * 1024}
+    text = text.strip().upper()
+    if text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def buffered_upload(store, f):
+    data = f.read()
+    store.put(image_key_for(hashlib.sha256(data).hexdigest(), "x.jpg"), data)
+
+
+def streaming_upload(store, f):
+    store.put_stream(f, lambda d: image_key_for(d, "x.jpg"))
+
+
+def peak_memory(fn, store, path):
+    with open(path, "rb") as f:
+        tracemalloc.start()
+        fn(store, f)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="100K,1M,5M,10M,20M")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stores = {
+            "local": LocalImageStore(os.path.join(tmp, "store")),
+            "s3-stub": S3ImageStore(StubS3(), "bench-bucket"),
+        }
+        print(f"{'size':>8} {'backend':>8} {'read()':>12} {'streaming':>12}")
+        for label in args.sizes.split(","):
+            size = parse_size(label)
+            path = os.path.join(tmp, "upload.bin")
+            with open(path, "wb") as f:
+                f.write(os.urandom(size))
+            for name, store in stores.items():
+                before = peak_memory(buffered_upload, store, path)
+                after = peak_memory(streaming_upload, store, path)
+                print(f"{label:>8} {name:>8} {before / 1024 / 1024:>10.2f}MB {after / 1024 / 1024:>10.2f}MB")
+
+
+if __name__ == "__main__":
+    main()
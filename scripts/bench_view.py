@@ -0,0 +1,124 @@
+"""Benchmark /view latency with the meme cache off, LRU only, and LRU + shared tier.
+
+Runs app.py in-process through Flask's test client on the memory or sqlite
+backend, seeds --memes approved memes and requests /view/<id> with a
+skewed (Zipf-like) popularity, as a feed would. --store-latency adds a
+per-call delay to the memes store's reads to stand in for a DynamoDB
+round trip. --workers simulates that many gunicorn workers, each with its
+own LRU, taking the requests in turn (so the shared tier is what lets one
+worker's load serve the others). Prints p50/p99 per mode and the cache's
+hit/miss counts.
+Usage: python scripts/bench_view.py --backend sqlite --memes 500 --requests 3000 --store-latency 4 --workers 3
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class DelayedMemeStore:
+    """The memes store's reads, each ``latency`` seconds slower."""
+
+    def __init__(self, store, latency: float):
+        self.store = store
+        self.latency = latency
+        self.calls = 0
+
+    def get_many(self, meme_ids: list) -> list:
+        self.calls += 1
+        time.sleep(self.latency)
+        return self.store.get_many(meme_ids)
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", default="sqlite", choices=["memory", "sqlite"])
+    parser.add_argument("--memes", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--store-latency", type=float, default=0.0, help="ms added to each memes store read")
+    parser.add_argument("--workers", type=int, default=3, help="simulated workers, each with its own LRU")
+    parser.add_argument("--ttl", type=float, default=30.0, help="LRU entry lifetime in seconds")
+    parser.add_argument("--redis-url", help="use this Redis-protocol server as the shared tier instead of DictMemeTier")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_view_")
+    os.environ.update({
+        "STORAGE_BACKEND": args.backend,
+        "SQLITE_PATH": os.path.join(workdir, "bench.sqlite3"),
+        "LOCAL_IMAGE_DIR": os.path.join(workdir, "images"),
+        "ACTIVITY_LOG_FILE": os.path.join(workdir, "activity.jsonl"),
+        "REKOGNITION_ENABLED": "false",
+        "S3_BUCKET": "",
+        "TRENDING_THRESHOLD": "1e9",
+    })
+    import app as meme_app
+    from meme_cache import DictMemeTier, MemeCache, RedisMemeTier
+
+    client = meme_app.app.test_client()
+    client.post("/register", data={"email": "bench@example.com", "password": "bench-password"})
+    client.post("/login", data={"email": "bench@example.com", "password": "bench-password"})
+
+    ids = []
+    for i in range(args.memes):
+        meme_id = f"bench-{i:06d}"
+        meme_app.repo.memes.put({
+            "meme_id": meme_id, "user": "bench@example.com", "title": f"meme {i}", "description": "benchmark",
+            "category": "Tech", "tags": ["bench"], "labels": [], "detected_text": "", "likes": 0, "views": 0,
+            "downloads": 0, "status": "approved", "reject_reasons": [], "created_at": f"2026-01-01T00:00:00.{i:06d}",
+            "image_key": f"memes/{i:064x}.png", "variants": [], "comment_count": 0
+        })
+        ids.append(meme_id)
+    # Popularity ~ 1/rank, like a feed where a few memes get most of the views
+    weights = [1 / (rank + 1) for rank in range(len(ids))]
+    rng = random.Random(args.seed)
+    sequence = rng.choices(ids, weights=weights, k=args.requests)
+
+    if args.redis_url:
+        import redis
+        shared = RedisMemeTier(redis.Redis.from_url(args.redis_url), prefix=f"bench:{os.getpid()}:")
+    else:
+        shared = DictMemeTier()
+    modes = [
+        ("off", 0, None),
+        ("lru", 2048, None),
+        ("lru+shared", 2048, shared),
+    ]
+    rows = []
+    for name, maxsize, tier in modes:
+        store = DelayedMemeStore(meme_app.repo.memes, args.store_latency / 1000)
+        caches = [MemeCache(store, shared=tier, maxsize=maxsize, ttl=args.ttl) for _ in range(max(1, args.workers))]
+        client.get(f"/view/{ids[0]}")  # warm templates
+        store.calls = 0
+        latencies = []
+        for i, meme_id in enumerate(sequence):
+            meme_app.meme_cache = caches[i % len(caches)]
+            start = time.perf_counter()
+            resp = client.get(f"/view/{meme_id}")
+            latencies.append(time.perf_counter() - start)
+            if resp.status_code != 200:
+                sys.exit(f"/view/{meme_id} returned {resp.status_code}")
+        stats = {key: sum(cache.stats()[key] for cache in caches) for key in ("hits", "shared_hits", "misses")}
+        rows.append((name, percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000,
+                     len(latencies) / sum(latencies), store.calls, stats))
+
+    print(f"{args.backend} backend, {args.memes} memes, {args.requests} views over {len(caches)} workers, "
+          f"store latency {args.store_latency} ms")
+    print(f"{'cache':12s}{'p50 ms':>9s}{'p99 ms':>9s}{'req/s':>9s}{'store reads':>13s}{'hits':>8s}{'shared':>8s}{'misses':>8s}")
+    for name, p50, p99, rate, reads, stats in rows:
+        print(f"{name:12s}{p50:9.3f}{p99:9.3f}{rate:9.0f}{reads:13d}"
+              f"{stats['hits']:8d}{stats['shared_hits']:8d}{stats['misses']:8d}")
+    meme_app.counter_buffer.close()
+
+
+if __name__ == "__main__":
+    main()
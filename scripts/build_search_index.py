@@ -0,0 +1,80 @@
+"""Write the search index segment that the app's workers map.
+
+Workers never save the index: each only holds the memes it has seen, so
+several of them saving would each replace the others' segment. Run this
+instead (from cron, or after a deploy) as the one writer. It indexes the
+approved memes in the app's memes store, read from the same .env settings
+(STORAGE_BACKEND with SQLITE_PATH or MEMES_TABLE), and saves a new segment
+under SEARCH_INDEX_DIR; workers switch to it within SEARCH_REFRESH_INTERVAL.
+
+By default the index is rebuilt from scratch, which also drops deleted
+memes. --incremental starts from the current segment and adds only memes
+uploaded since it was written (less an hour for analysis still running).
+Usage: python scripts/build_search_index.py --backend dynamodb --index-dir search_index
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dotenv import load_dotenv
+
+from repository import dynamo_repository, sqlite_repository
+from search import SearchIndex
+
+FIELDS = ["meme_id", "title", "description", "tags", "labels", "detected_text", "status"]
+
+
+def build(args):
+    if args.backend == "sqlite":
+        return sqlite_repository(args.sqlite_path, None)
+    import boto3
+    resource = boto3.Session(region_name=args.region).resource("dynamodb")
+    return dynamo_repository(
+        resource,
+        None,
+        users_table=os.environ.get("USERS_TABLE", "UsersTable"),
+        memes_table=args.table,
+        likes_table=os.environ.get("LIKES_TABLE", "MemeLikes"),
+        comments_table=os.environ.get("COMMENTS_TABLE", "MemeComments"),
+        browse_table=os.environ.get("BROWSE_TABLE", "MemeBrowse"),
+        activity_table=os.environ.get("ACTIVITY_LOG_TABLE", "ActivityLogTable"),
+        counters_table=os.environ.get("COUNTERS_TABLE"),
+        validate_indexes=False
+    )
+
+
+def main():
+    load_dotenv(os.path.join(ROOT, ".env"))
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=("sqlite", "dynamodb"),
+                        default=os.environ.get("STORAGE_BACKEND", "sqlite").lower())
+    parser.add_argument("--sqlite-path", default=os.environ.get("SQLITE_PATH", os.path.join(ROOT, "meme_museum.sqlite3")))
+    parser.add_argument("--table", default=os.environ.get("MEMES_TABLE", "MemeTable"))
+    parser.add_argument("--region", default=os.environ.get("AWS_DEFAULT_REGION", "us-east-1"))
+    parser.add_argument("--index-dir", default=os.environ.get("SEARCH_INDEX_DIR"), required=not os.environ.get("SEARCH_INDEX_DIR"))
+    parser.add_argument("--incremental", action="store_true", help="add to the current segment instead of rebuilding")
+    args = parser.parse_args()
+
+    repo = build(args)
+    index = SearchIndex(args.index_dir if args.incremental else None)
+    since = None
+    if index.built_at:
+        since = (datetime.fromisoformat(index.built_at) - timedelta(hours=1)).isoformat()
+    start = time.perf_counter()
+    added = 0
+    for item in repo.memes.scan(approved_only=True, since=since, fields=FIELDS):
+        index.add(item["meme_id"], item)
+        added += 1
+    index.save(args.index_dir)
+    print(f"Indexed {added} memes ({len(index)} in the segment) in {time.perf_counter() - start:.1f}s")
+    index.close()
+    repo.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,18 @@
 """Bootstrap script to create required DynamoDB tables for Meme Museum.
 Run locally with AWS credentials or on an EC2 instance with proper IAM role.
+Existing tables are checked for missing GSIs, which are added in place.
 """
+import os
+import sys
+import time
+
 import boto3
 import botocore
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pagination import FEED_CARD_FIELDS
+
 AWS_REGION = "us-east-1"
 
 dynamodb = boto3.client("dynamodb", region_name=AWS_REGION)
@@ -22,6 +31,10 @@ TABLES = [
             {"AttributeName": "meme_id", "AttributeType": "S"},
             {"AttributeName": "user", "AttributeType": "S"},
             {"AttributeName": "created_at", "AttributeType": "S"},
+            {"AttributeName": "browse_category", "AttributeType": "S"},
+            {"AttributeName": "analysis_state", "AttributeType": "S"},
+            {"AttributeName": "image_key", "AttributeType": "S"},
+            {"AttributeName": "status", "AttributeType": "S"},
         ],
         "BillingMode": "PAY_PER_REQUEST",
         "GlobalSecondaryIndexes": [
@@ -29,6 +42,39 @@ TABLES = [
                 "IndexName": "by_user",
                 "KeySchema": [{"AttributeName": "user", "KeyType": "HASH"}, {"AttributeName": "created_at", "KeyType": "RANGE"}],
                 "Projection": {"ProjectionType": "ALL"}
+            },
+            {
+                # Card-only projection for dashboard/feed pages
+                "IndexName": "feed_by_user",
+                "KeySchema": [{"AttributeName": "user", "KeyType": "HASH"}, {"AttributeName": "created_at", "KeyType": "RANGE"}],
+                "Projection": {"ProjectionType": "INCLUDE", "NonKeyAttributes": FEED_CARD_FIELDS}
+            },
+            {
+                # Sparse category browse index (browse_category is set on approval)
+                "IndexName": "by_category",
+                "KeySchema": [{"AttributeName": "browse_category", "KeyType": "HASH"}, {"AttributeName": "created_at", "KeyType": "RANGE"}],
+                "Projection": {"ProjectionType": "INCLUDE", "NonKeyAttributes": ["user"] + FEED_CARD_FIELDS}
+            },
+            {
+                # Sparse index of memes awaiting analysis (analysis_state is
+                # removed when the status leaves pending), for job recovery
+                "IndexName": "pending_analysis",
+                "KeySchema": [{"AttributeName": "analysis_state", "KeyType": "HASH"}, {"AttributeName": "created_at", "KeyType": "RANGE"}],
+                "Projection": {"ProjectionType": "KEYS_ONLY"}
+            },
+            {
+                # Memes sharing a (content-addressed) image, for checking
+                # who may see it and deleting it with the last of them
+                "IndexName": "by_image",
+                "KeySchema": [{"AttributeName": "image_key", "KeyType": "HASH"}],
+                "Projection": {"ProjectionType": "INCLUDE", "NonKeyAttributes": ["user", "status"]}
+            },
+            {
+                # Approved memes in time order, for search index catch-ups
+                # and backfills (scan(approved_only=True) queries it)
+                "IndexName": "by_status",
+                "KeySchema": [{"AttributeName": "status", "KeyType": "HASH"}, {"AttributeName": "created_at", "KeyType": "RANGE"}],
+                "Projection": {"ProjectionType": "ALL"}
             }
         ]
     },
@@ -41,14 +87,57 @@ TABLES = [
         ],
         "BillingMode": "PAY_PER_REQUEST",
     },
+    {
+        "TableName": "MemeAnalysisCache",
+        "KeySchema": [{"AttributeName": "content_hash", "KeyType": "HASH"}],
+        "AttributeDefinitions": [{"AttributeName": "content_hash", "AttributeType": "S"}],
+        "BillingMode": "PAY_PER_REQUEST",
+    },
+    {
+        # Comments per meme, comment_id = "<created_at>#<suffix>" keeps them in time order
+        "TableName": "MemeComments",
+        "KeySchema": [{"AttributeName": "meme_id", "KeyType": "HASH"}, {"AttributeName": "comment_id", "KeyType": "RANGE"}],
+        "AttributeDefinitions": [
+            {"AttributeName": "meme_id", "AttributeType": "S"},
+            {"AttributeName": "comment_id", "AttributeType": "S"}
+        ],
+        "BillingMode": "PAY_PER_REQUEST",
+    },
+    {
+        # Sharded view/like/download counters (<meme_id>#<shard>)
+        "TableName": "MemeCounters",
+        "KeySchema": [{"AttributeName": "counter_id", "KeyType": "HASH"}],
+        "AttributeDefinitions": [{"AttributeName": "counter_id", "AttributeType": "S"}],
+        "BillingMode": "PAY_PER_REQUEST",
+    },
+    {
+        # Tag adjacency items (TAG#<tag>, <created_at>#<meme_id>) and browse counts (COUNTS, <kind>#<name>)
+        "TableName": "MemeBrowse",
+        "KeySchema": [{"AttributeName": "pk", "KeyType": "HASH"}, {"AttributeName": "sk", "KeyType": "RANGE"}],
+        "AttributeDefinitions": [
+            {"AttributeName": "pk", "AttributeType": "S"},
+            {"AttributeName": "sk", "AttributeType": "S"}
+        ],
+        "BillingMode": "PAY_PER_REQUEST",
+    },
     {
         "TableName": "MemeLogs",
         "KeySchema": [{"AttributeName": "id", "KeyType": "HASH"}],
         "AttributeDefinitions": [{"AttributeName": "id", "AttributeType": "S"}],
         "BillingMode": "PAY_PER_REQUEST",
+    },
+    {
+        # Server-side sessions (sessions.DynamoSessionStore), keyed by the SHA-256 of the cookie's id
+        "TableName": "MemeSessions",
+        "KeySchema": [{"AttributeName": "session_id", "KeyType": "HASH"}],
+        "AttributeDefinitions": [{"AttributeName": "session_id", "AttributeType": "S"}],
+        "BillingMode": "PAY_PER_REQUEST",
     }
 ]
 
+# Tables whose items DynamoDB deletes once the (epoch seconds) attribute has passed
+TTL_ATTRIBUTES = {"MemeSessions": "expires_at"}
+
 
 def table_exists(name):
     try:
@@ -58,15 +147,59 @@ def table_exists(name):
         return False
 
 
+def wait_for_index(table_name, index_name):
+    while True:
+        table = dynamodb.describe_table(TableName=table_name)["Table"]
+        statuses = {g["IndexName"]: g["IndexStatus"] for g in table.get("GlobalSecondaryIndexes", [])}
+        if statuses.get(index_name) == "ACTIVE":
+            return
+        time.sleep(10)
+
+
+def ensure_indexes(defn):
+    """Create any GSI from ``defn`` that is missing on the existing table (one at a time)."""
+    name = defn["TableName"]
+    table = dynamodb.describe_table(TableName=name)["Table"]
+    existing = {g["IndexName"] for g in table.get("GlobalSecondaryIndexes", [])}
+    for gsi in defn.get("GlobalSecondaryIndexes", []):
+        if gsi["IndexName"] in existing:
+            continue
+        print(f"Adding index {gsi['IndexName']} to {name} ...")
+        dynamodb.update_table(
+            TableName=name,
+            AttributeDefinitions=defn["AttributeDefinitions"],
+            GlobalSecondaryIndexUpdates=[{"Create": gsi}]
+        )
+        wait_for_index(name, gsi["IndexName"])
+        print(f"Index {gsi['IndexName']} active.")
+
+
+def ensure_ttl(name):
+    attribute = TTL_ATTRIBUTES.get(name)
+    if attribute is None:
+        return
+    ttl = dynamodb.describe_time_to_live(TableName=name)["TimeToLiveDescription"]
+    if ttl.get("TimeToLiveStatus") in ("ENABLED", "ENABLING"):
+        return
+    dynamodb.update_time_to_live(
+        TableName=name,
+        TimeToLiveSpecification={"Enabled": True, "AttributeName": attribute}
+    )
+    print(f"TTL on {name}.{attribute} enabled.")
+
+
 def create_table(defn):
     name = defn["TableName"]
     if table_exists(name):
-        print(f"Table {name} already exists. Skipping.")
+        print(f"Table {name} already exists. Checking indexes.")
+        ensure_indexes(defn)
+        ensure_ttl(name)
         return
     print(f"Creating table {name} ...")
     dynamodb.create_table(**defn)
     waiter = boto3.client("dynamodb", region_name=AWS_REGION).get_waiter('table_exists')
     waiter.wait(TableName=name)
+    ensure_ttl(name)
     print(f"Table {name} created.")
 
 
@@ -0,0 +1,89 @@
+"""Move comments embedded in meme items into the comments table.
+
+Streams the memes table page by page, writes each embedded comment to the
+comments table with batch_writer (ids are derived from the comment, so a
+re-run overwrites rather than duplicates), then sets the meme's
+comment_count and removes the embedded list. The final update is
+conditional on the list being unchanged, so a meme that gained a comment
+mid-migration is reported and left for the next run.
+Usage: python scripts/migrate_comments.py --memes-table MemeItems --comments-table MemeComments --region us-east-1
+"""
+import argparse
+import os
+import sys
+
+import boto3
+import botocore
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from comments import legacy_comment_id
+
+
+def memes_with_comments(table):
+    """Yield (meme_id, comments) for items that still embed comments."""
+    kwargs = {
+        "ProjectionExpression": "meme_id, comments",
+        "FilterExpression": "attribute_exists(comments)"
+    }
+    while True:
+        resp = table.scan(**kwargs)
+        for item in resp.get("Items", []):
+            yield item["meme_id"], item.get("comments") or []
+        if "LastEvaluatedKey" not in resp:
+            return
+        kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--memes-table", default=os.environ.get("MEMES_TABLE", "MemeItems"))
+    parser.add_argument("--comments-table", default=os.environ.get("COMMENTS_TABLE", "MemeComments"))
+    parser.add_argument("--region", default=os.environ.get("AWS_DEFAULT_REGION", "us-east-1"))
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    dynamodb = boto3.Session(region_name=args.region).resource("dynamodb")
+    memes = dynamodb.Table(args.memes_table)
+    comments = dynamodb.Table(args.comments_table)
+
+    migrated_memes = 0
+    migrated_comments = 0
+    skipped = 0
+    for meme_id, embedded in memes_with_comments(memes):
+        if args.dry_run:
+            print(f"{meme_id}: {len(embedded)} comments")
+            migrated_memes += 1
+            migrated_comments += len(embedded)
+            continue
+        with comments.batch_writer() as batch:
+            for position, c in enumerate(embedded):
+                batch.put_item(Item={
+                    "meme_id": meme_id,
+                    "comment_id": legacy_comment_id(meme_id, position, c),
+                    "user": c.get("user", ""),
+                    "text": c.get("text", ""),
+                    "ts": c.get("ts", "")
+                })
+        try:
+            memes.update_item(
+                Key={"meme_id": meme_id},
+                UpdateExpression="SET comment_count = if_not_exists(comment_count, :zero) + :n REMOVE comments",
+                ConditionExpression="size(comments) = :n",
+                ExpressionAttributeValues={":n": len(embedded), ":zero": 0}
+            )
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            print(f"{meme_id}: comments changed during migration, re-run to finish")
+            skipped += 1
+            continue
+        migrated_memes += 1
+        migrated_comments += len(embedded)
+
+    action = "Would migrate" if args.dry_run else "Migrated"
+    print(f"{action} {migrated_comments} comments from {migrated_memes} memes ({skipped} to retry)")
+
+
+if __name__ == "__main__":
+    main()
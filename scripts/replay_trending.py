@@ -0,0 +1,67 @@
+"""Replay an activity log through the trending tracker.
+
+Reads JSON-lines activity events (app.py's ACTIVITY_LOG_FILE, or an
+export of ActivityLogTable in the same shape) in order, feeds them to a
+TrendingTracker with the given settings, and prints each alert as it
+fires and the top memes overall and per category as of the last event.
+Views are not in the activity log, so scores here come from likes,
+downloads and comments only.
+Usage: python scripts/replay_trending.py activity_log.jsonl --half-life-hours 6 --threshold 20
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from trending import TrendingTracker, parse_ts, replay
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("log", help="JSON-lines activity log ('-' for stdin)")
+    parser.add_argument("--half-life-hours", type=float, default=6)
+    parser.add_argument("--threshold", type=float, default=50)
+    parser.add_argument("--cooldown-hours", type=float, default=24)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    current = {"ts": None}
+
+    def alert(meme_id, category, score):
+        print(f"{current['ts']}  TRENDING {meme_id} ({category or '-'}) score {score:.1f}")
+
+    tracker = TrendingTracker(
+        half_life=args.half_life_hours * 3600,
+        threshold=args.threshold,
+        on_trending=alert,
+        alert_cooldown=args.cooldown_hours * 3600
+    )
+    counted = 0
+    f = sys.stdin if args.log == "-" else open(args.log, encoding="utf-8")
+    try:
+        for line in f:
+            try:
+                current["ts"] = json.loads(line).get("ts")
+            except ValueError:
+                continue
+            counted += replay(tracker, [line])
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+    at = parse_ts(current["ts"]) if current["ts"] else None
+    when = datetime.fromtimestamp(at, timezone.utc).isoformat() if at else "-"
+    print(f"\n{counted} events, {tracker.stats()['alerts']} alerts; top memes as of {when}:")
+    for score, meme_id in tracker.top(args.top, ts=at):
+        print(f"  {score:8.1f}  {meme_id}")
+    for category in tracker.categories():
+        print(f"\n{category}:")
+        for score, meme_id in tracker.top(args.top, category, ts=at):
+            print(f"  {score:8.1f}  {meme_id}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,508 @@
+"""Full-text search over meme titles, descriptions, tags, labels and OCR text.
+
+``SearchIndex`` is an inverted index with BM25 ranking. Text is lower-cased,
+split on non-alphanumerics, stripped of stopwords and lightly stemmed
+(plural and -ed/-ing suffixes), with title and tag words weighted above
+the rest. Each tag is also indexed whole as ``#tag`` so ``#cats`` in a
+query matches the tag exactly and tags can be autocompleted by prefix.
+
+The index has two parts:
+
+* a read-only on-disk segment, written by ``save()`` and memory-mapped by
+  the next process that opens the directory, so a restart does not
+  re-tokenise every meme. Its files are flat arrays (uint32 doc ordinals,
+  uint16 term frequencies, uint32 doc lengths, fixed-width doc ids sorted
+  so an id is found by binary search) plus a sorted term dictionary.
+* an in-memory delta of memes added since the segment was written, and a
+  set of segment ordinals deleted (or replaced) since.
+
+Very common terms would make every query walk hundreds of thousands of
+postings, so a segment also stores, for each term in more than
+``HEAD_MIN_DF`` memes, its ``HEAD_SIZE`` postings with the highest BM25
+term weight. Queries whose page falls within that head read only the head
+for such terms, plus an exact lookup for memes already matched by rarer
+query terms; ranking of memes matching only common terms is approximate
+below the head, and deeper pages fall back to a full scan.
+
+``add()`` / ``remove()`` touch only the delta, so uploads and deletes are
+incremental. ``save()`` merges both into a new segment directory, points
+``CURRENT`` at it and deletes the other segments; readers that still map a
+previous segment keep working, and ``outdated()`` tells them a newer one
+is there. ``save()`` is for a single writer: two processes saving deltas
+of their own would each drop what only the other had indexed.
+"""
+import array
+import bisect
+import heapq
+import itertools
+import json
+import math
+import mmap
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import uuid
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+TAG_QUERY_RE = re.compile(r"#([^\s#]+)")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i in is it its me my of on or so "
+    "that the this to was were when will with you your".split()
+)
+# Term frequency multiplier per field
+FIELD_WEIGHTS = (("title", 3), ("tags", 2), ("description", 1), ("labels", 1), ("detected_text", 1))
+TAG_MARK = "#"
+MAX_TF = 0xFFFF
+HEAD_MIN_DF = 5000
+HEAD_SIZE = 1000
+
+
+def stem(word: str) -> str:
+    """Light suffix stripping: plurals and -ed / -ing (``memes`` -> ``meme``, ``running`` -> ``run``)."""
+    if len(word) <= 3 or word.isdigit():
+        return word
+    if word.endswith("sses"):
+        return word[:-2]
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    for suffix in ("ing", "ed"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            base = word[:-len(suffix)]
+            if base[-1] == base[-2] and base[-1] not in "lsz":
+                base = base[:-1]  # running -> run, but not falling -> fal
+            return base
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> list:
+    return [stem(t) for t in TOKEN_RE.findall((text or "").lower()) if t not in STOPWORDS]
+
+
+def tag_term(tag: str) -> str:
+    return TAG_MARK + re.sub(r"\s+", "-", tag.strip().lower())
+
+
+def document_terms(meme: dict) -> dict:
+    """{term: weighted frequency} for a meme's searchable fields."""
+    terms = {}
+    for field, weight in FIELD_WEIGHTS:
+        value = meme.get(field) or ""
+        if isinstance(value, (list, tuple)):
+            value = " ".join(str(v) for v in value)
+        for term in tokenize(value):
+            terms[term] = terms.get(term, 0) + weight
+    for tag in meme.get("tags") or []:
+        if tag.strip():
+            terms[tag_term(tag)] = 1
+    return terms
+
+
+def parse_query(query: str) -> list:
+    """Query terms: ``#tag`` tokens as whole-tag terms, the rest tokenised."""
+    tags = [tag_term(t) for t in TAG_QUERY_RE.findall(query or "")]
+    return list(dict.fromkeys(tags + tokenize(TAG_QUERY_RE.sub(" ", query or ""))))
+
+
+def _map_array(path: str, typecode: str):
+    """Memory-map a file of native-endian ``typecode`` values. Returns (mmap, view)."""
+    if os.path.getsize(path) == 0:
+        return None, memoryview(array.array(typecode))
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return mm, memoryview(mm).cast(typecode)
+
+
+class Segment:
+    """Read-only, memory-mapped index segment (see the module docstring)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("byteorder") != sys.byteorder:
+            raise ValueError(f"Segment {path} was written on a {meta.get('byteorder')}-endian machine")
+        self.doc_count = meta["doc_count"]
+        self.total_length = meta["total_length"]
+        self.id_width = meta["id_width"]
+        self.built_at = meta.get("built_at")
+        self.terms = []
+        self.offsets = array.array("Q")
+        self.counts = array.array("I")
+        self.head_offsets = array.array("Q")
+        self.head_counts = array.array("I")
+        with open(os.path.join(path, "terms.txt"), encoding="utf-8") as f:
+            for line in f:
+                term, offset, count, head_offset, head_count = line.rstrip("\n").split("\t")
+                self.terms.append(term)
+                self.offsets.append(int(offset))
+                self.counts.append(int(count))
+                self.head_offsets.append(int(head_offset))
+                self.head_counts.append(int(head_count))
+        self._maps = []
+        self.ords = self._map("postings.bin", "I")
+        self.tfs = self._map("tfs.bin", "H")
+        self.head_ords = self._map("heads.bin", "I")
+        self.head_tfs = self._map("head_tfs.bin", "H")
+        self.lengths = self._map("lengths.bin", "I")
+        self.ids = self._map("ids.bin", "B")
+
+    def _map(self, name: str, typecode: str):
+        mm, view = _map_array(os.path.join(self.path, name), typecode)
+        self._maps.append((mm, view))
+        return view
+
+    def _term_index(self, term: str):
+        i = bisect.bisect_left(self.terms, term)
+        return i if i < len(self.terms) and self.terms[i] == term else None
+
+    def df(self, term: str) -> int:
+        i = self._term_index(term)
+        return self.counts[i] if i is not None else 0
+
+    def postings(self, term: str):
+        """(ordinals, frequencies) views for ``term``, or None."""
+        i = self._term_index(term)
+        if i is None:
+            return None
+        start, end = self.offsets[i], self.offsets[i] + self.counts[i]
+        return self.ords[start:end], self.tfs[start:end]
+
+    def head(self, term: str):
+        """(ordinals, frequencies) of the term's highest-weight postings, or None if it has no head."""
+        i = self._term_index(term)
+        if i is None or not self.head_counts[i]:
+            return None
+        start, end = self.head_offsets[i], self.head_offsets[i] + self.head_counts[i]
+        return self.head_ords[start:end], self.head_tfs[start:end]
+
+    def doc_id(self, ordinal: int) -> str:
+        w = self.id_width
+        return bytes(self.ids[ordinal * w:(ordinal + 1) * w]).rstrip(b"\0").decode("utf-8")
+
+    def ordinal(self, doc_id: str):
+        """Binary search the sorted fixed-width id table."""
+        lo, hi = 0, self.doc_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.doc_id(mid) < doc_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self.doc_count and self.doc_id(lo) == doc_id else None
+
+    def terms_with_prefix(self, prefix: str):
+        i = bisect.bisect_left(self.terms, prefix)
+        while i < len(self.terms) and self.terms[i].startswith(prefix):
+            yield self.terms[i], self.counts[i]
+            i += 1
+
+    def close(self):
+        for mm, view in self._maps:
+            view.release()
+            if mm is not None:
+                mm.close()
+        self._maps = []
+
+
+def _current_segment_path(root: str):
+    try:
+        with open(os.path.join(root, "CURRENT")) as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+    path = os.path.join(root, name)
+    return path if name and os.path.isdir(path) else None
+
+
+class SearchIndex:
+    """BM25 inverted index: on-disk segment + in-memory delta."""
+
+    def __init__(self, root: str = None, k1: float = 1.2, b: float = 0.75):
+        self.root = root
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._segment = None
+        self._deleted = set()  # segment ordinals removed or replaced since load
+        self._postings = {}  # delta: {term: {doc_id: tf}}
+        self._docs = {}  # delta: {doc_id: {term: tf}}
+        self._lengths = {}  # delta: {doc_id: length}
+        self._tag_terms = []  # delta tag terms, sorted, for autocomplete
+        self._total_length = 0
+        self.dirty = False
+        if root:
+            path = _current_segment_path(root)
+            if path:
+                self._segment = Segment(path)
+                self._total_length = self._segment.total_length
+
+    def outdated(self) -> bool:
+        """True when ``CURRENT`` names a segment other than the loaded one."""
+        if not self.root:
+            return False
+        path = _current_segment_path(self.root)
+        loaded = self._segment.path if self._segment else None
+        return path is not None and path != loaded
+
+    @property
+    def built_at(self):
+        """When the loaded segment was written (ISO time), or None."""
+        return self._segment.built_at if self._segment else None
+
+    def __len__(self):
+        seg = self._segment.doc_count - len(self._deleted) if self._segment else 0
+        return seg + len(self._docs)
+
+    def __contains__(self, doc_id):
+        if doc_id in self._docs:
+            return True
+        if self._segment is None:
+            return False
+        ordinal = self._segment.ordinal(doc_id)
+        return ordinal is not None and ordinal not in self._deleted
+
+    # ---- updates -------------------------------------------------------
+    def add(self, doc_id: str, meme: dict):
+        """Index (or re-index) a meme's text."""
+        terms = document_terms(meme)
+        with self._lock:
+            self._remove(doc_id)
+            length = sum(terms.values())
+            self._docs[doc_id] = terms
+            self._lengths[doc_id] = length
+            self._total_length += length
+            for term, tf in terms.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = {}
+                    if term.startswith(TAG_MARK):
+                        bisect.insort(self._tag_terms, term)
+                postings[doc_id] = tf
+            self.dirty = True
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id: str):
+        terms = self._docs.pop(doc_id, None)
+        if terms is not None:
+            self._total_length -= self._lengths.pop(doc_id)
+            for term in terms:
+                postings = self._postings[term]
+                del postings[doc_id]
+                if not postings:
+                    del self._postings[term]
+                    if term.startswith(TAG_MARK):
+                        i = bisect.bisect_left(self._tag_terms, term)
+                        del self._tag_terms[i]
+            self.dirty = True
+            return
+        if self._segment is not None:
+            ordinal = self._segment.ordinal(doc_id)
+            if ordinal is not None and ordinal not in self._deleted:
+                self._deleted.add(ordinal)
+                self._total_length -= self._segment.lengths[ordinal]
+                self.dirty = True
+
+    # ---- queries -------------------------------------------------------
+    def search(self, query: str, limit: int = 20, offset: int = 0, exact: bool = False):
+        """
+        Return (total matches, [(score, doc_id), ...]) for one page, best
+        first. ``exact`` scores full posting lists even for common terms.
+        """
+        terms = parse_query(query)
+        with self._lock:
+            n = len(self)
+            if not terms or n == 0:
+                return 0, []
+            avgdl = self._total_length / n or 1.0
+            k1 = self.k1
+            base = k1 * (1 - self.b)
+            slope = k1 * self.b / avgdl
+            seg = self._segment
+            deleted = self._deleted
+            seg_scores = {}
+            delta_scores = {}
+            matched = []
+            for term in terms:
+                seg_postings = seg.postings(term) if seg is not None else None
+                delta_postings = self._postings.get(term, {})
+                df = (len(seg_postings[0]) if seg_postings else 0) + len(delta_postings)
+                if df:
+                    matched.append((df, term, seg_postings, delta_postings))
+            estimate = 0
+            # Rarest terms first, so common terms can be limited to their heads
+            for df, term, seg_postings, delta_postings in sorted(matched, key=lambda m: m[0]):
+                df = min(df, n)  # segment postings still count deleted memes
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5)) * (k1 + 1)
+                if seg_postings:
+                    lengths = seg.lengths
+                    get = seg_scores.get
+                    ords, tfs = seg_postings
+                    head = seg.head(term) if not exact and offset + limit <= HEAD_SIZE else None
+                    if head is not None and len(seg_scores) * 16 < len(ords):
+                        estimate = max(estimate, df)
+                        candidates = set(seg_scores)
+                        for ordinal in candidates:
+                            i = bisect.bisect_left(ords, ordinal)
+                            if i < len(ords) and ords[i] == ordinal:
+                                tf = tfs[i]
+                                seg_scores[ordinal] += idf * tf / (tf + base + slope * lengths[ordinal])
+                        ords, tfs = head
+                    else:
+                        candidates = ()
+                    for ordinal, tf in zip(ords, tfs):
+                        if ordinal in candidates or (deleted and ordinal in deleted):
+                            continue
+                        seg_scores[ordinal] = get(ordinal, 0.0) + idf * tf / (tf + base + slope * lengths[ordinal])
+                lengths = self._lengths
+                for doc_id, tf in delta_postings.items():
+                    delta_scores[doc_id] = delta_scores.get(doc_id, 0.0) + idf * tf / (tf + base + slope * lengths[doc_id])
+            total = max(len(seg_scores) + len(delta_scores), estimate)
+            top = heapq.nlargest(
+                offset + limit,
+                itertools.chain(
+                    ((score, True, key) for key, score in seg_scores.items()),
+                    ((score, False, key) for key, score in delta_scores.items())
+                ),
+                key=lambda hit: hit[0]
+            )[offset:]
+            return total, [(score, seg.doc_id(key) if in_seg else key) for score, in_seg, key in top]
+
+    def suggest_tags(self, prefix: str, limit: int = 10) -> list:
+        """Most used tags starting with ``prefix``: [(tag, count), ...]."""
+        term_prefix = tag_term(prefix) if prefix.strip() else TAG_MARK
+        counts = {}
+        with self._lock:
+            if self._segment is not None:
+                # Segment counts include memes deleted since it was written
+                for term, count in self._segment.terms_with_prefix(term_prefix):
+                    counts[term] = count
+            i = bisect.bisect_left(self._tag_terms, term_prefix)
+            while i < len(self._tag_terms) and self._tag_terms[i].startswith(term_prefix):
+                term = self._tag_terms[i]
+                counts[term] = counts.get(term, 0) + len(self._postings[term])
+                i += 1
+        best = heapq.nlargest(limit, counts.items(), key=lambda kv: (kv[1], [-ord(c) for c in kv[0]]))
+        return [(term[len(TAG_MARK):], count) for term, count in best]
+
+    # ---- persistence ---------------------------------------------------
+    def save(self, root: str = None):
+        """Merge the segment and delta into a new segment under ``root`` and switch to it."""
+        root = root or self.root
+        if not root:
+            raise ValueError("No index directory configured")
+        os.makedirs(root, exist_ok=True)
+        name = f"seg-{int(time.time())}-{uuid.uuid4().hex[:8]}"
+        path = os.path.join(root, name)
+        with self._lock:
+            self._write_segment(path)
+            tmp = os.path.join(root, f"CURRENT.{uuid.uuid4().hex}")
+            with open(tmp, "w") as f:
+                f.write(name)
+            os.replace(tmp, os.path.join(root, "CURRENT"))
+            old = self._segment
+            self._segment = Segment(path)
+            self._deleted = set()
+            self._postings = {}
+            self._docs = {}
+            self._lengths = {}
+            self._tag_terms = []
+            self._total_length = self._segment.total_length
+            self.root = root
+            self.dirty = False
+        if old is not None:
+            old.close()
+        # Unlinking mapped files is safe: other processes keep their mappings
+        for entry in os.listdir(root):
+            if entry.startswith("seg-") and entry != name:
+                shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+
+    def _write_segment(self, path: str):
+        seg = self._segment
+        deleted = self._deleted
+        os.makedirs(path)
+
+        # New ordinals: live segment ids and delta ids merged in sorted order
+        seg_live = (
+            (seg.doc_id(o), o) for o in range(seg.doc_count) if o not in deleted
+        ) if seg is not None else iter(())
+        delta_ids = ((doc_id, None) for doc_id in sorted(self._docs))
+        remap = array.array("i", [-1]) * (seg.doc_count if seg is not None else 0)
+        delta_ordinals = {}
+        id_width = max([len(d.encode("utf-8")) for d in self._docs] + [seg.id_width if seg else 1])
+        lengths = array.array("I")
+        doc_count = 0
+        total_length = 0
+        with open(os.path.join(path, "ids.bin"), "wb") as ids_file:
+            for doc_id, old in heapq.merge(seg_live, delta_ids, key=lambda d: d[0]):
+                if old is not None:
+                    remap[old] = doc_count
+                    length = seg.lengths[old]
+                else:
+                    delta_ordinals[doc_id] = doc_count
+                    length = self._lengths[doc_id]
+                ids_file.write(doc_id.encode("utf-8").ljust(id_width, b"\0"))
+                lengths.append(length)
+                total_length += length
+                doc_count += 1
+        with open(os.path.join(path, "lengths.bin"), "wb") as f:
+            lengths.tofile(f)
+
+        seg_terms = seg.terms if seg is not None else []
+        avgdl = total_length / doc_count if doc_count else 1.0
+        base = self.k1 * (1 - self.b)
+        slope = self.k1 * self.b / avgdl
+        offset = 0
+        head_offset = 0
+        last_term = None
+        with open(os.path.join(path, "terms.txt"), "w", encoding="utf-8") as terms_file, \
+                open(os.path.join(path, "postings.bin"), "wb") as ords_file, \
+                open(os.path.join(path, "tfs.bin"), "wb") as tfs_file, \
+                open(os.path.join(path, "heads.bin"), "wb") as heads_file, \
+                open(os.path.join(path, "head_tfs.bin"), "wb") as head_tfs_file:
+            for term in heapq.merge(seg_terms, sorted(self._postings)):
+                if term == last_term:
+                    continue  # in both the segment and the delta
+                last_term = term
+                pairs = []
+                seg_postings = seg.postings(term) if seg is not None else None
+                if seg_postings:
+                    pairs.extend((remap[o], tf) for o, tf in zip(*seg_postings) if remap[o] >= 0)
+                for doc_id, tf in self._postings.get(term, {}).items():
+                    pairs.append((delta_ordinals[doc_id], min(tf, MAX_TF)))
+                if not pairs:
+                    continue
+                pairs.sort()
+                array.array("I", [o for o, _ in pairs]).tofile(ords_file)
+                array.array("H", [tf for _, tf in pairs]).tofile(tfs_file)
+                head = []
+                if len(pairs) > HEAD_MIN_DF:
+                    head = heapq.nlargest(HEAD_SIZE, pairs, key=lambda p: p[1] / (p[1] + base + slope * lengths[p[0]]))
+                    array.array("I", [o for o, _ in head]).tofile(heads_file)
+                    array.array("H", [tf for _, tf in head]).tofile(head_tfs_file)
+                terms_file.write(f"{term}\t{offset}\t{len(pairs)}\t{head_offset}\t{len(head)}\n")
+                offset += len(pairs)
+                head_offset += len(head)
+
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({
+                "version": 1,
+                "byteorder": sys.byteorder,
+                "doc_count": doc_count,
+                "total_length": total_length,
+                "id_width": id_width,
+                "built_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime()),
+            }, f)
+
+    def close(self):
+        with self._lock:
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
@@ -0,0 +1,75 @@
+"""Gunicorn worker modes.
+
+``gunicorn.conf.py`` picks the worker class and counts from these
+settings, and app.py sizes its boto3 connection pools from them, so both
+agree on how many requests one worker can have in flight:
+
+* sync    - one request at a time per worker (the old ``--workers 3``)
+* gthread - WEB_THREADS requests per worker, one OS thread each
+* gevent  - up to WEB_WORKER_CONNECTIONS requests per worker, one
+  greenlet each; socket, ssl, time.sleep and threading are monkey-patched
+  when the worker starts, so a request waiting on DynamoDB, S3, SNS or
+  Rekognition lets the others run
+
+Nothing here imports boto3, ssl or the app: gunicorn reads its config in
+the arbiter, before any gevent worker has patched anything. The only
+dependency is python-dotenv, which loads .env so the arbiter and the
+workers see the same settings and does no networking or threading.
+"""
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+WORKER_CLASSES = ("sync", "gthread", "gevent")
+DEFAULT_WORKER_CONNECTIONS = 100
+DEFAULT_THREADS = 8
+
+
+def worker_class() -> str:
+    name = os.environ.get("WEB_WORKER_CLASS", "sync").lower()
+    if name not in WORKER_CLASSES:
+        raise ValueError(f"WEB_WORKER_CLASS must be one of {', '.join(WORKER_CLASSES)}, not {name!r}")
+    return name
+
+
+def workers() -> int:
+    return max(1, int(os.environ.get("WEB_WORKERS", "3")))
+
+
+def threads() -> int:
+    return max(1, int(os.environ.get("WEB_THREADS", str(DEFAULT_THREADS))))
+
+
+def worker_connections() -> int:
+    return max(1, int(os.environ.get("WEB_WORKER_CONNECTIONS", str(DEFAULT_WORKER_CONNECTIONS))))
+
+
+def worker_concurrency() -> int:
+    """Requests one worker can be serving at the same time."""
+    name = worker_class()
+    if name == "gevent":
+        return worker_connections()
+    if name == "gthread":
+        return threads()
+    return 1
+
+
+def aws_pool_size(background_threads: int = 0) -> int:
+    """
+    HTTP connections for each boto3 client in a worker: one per request in
+    flight plus the worker's background threads (batch reads, flushers),
+    and never below botocore's default of 10. A smaller pool makes
+    requests queue for a connection ("Connection pool is full" warnings).
+    """
+    return max(10, worker_concurrency() + background_threads)
+
+
+def gevent_patched() -> bool:
+    """True inside a gevent worker (sockets are cooperative)."""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("socket")
@@ -0,0 +1,255 @@
+"""Server-side sessions.
+
+Sessions used to be Flask's signed cookies holding ``session["user"]``
+only. Any page wanting more about the user read the users table again,
+and like state lived in a per-worker ``LikedCache``, so a like made on one
+worker was missing on the others until their copy was evicted.
+``ServerSessionInterface`` keeps the session in a store instead. The
+cookie carries a random id, and the store is keyed by its SHA-256, so a
+leaked sessions table cannot be replayed. app.py caches what it derives
+per user there: the profile read at login, and the saved ids and like
+state (re-read once older than SESSION_DERIVED_TTL, since the user may
+change them from another session).
+
+Expiry slides: a session lives ``ttl`` seconds from its last renewal, and
+is renewed (one small write, ``touch``) at most once per
+``renew_interval``, not on every request. The full session is written
+only when a request changes it. Derived state set with ``set_derived()``
+is a cache, so it rides along with the next write, whether a change or a
+renewal.
+
+Stores: ``MemorySessionStore`` (per process, for the memory backend),
+``SQLiteSessionStore`` (a ``sessions`` table shared by every worker on
+the box) and ``DynamoSessionStore`` (a table with DynamoDB TTL on
+``expires_at``; reads are consistent so a login is seen on the next
+request). All three check ``expires_at`` on read, because DynamoDB TTL
+can take a day or two to delete an item.
+"""
+import hashlib
+import json
+import secrets
+import threading
+import time
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from analysis_cache import LRUCache
+
+SESSION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires_at);
+"""
+
+
+def _dumps(data: dict) -> str:
+    return json.dumps(data, separators=(",", ":"))
+
+
+class MemorySessionStore:
+    """Sessions in this process (least recently used dropped past ``max_sessions``)."""
+
+    def __init__(self, max_sessions: int = 100000):
+        self._sessions = LRUCache(max_sessions)  # {key: (json, expires_at)}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        entry = self._sessions.get(key)
+        if entry is None:
+            return None
+        return json.loads(entry[0]), entry[1]
+
+    def set(self, key: str, data: dict, expires_at: float):
+        self._sessions.put(key, (_dumps(data), expires_at))
+
+    def touch(self, key: str, expires_at: float):
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is not None:
+                self._sessions.put(key, (entry[0], expires_at))
+
+    def delete(self, key: str):
+        self._sessions.pop(key)
+
+
+class SQLiteSessionStore:
+    """Sessions in the ``sessions`` table; expired rows are purged every ``purge_every`` writes."""
+
+    def __init__(self, db, purge_every: int = 1000):
+        self.db = db
+        self.purge_every = max(1, int(purge_every))
+        self._writes = 0
+        db.ensure_schema(SESSION_SCHEMA)
+
+    def get(self, key: str):
+        row = self.db.query_one("SELECT data, expires_at FROM sessions WHERE id = ?", (key,))
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, data: dict, expires_at: float):
+        self.db.execute(
+            "INSERT OR REPLACE INTO sessions (id, data, expires_at) VALUES (?, ?, ?)",
+            (key, _dumps(data), expires_at)
+        )
+        self._writes += 1
+        if self._writes % self.purge_every == 0:
+            self.db.execute("DELETE FROM sessions WHERE expires_at < ?", (time.time(),))
+
+    def touch(self, key: str, expires_at: float):
+        self.db.execute("UPDATE sessions SET expires_at = ? WHERE id = ?", (expires_at, key))
+
+    def delete(self, key: str):
+        self.db.execute("DELETE FROM sessions WHERE id = ?", (key,))
+
+
+class DynamoSessionStore:
+    """Sessions as items {session_id, data, expires_at}; enable TTL on ``expires_at`` to delete expired ones."""
+
+    def __init__(self, table):
+        self.table = table
+
+    def get(self, key: str):
+        item = self.table.get_item(Key={"session_id": key}, ConsistentRead=True).get("Item")
+        if item is None:
+            return None
+        return json.loads(item["data"]), float(item["expires_at"])
+
+    def set(self, key: str, data: dict, expires_at: float):
+        self.table.put_item(Item={"session_id": key, "data": _dumps(data), "expires_at": int(expires_at)})
+
+    def touch(self, key: str, expires_at: float):
+        try:
+            self.table.update_item(
+                Key={"session_id": key},
+                UpdateExpression="SET expires_at = :e",
+                ConditionExpression="attribute_exists(session_id)",
+                ExpressionAttributeValues={":e": int(expires_at)}
+            )
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            pass  # deleted (logged out) meanwhile
+
+    def delete(self, key: str):
+        self.table.delete_item(Key={"session_id": key})
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """The session of one request; ``modified`` is set by any change to its keys."""
+
+    def __init__(self, initial: dict = None, sid: str = None, expires_at: float = 0.0):
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.new = sid is None
+        self.modified = False
+        self.stale = False  # derived state changed; saved with the next write
+        self.old_sid = None
+
+    def set_derived(self, key: str, value):
+        """Cache ``value`` without forcing a write (it is saved with the next one)."""
+        dict.__setitem__(self, key, value)
+        self.stale = True
+
+    def regenerate(self):
+        """Move to a new id (on login), so an id set before login is useless after it."""
+        if self.sid is not None:
+            self.old_sid = self.sid
+        self.sid = None
+        self.modified = True
+
+
+class ServerSessionInterface(SessionInterface):
+    """Flask session interface over a session store, with lazily renewed sliding expiry."""
+
+    def __init__(self, store, ttl: float = 7 * 24 * 3600, renew_interval: float = 3600):
+        self.store = store
+        self.ttl = ttl
+        self.renew_interval = min(renew_interval, ttl)
+        self.lookups = 0
+        self.hits = 0
+        self.expired = 0
+        self.writes = 0
+        self.renewals = 0
+        self.deletes = 0
+        self.errors = 0
+
+    @staticmethod
+    def _key(sid: str) -> str:
+        return hashlib.sha256(sid.encode()).hexdigest()
+
+    def open_session(self, app, request) -> ServerSession:
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid:
+            return ServerSession()
+        self.lookups += 1
+        try:
+            found = self.store.get(self._key(sid))
+        except Exception as e:
+            self.errors += 1
+            print(f"Session store error: {e}")
+            return ServerSession()
+        if found is None:
+            return ServerSession()
+        data, expires_at = found
+        if expires_at <= time.time():
+            self.expired += 1
+            return ServerSession()
+        self.hits += 1
+        return ServerSession(data, sid, expires_at)
+
+    def save_session(self, app, session: ServerSession, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        try:
+            if session.old_sid:
+                self.store.delete(self._key(session.old_sid))
+                self.deletes += 1
+            if not session:
+                if session.sid is not None:
+                    # Logged out (cleared): drop it from the store and the browser
+                    self.store.delete(self._key(session.sid))
+                    self.deletes += 1
+                    response.delete_cookie(name, domain=domain, path=path)
+                return
+            now = time.time()
+            expires_at = now + self.ttl
+            if session.modified or session.sid is None:
+                if session.sid is None:
+                    session.sid = secrets.token_urlsafe(32)
+                    response.set_cookie(
+                        name, session.sid, domain=domain, path=path, httponly=self.get_cookie_httponly(app),
+                        secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app)
+                    )
+                self.store.set(self._key(session.sid), dict(session), expires_at)
+                self.writes += 1
+            elif session.expires_at - self.ttl + self.renew_interval <= now:
+                # Last renewed over renew_interval ago: slide the expiry (with any cached state)
+                if session.stale:
+                    self.store.set(self._key(session.sid), dict(session), expires_at)
+                    self.writes += 1
+                else:
+                    self.store.touch(self._key(session.sid), expires_at)
+                self.renewals += 1
+        except Exception as e:
+            self.errors += 1
+            print(f"Session store error: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "store": type(self.store).__name__,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "expired": self.expired,
+            "writes": self.writes,
+            "renewals": self.renewals,
+            "deletes": self.deletes,
+            "errors": self.errors,
+        }
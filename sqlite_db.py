@@ -0,0 +1,193 @@
+"""Shared SQLite database for the ``sqlite`` storage backend.
+
+Every SQLite store (users, memes, likes, comments, browse, activity,
+counters) keeps its tables in one file and goes through one
+``SQLiteDatabase``, so a like and the meme's count, or a comment and its
+``comment_count``, commit in the same transaction. Images stay out of the
+database, as files in the ``LocalImageStore`` directory.
+
+The file is in WAL mode, so several gunicorn workers can share it: readers
+see a consistent snapshot without blocking, and writers take turns. Each
+worker keeps a small pool of connections, and each connection caches its
+prepared statements (``cached_statements``), so the stores use fixed SQL
+strings with ``?`` parameters, including ``json_each(?)`` for id lists.
+
+The ``memes`` table is defined here too, since the likes, comments and
+browse stores update its count and browse columns in their transactions.
+
+The connection runs in autocommit mode; ``transaction()`` wraps a block in
+``BEGIN IMMEDIATE`` ... ``COMMIT`` (rolled back if the block raises).
+"""
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Columns the stores query or update in place; everything else about a meme
+# (title, tags, labels, variants, ...) is kept as JSON in ``data``
+MEME_COLUMNS = ("meme_id", "user", "created_at", "status", "category", "image_key",
+                "likes", "views", "downloads", "comment_count", "browse_category")
+MEME_COUNT_COLUMNS = ("likes", "views", "downloads", "comment_count")
+
+MEMES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS memes (
+    meme_id TEXT PRIMARY KEY,
+    user TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    status TEXT NOT NULL,
+    category TEXT,
+    image_key TEXT,
+    likes INTEGER NOT NULL DEFAULT 0,
+    views INTEGER NOT NULL DEFAULT 0,
+    downloads INTEGER NOT NULL DEFAULT 0,
+    comment_count INTEGER NOT NULL DEFAULT 0,
+    browse_category TEXT,
+    data TEXT NOT NULL DEFAULT '{}'
+);
+-- Dashboard feed: WHERE user = ? ORDER BY created_at DESC, meme_id DESC
+CREATE INDEX IF NOT EXISTS memes_by_user ON memes (user, created_at, meme_id);
+-- Category browse pages; only approved (indexed) memes have browse_category
+CREATE INDEX IF NOT EXISTS memes_by_category ON memes (browse_category, created_at, meme_id)
+    WHERE browse_category IS NOT NULL;
+-- Approved-only scans (search index warm-up), optionally since a time
+CREATE INDEX IF NOT EXISTS memes_by_status ON memes (status, created_at);
+-- image_in_use() before deleting a shared image file, image_memes() before serving one
+CREATE INDEX IF NOT EXISTS memes_by_image ON memes (image_key);
+"""
+
+
+def meme_from_row(row) -> dict:
+    item = json.loads(row["data"] or "{}")
+    for column in MEME_COLUMNS:
+        if row[column] is not None:
+            item[column] = row[column]
+    return item
+
+
+def meme_row(item: dict) -> tuple:
+    columns = [item.get(c, 0 if c in MEME_COUNT_COLUMNS else None) for c in MEME_COLUMNS]
+    data = {k: v for k, v in item.items() if k not in MEME_COLUMNS}
+    return tuple(columns) + (json.dumps(data),)
+
+
+class SQLiteDatabase:
+    """A per-process pool of SQLite connections to one WAL-mode database file.
+
+    Each request thread borrows its own connection, so reads run in
+    parallel (WAL readers never block on the writer) and only writes queue,
+    on SQLite's file lock, with ``busy_timeout`` to wait for it. The pool is
+    dropped and rebuilt after a fork, like ``jobs.JobWorkerPool``: a
+    connection must not be used in two processes.
+    """
+
+    def __init__(self, path: str, pool_size: int = 8, busy_timeout: float = 5.0, cached_statements: int = 256):
+        self.path = path
+        self.pool_size = max(1, int(pool_size))
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.opened = 0
+        # WAL is a property of the file: set once, every later connection gets it
+        with self.connection() as conn:
+            mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+            if mode.lower() != "wal" and path != ":memory:":
+                print(f"SQLite journal mode for {path} is {mode}, not WAL")
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            isolation_level=None,
+            check_same_thread=False,  # connections move between threads through the pool
+            cached_statements=self.cached_statements
+        )
+        conn.row_factory = sqlite3.Row
+        # With WAL, NORMAL only syncs at checkpoints: a power cut can lose the
+        # last commits but never corrupts the file
+        conn.execute("PRAGMA synchronous=NORMAL")
+        self.opened += 1
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled connection for the block."""
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked: the parent's connections stay with the parent
+                self._idle = []
+                self._pid = os.getpid()
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            with self._lock:
+                if self._pid == os.getpid() and len(self._idle) < self.pool_size:
+                    self._idle.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+
+    def ensure_schema(self, sql: str):
+        """Run ``CREATE ... IF NOT EXISTS`` statements (one store's schema)."""
+        with self.connection() as conn:
+            conn.executescript(sql)
+
+    def query(self, sql: str, params=()) -> list:
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def query_one(self, sql: str, params=()):
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchone()
+
+    def execute(self, sql: str, params=()) -> int:
+        """Run one statement outside a transaction. Returns the rows changed."""
+        with self.connection() as conn:
+            return conn.execute(sql, params).rowcount
+
+    @contextmanager
+    def transaction(self):
+        """``with db.transaction() as conn:`` runs the block's statements atomically.
+
+        ``BEGIN IMMEDIATE`` takes the write lock up front, so two workers'
+        read-modify-write blocks queue instead of failing at COMMIT.
+        """
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def stats(self) -> dict:
+        return {"path": self.path, "idle": len(self._idle), "opened": self.opened, "pool_size": self.pool_size}
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            try:
+                conn.execute("PRAGMA optimize")
+            except sqlite3.Error:
+                pass
+            conn.close()
+
+
+def json_ids(ids) -> str:
+    """One parameter for ``IN (SELECT value FROM json_each(?))``.
+
+    Keeps ``IN`` lookups a single cached statement whatever the number of
+    ids, instead of a new statement per ``?,?,...`` length.
+    """
+    return json.dumps(list(ids))
+
+
+def placeholders(n: int) -> str:
+    return ",".join("?" * n)
@@ -0,0 +1,141 @@
+"""Responsive image variants.
+
+After a meme is approved, ``VariantGenerator`` renders a few smaller widths
+of the original in WebP and JPEG and stores them next to it
+(``variants/<sha256>/w640.webp``). Templates then get ``srcset`` strings, so
+feed cards download a variant sized for the screen instead of the full
+original.
+
+Resizing is CPU-bound, so it runs in a process pool (spawned, not forked,
+since the web workers are multi-threaded) and uses every core.
+"""
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+VARIANT_WIDTHS = (320, 640, 1080)
+VARIANT_FORMATS = ("webp", "jpeg")
+CONTENT_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+
+
+def variant_key(image_key: str, width: int, fmt: str) -> str:
+    """``memes/<sha256>.png`` -> ``variants/<sha256>/w640.webp``"""
+    base = os.path.splitext(os.path.basename(image_key))[0]
+    return f"variants/{base}/w{width}.{EXTENSIONS[fmt]}"
+
+
+def render_variants(image_bytes: bytes, widths=VARIANT_WIDTHS, formats=VARIANT_FORMATS, quality: int = 80):
+    """
+    Resize an image to each width narrower than the original and encode it
+    in each format. Returns [(width, format, bytes), ...]. Runs in a worker
+    process, so it only takes and returns picklable values.
+    """
+    rendered = []
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        img.load()
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        for width in sorted(widths):
+            if width >= img.width:
+                break
+            height = max(1, round(img.height * width / img.width))
+            resized = img.resize((width, height), Image.LANCZOS)
+            for fmt in formats:
+                out = io.BytesIO()
+                resized.save(out, fmt.upper(), quality=quality)
+                rendered.append((width, fmt, out.getvalue()))
+    return rendered
+
+
+def build_srcset(variants: list, url_fn, fmt: str) -> str:
+    """``url 320w, url 640w`` for the variants in ``fmt``."""
+    return ", ".join(
+        f"{url_fn(v['key'])} {v['width']}w"
+        for v in sorted(variants or [], key=lambda v: v["width"])
+        if v["format"] == fmt
+    )
+
+
+class VariantGenerator:
+    """Renders and stores variants using a lazily created process pool."""
+
+    def __init__(self, store, widths=VARIANT_WIDTHS, formats=VARIANT_FORMATS, processes: int = None):
+        self.store = store
+        self.widths = tuple(widths)
+        self.formats = tuple(formats)
+        self.processes = processes or os.cpu_count() or 1
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pid != os.getpid():
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.processes,
+                        mp_context=multiprocessing.get_context("spawn")
+                    )
+                    self._pid = os.getpid()
+        return self._pool
+
+    def _store(self, image_key: str, rendered: list) -> list:
+        variants = []
+        for width, fmt, data in rendered:
+            key = variant_key(image_key, width, fmt)
+            self.store.put(key, data, CONTENT_TYPES[fmt])
+            variants.append({"width": width, "format": fmt, "key": key})
+        return variants
+
+    def generate(self, image_key: str, image_bytes: bytes = None) -> list:
+        """Render and store the variants of one image. Returns their descriptors."""
+        data = image_bytes if image_bytes is not None else self.store.get(image_key)
+        if not data:
+            return []
+        try:
+            rendered = self._get_pool().submit(render_variants, data, self.widths, self.formats).result()
+        except Exception as e:
+            print(f"Variant generation error for {image_key}: {e}")
+            return []
+        return self._store(image_key, rendered)
+
+    def generate_many(self, image_keys: list) -> dict:
+        """Render variants for many images in parallel. Returns {image_key: variants}."""
+        pool = self._get_pool()
+        futures = {}
+        results = {}
+        for key in image_keys:
+            data = self.store.get(key)
+            if not data:
+                results[key] = []
+                continue
+            futures[key] = pool.submit(render_variants, data, self.widths, self.formats)
+            # Keep at most two images per process in flight to bound memory
+            if len(futures) >= self.processes * 2:
+                done_key = next(iter(futures))
+                results[done_key] = self._collect(done_key, futures.pop(done_key))
+        for key, future in futures.items():
+            results[key] = self._collect(key, future)
+        return results
+
+    def _collect(self, image_key: str, future) -> list:
+        try:
+            return self._store(image_key, future.result())
+        except Exception as e:
+            print(f"Variant generation error for {image_key}: {e}")
+            return []
+
+    def delete(self, variants: list):
+        for v in variants or []:
+            self.store.delete(v["key"])
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+        self._pool = None
+        self._pid = None
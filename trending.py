@@ -0,0 +1,201 @@
+"""Trending memes from time-decayed engagement scores.
+
+Every like, view, download and comment adds its weight to the meme's
+score, and scores decay exponentially with ``half_life`` seconds. Instead
+of decaying every score on every tick, an event at time ``t`` adds
+``weight * 2 ** ((t - t0) / half_life)`` to a stored value relative to a
+reference time ``t0``; the score *now* is the stored value times
+``2 ** (-(now - t0) / half_life)``. That factor is the same for every meme,
+so the order of stored values never changes as time passes and only the
+meme that got the event has to move.
+
+Stored values are kept in one sorted list for all memes and one per category,
+updated with ``bisect`` on each event, so the top K of a category is the
+first K entries. Every ``half_life`` the stored values are rescaled to a
+new ``t0`` (keeping them small) and memes whose score has decayed below
+``min_score`` are dropped, so memory follows recent activity rather than
+the size of the table.
+
+When a meme's score first reaches ``threshold``, ``on_trending(meme_id,
+category, score)`` is called (outside the lock), at most once per meme per
+``alert_cooldown`` seconds.
+
+The tracker only sees events recorded in this process and keeps nothing on
+disk, so each worker ranks its own traffic and starts empty. ``replay()``
+feeds it activity log lines, so rankings and alerts can be checked offline
+with ``scripts/replay_trending.py``.
+"""
+import bisect
+import json
+import threading
+import time
+from datetime import datetime, timezone
+
+# Relative value of each kind of engagement; events not listed are ignored
+EVENT_WEIGHTS = {
+    "view": 1.0,
+    "download": 2.0,
+    "like": 3.0,
+    "unlike": -3.0,
+    "comment": 4.0
+}
+
+
+class TrendingTracker:
+    """Decayed per-meme scores with top-K per category."""
+
+    def __init__(self, half_life: float = 6 * 3600, weights: dict = None, threshold: float = None,
+                 on_trending=None, alert_cooldown: float = 24 * 3600, min_score: float = 0.05):
+        self.half_life = float(half_life)
+        self.weights = dict(EVENT_WEIGHTS if weights is None else weights)
+        self.threshold = threshold
+        self.on_trending = on_trending
+        self.alert_cooldown = alert_cooldown
+        self.min_score = min_score
+        self._t0 = None
+        self._stored = {}  # {meme_id: score relative to t0}
+        self._category = {}  # {meme_id: category}
+        self._all = []  # [(-stored, meme_id)] ascending, i.e. best first
+        self._by_category = {}  # {category: [(-stored, meme_id)]}
+        self._alerted = {}  # {meme_id: time of last alert}
+        self._events = 0
+        self._alerts = 0
+        self._lock = threading.Lock()
+
+    def _factor(self, ts: float) -> float:
+        return 2.0 ** ((ts - self._t0) / self.half_life)
+
+    def record(self, meme_id: str, event: str, category: str = None, ts: float = None) -> float:
+        """Count one event. Returns the meme's current score (0.0 for ignored events)."""
+        weight = self.weights.get(event)
+        if not weight or not meme_id:
+            return 0.0
+        ts = time.time() if ts is None else ts
+        alert = None
+        with self._lock:
+            if self._t0 is None:
+                self._t0 = ts
+            elif ts - self._t0 >= self.half_life:
+                self._rebase(ts)
+            old = self._stored.get(meme_id)
+            new = max(0.0, (old or 0.0) + weight * self._factor(ts))
+            old_category = self._category.get(meme_id)
+            new_category = category or old_category
+            if old is not None:
+                self._unrank(meme_id, old, old_category)
+            self._stored[meme_id] = new
+            self._category[meme_id] = new_category
+            self._rank(meme_id, new, new_category)
+            self._events += 1
+
+            score = new / self._factor(ts)
+            if self.threshold is not None and weight > 0 and score >= self.threshold:
+                last = self._alerted.get(meme_id)
+                if last is None or ts - last >= self.alert_cooldown:
+                    self._alerted[meme_id] = ts
+                    self._alerts += 1
+                    alert = (meme_id, new_category, score)
+        if alert and self.on_trending is not None:
+            try:
+                self.on_trending(*alert)
+            except Exception as e:
+                print(f"Trending alert error: {e}")
+        return score
+
+    def _rank(self, meme_id: str, stored: float, category: str):
+        bisect.insort(self._all, (-stored, meme_id))
+        if category:
+            bisect.insort(self._by_category.setdefault(category, []), (-stored, meme_id))
+
+    def _unrank(self, meme_id: str, stored: float, category: str):
+        for ranked in (self._all, self._by_category.get(category) if category else None):
+            if not ranked:
+                continue
+            i = bisect.bisect_left(ranked, (-stored, meme_id))
+            if i < len(ranked) and ranked[i][1] == meme_id:
+                ranked.pop(i)
+        if category and not self._by_category.get(category, True):
+            del self._by_category[category]
+
+    def _rebase(self, ts: float):
+        """Move t0 to ``ts``, rescale stored values and drop memes below min_score."""
+        scale = 1.0 / self._factor(ts)
+        self._t0 = ts
+        def rescale(ranked):
+            return [(key * scale, meme_id) for key, meme_id in ranked if -key * scale >= self.min_score]
+
+        self._all = rescale(self._all)
+        self._by_category = {c: kept for c, kept in ((c, rescale(r)) for c, r in self._by_category.items()) if kept}
+        self._stored = {meme_id: -key for key, meme_id in self._all}
+        for meme_id in [m for m in self._category if m not in self._stored]:
+            del self._category[meme_id]
+        for meme_id in [m for m, at in self._alerted.items() if ts - at >= self.alert_cooldown]:
+            del self._alerted[meme_id]
+
+    def remove(self, meme_id: str):
+        with self._lock:
+            stored = self._stored.pop(meme_id, None)
+            if stored is not None:
+                self._unrank(meme_id, stored, self._category.get(meme_id))
+            self._category.pop(meme_id, None)
+            self._alerted.pop(meme_id, None)
+
+    def top(self, k: int = 20, category: str = None, offset: int = 0, ts: float = None) -> list:
+        """[(score, meme_id)] best first for ``category`` (default: all memes)."""
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            ranked = self._by_category.get(category, []) if category else self._all
+            if not ranked:
+                return []
+            scale = 1.0 / self._factor(ts)
+            return [(-key * scale, meme_id) for key, meme_id in ranked[offset:offset + k]]
+
+    def score(self, meme_id: str, ts: float = None) -> float:
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            stored = self._stored.get(meme_id)
+            return stored / self._factor(ts) if stored is not None else 0.0
+
+    def categories(self) -> list:
+        """Categories with at least one scored meme, largest first."""
+        with self._lock:
+            sizes = [(-len(ranked), category) for category, ranked in self._by_category.items()]
+        return [category for _, category in sorted(sizes)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"tracked": len(self._stored), "events": self._events, "alerts": self._alerts}
+
+
+def parse_ts(ts: str) -> float:
+    """Epoch seconds for an activity log ``ts`` (naive ISO in UTC, as now_iso() writes)."""
+    return datetime.fromisoformat(ts).replace(tzinfo=timezone.utc).timestamp()
+
+
+def replay(tracker: TrendingTracker, lines) -> int:
+    """
+    Feed activity log JSON lines (``{ts, action, user, meta}``) to ``tracker``
+    in the order given; deletes drop the meme. Returns the number of events
+    it counted.
+    """
+    counted = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            entry = json.loads(line)
+            meta = entry.get("meta") or {}
+            if isinstance(meta, str):
+                meta = json.loads(meta)
+            ts = parse_ts(entry["ts"])
+        except (ValueError, KeyError, TypeError):
+            continue
+        if not meta.get("meme_id"):
+            continue
+        if entry.get("action") == "delete":
+            tracker.remove(meta["meme_id"])
+        elif entry.get("action") in tracker.weights:
+            tracker.record(meta["meme_id"], entry["action"], meta.get("category"), ts=ts)
+            counted += 1
+    return counted